@@ -1,7 +1,6 @@
 import os
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from engineRegistry import get_session_factory
 from load_dotenv import load_dotenv
 
 load_dotenv()
@@ -9,7 +8,7 @@ load_dotenv()
 class connection:
     def callSession(self):
         DATABASE_URL = os.getenv('LOCAL_DATABASE_URL')  # Update with your database URL
-        engine = create_engine(DATABASE_URL)
-        Session = sessionmaker(bind=engine)
+        # The engine and its pool are created once per URL and reused by every session
+        Session = get_session_factory(DATABASE_URL)
         return Session()
 
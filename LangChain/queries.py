@@ -1,7 +1,23 @@
 import pandas as pd
+from datetime import date
+from sqlalchemy import inspect, text
+from queryStream import iter_query_chunks
 
 
 class dbQueries:
+    def stream_query(self, session, query, chunk_size=50000):
+        # Yields the result of query in DataFrame chunks instead of loading it at once with read_sql
+        return iter_query_chunks(session, query, chunk_size=chunk_size)
+
+    def sales_source(self, session, rollup_name):
+        # Rollup tables are created by Model.create_tables and filled by the ETL (salesRollups.py); while
+        # one is missing or still empty, the same sums are read from aggregate_sales
+        if not inspect(session.bind).has_table(rollup_name):
+            return 'aggregate_sales'
+        if session.execute(text(f"SELECT 1 FROM {rollup_name} LIMIT 1")).first() is None:
+            return 'aggregate_sales'
+        return rollup_name
+
     def get_sales_summary_by_family(self, session):
         query = """
         SELECT family_name, SUM("SalesSum2013") AS Sales2013, SUM("SalesSum2014") AS Sales2014,
@@ -25,9 +41,10 @@ class dbQueries:
         return df
 
     def get_sales_trends(self, session):
-        query = """
+        # Daily totals are kept in a rollup by the ETL (one row per date, so the SUM is a no-op there)
+        query = f"""
         SELECT date, SUM(sale_amount) AS total_sales
-        FROM aggregate_sales
+        FROM {self.sales_source(session, 'rollup_sales_daily_total')}
         GROUP BY date
         ORDER BY date
         """
@@ -74,6 +91,7 @@ class dbQueries:
         store = self.handle_none(store)
         isSum = self.handle_none(isSum)
 
+        # Sums are read from the smallest sales rollup that has the filtered columns (salesRollups.py)
         if isSum:
             if year:
                 if not day and not month:
@@ -91,16 +109,23 @@ class dbQueries:
 
                     if store and product_type:
                         query = f"""
-                            SELECT SUM(sale_amount) FROM aggregate_sales 
+                            SELECT SUM(sale_amount) FROM {self.sales_source(session, 'rollup_sales_monthly')} 
                             WHERE store_nbr = {store} AND year = {year} AND family_id = {product_type}
                         """
                         df = pd.read_sql(query, session.bind)
                         return df
 
+                # The daily rollup has no day column; the date is checked here, so e.g. February 30th
+                # gives no result rather than a database error
+                try:
+                    sale_date = date(int(year), int(month), int(day)) if day and month else None
+                except ValueError:
+                    return None
+
                 if day and month and product_type:
                     query = f"""
-                        SELECT SUM(sale_amount) FROM aggregate_sales 
-                        WHERE day = {day} AND month = {month} AND year = {year} AND family_id = {product_type}
+                        SELECT SUM(sale_amount) FROM {self.sales_source(session, 'rollup_sales_daily')} 
+                        WHERE date = '{sale_date.isoformat()}' AND family_id = {product_type}
                     """
 
                     if store:
@@ -110,14 +135,14 @@ class dbQueries:
                     return df
                 else:
                     if day and month and not product_type:
-                        query = f"""SELECT SUM(sale_amount) FROM aggregate_sales WHERE
-                                day = {day} AND month = {month} AND year = {year} AND store_nbr = {store}"""
+                        query = f"""SELECT SUM(sale_amount) FROM {self.sales_source(session, 'rollup_sales_daily')} WHERE
+                                date = '{sale_date.isoformat()}' AND store_nbr = {store}"""
                         df = pd.read_sql(query, session.bind)
                         return df
             else:
                 if product_type:
                     if not day and not year and not month:
-                        query = f"""SELECT SUM(sale_amount) FROM aggregate_sales WHERE
+                        query = f"""SELECT SUM(sale_amount) FROM {self.sales_source(session, 'rollup_sales_year_family')} WHERE
                                                        family_id = {product_type}"""
                         df = pd.read_sql(query, session.bind)
                         return df
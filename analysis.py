@@ -13,6 +13,7 @@ from sklearn.neural_network import MLPRegressor
 from sklearn.metrics import mean_squared_error
 from sqlalchemy.dialects.postgresql import insert as pg_insert
 from models import Model
+from queryCache import bump_load_versions
 
 
 load_dotenv()
@@ -21,18 +22,26 @@ load_dotenv()
 class Analysis:
     def __init__(self, db_manager):
         self.db_manager = db_manager
-        self.model = Model(db_manager.engine)
+        # Shares the metadata DatabaseManager already reflected (or loaded from the schema cache)
+        self.model = Model(db_manager.engine, metadata=db_manager.metadata)
         self.connection = self.db_manager.engine.connect()
         self.metadata = self.db_manager.metadata
 
-        # Load aggregate_sales table
-        self.aggregate_sales = Table(
-            'aggregate_sales', self.metadata,
-            autoload=True, autoload_with=self.db_manager.engine
-        )
+        self.aggregate_sales = self.model.aggregate_sales
         self.summary_sales = pd.DataFrame()
 
 
+    def _rollup(self, table_name):
+        # Rollup tables are created by Model.create_tables and filled by the ETL (when a load writes sales
+        # rows); while one is missing or still empty, the same sums are computed from aggregate_sales
+        rollup = getattr(self.model, table_name)
+        if rollup is None:
+            return self.aggregate_sales
+        with self.db_manager.engine.connect() as connection:
+            if connection.execute(select(rollup).limit(1)).first() is None:
+                return self.aggregate_sales
+        return rollup
+
     def query_aggregate_sales_data(self):
         subqueries = []
         for year in [2013, 2014, 2015, 2016, 2017]:
@@ -55,47 +64,47 @@ class Analysis:
         # Combine subqueries with union_all
         query = union_all(*subqueries)
 
-        # Execute the query
-        result = self.connection.execute(query)
-
-        # Fetch the results into a DataFrame
-        sales_data = pd.DataFrame(result.fetchall(), columns=result.keys())
+        # Up to 100k wide rows: fetched through COPY ... TO STDOUT into a typed DataFrame, and reused from
+        # the query cache until the ETL loads aggregate_sales again
+        sales_data = self.db_manager.cached_query(query)
         return sales_data
 
     def query_sales_by_store_and_year(self):
+        # Yearly totals per store, from the year x store rollup the ETL maintains
+        sales = self._rollup('rollup_sales_year_store')
         query = select(
-            self.aggregate_sales.c.store_nbr,
+            sales.c.store_nbr,
             func.sum(
                 case(
-                    (self.aggregate_sales.c.year == 2013, self.aggregate_sales.c.sale_amount),
+                    (sales.c.year == 2013, sales.c.sale_amount),
                     else_=0
                 )
             ).label('SalesSum2013'),
             func.sum(
                 case(
-                    (self.aggregate_sales.c.year == 2014, self.aggregate_sales.c.sale_amount),
+                    (sales.c.year == 2014, sales.c.sale_amount),
                     else_=0
                 )
             ).label('SalesSum2014'),
             func.sum(
                 case(
-                    (self.aggregate_sales.c.year == 2015, self.aggregate_sales.c.sale_amount),
+                    (sales.c.year == 2015, sales.c.sale_amount),
                     else_=0
                 )
             ).label('SalesSum2015'),
             func.sum(
                 case(
-                    (self.aggregate_sales.c.year == 2016, self.aggregate_sales.c.sale_amount),
+                    (sales.c.year == 2016, sales.c.sale_amount),
                     else_=0
                 )
             ).label('SalesSum2016'),
             func.sum(
                 case(
-                    (self.aggregate_sales.c.year == 2017, self.aggregate_sales.c.sale_amount),
+                    (sales.c.year == 2017, sales.c.sale_amount),
                     else_=0
                 )
             ).label('SalesSum2017')
-        ).group_by(self.aggregate_sales.c.store_nbr)
+        ).group_by(sales.c.store_nbr)
 
         # Execute the query
         result = self.connection.execute(query)
@@ -266,9 +275,10 @@ class Analysis:
         predictions_df.to_csv('predictions_2018_by_store.csv', index=False)
         print("Predictions saved to 'predictions_2018_by_store.csv'")
 
+        # One transaction for the rows and the version bump, so cached reads never see new rows under the old version
+        self.connection.commit()
+        transaction = self.connection.begin()
         for _, row in predictions_df.iterrows():
-            self.connection.commit()
-            transaction = self.connection.begin()
             insert_stmt = insert(self.model.summary_store_sales).values(
                 store_nbr=row['store_nbr'],
                 SalesSum2013=row['SalesSum2013'],
@@ -279,26 +289,29 @@ class Analysis:
                 SalesSum2018=row['SalesSum2018']
             )
             self.connection.execute(insert_stmt)
-            transaction.commit()
+        if not predictions_df.empty:
+            bump_load_versions(self.connection, self.model.etl_load_version, ['summary_store_sales'])
+        transaction.commit()
 
         return predictions_df
 
     def get_sales_summary_with_predictions(self):
-        # Query data from database
+        # Query data from database: yearly totals per family, from the year x family rollup
+        sales = self._rollup('rollup_sales_year_family')
         query = select(
-            self.aggregate_sales.c.family_id,
-            self.aggregate_sales.c.family_name,
-            func.sum(case((self.aggregate_sales.c.year == 2013, self.aggregate_sales.c.sale_amount), else_=0)).label(
+            sales.c.family_id,
+            sales.c.family_name,
+            func.sum(case((sales.c.year == 2013, sales.c.sale_amount), else_=0)).label(
                 'SalesSum2013'),
-            func.sum(case((self.aggregate_sales.c.year == 2014, self.aggregate_sales.c.sale_amount), else_=0)).label(
+            func.sum(case((sales.c.year == 2014, sales.c.sale_amount), else_=0)).label(
                 'SalesSum2014'),
-            func.sum(case((self.aggregate_sales.c.year == 2015, self.aggregate_sales.c.sale_amount), else_=0)).label(
+            func.sum(case((sales.c.year == 2015, sales.c.sale_amount), else_=0)).label(
                 'SalesSum2015'),
-            func.sum(case((self.aggregate_sales.c.year == 2016, self.aggregate_sales.c.sale_amount), else_=0)).label(
+            func.sum(case((sales.c.year == 2016, sales.c.sale_amount), else_=0)).label(
                 'SalesSum2016'),
-            func.sum(case((self.aggregate_sales.c.year == 2017, self.aggregate_sales.c.sale_amount), else_=0)).label(
+            func.sum(case((sales.c.year == 2017, sales.c.sale_amount), else_=0)).label(
                 'SalesSum2017')
-        ).group_by(self.aggregate_sales.c.family_id, self.aggregate_sales.c.family_name)
+        ).group_by(sales.c.family_id, sales.c.family_name)
 
         # Execute the query
         result = self.connection.execute(query)
@@ -320,6 +333,7 @@ class Analysis:
             insert_stmt = pg_insert(self.model.summary_family_sales).values(data_to_insert)
             on_conflict_stmt = insert_stmt.on_conflict_do_nothing()
             self.connection.execute(on_conflict_stmt)
+            bump_load_versions(self.connection, self.model.etl_load_version, ['summary_family_sales'])
             transaction.commit()
 
             print("\nData Successfully stored into Sales Summary\n")
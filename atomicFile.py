@@ -0,0 +1,48 @@
+import json
+import os
+import pickle
+import uuid
+
+# Files read by other threads and processes (the schema, query and staging caches, Parquet exports and
+# their manifests) are written under a unique temporary name in the target's directory and renamed over
+# the target, so readers see either the old file or the new one, never a partial one, and concurrent
+# writers do not write into each other's file.
+
+
+def temporary_path(path):
+    # Hidden, so directory listings that match cache file names skip files still being written
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f'.{name}.{uuid.uuid4().hex}.tmp')
+
+
+def atomic_write(path, writer):
+    # writer(temporary_path) writes the whole file; returns what writer returns
+    temporary = temporary_path(path)
+    try:
+        result = writer(temporary)
+        os.replace(temporary, path)
+    except BaseException:
+        discard(temporary)
+        raise
+    return result
+
+
+def write_pickle(path, value):
+    def write(temporary):
+        with open(temporary, 'wb') as pickle_file:
+            pickle.dump(value, pickle_file, protocol=pickle.HIGHEST_PROTOCOL)
+    atomic_write(path, write)
+
+
+def write_json(path, value):
+    def write(temporary):
+        with open(temporary, 'w') as json_file:
+            json.dump(value, json_file, indent=2)
+    atomic_write(path, write)
+
+
+def discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
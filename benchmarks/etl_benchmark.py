@@ -0,0 +1,316 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_mock_engine, make_url
+from sqlalchemy.dialects import postgresql
+
+from generate_data import generate
+from etlMetrics import ETLMetrics, peak_rss
+
+# End-to-end ETL benchmark on synthetic Favorita-shaped data: ETL.load_data + ETL.load_to_db, reporting
+# throughput, peak memory and time per table. Runs against a throwaway PostgreSQL cluster when initdb and
+# pg_ctl are on PATH, otherwise against a stand-in that runs every transform and serialises every write
+# but discards the statements (so the database's own time is not measured).
+#
+#   python benchmarks/etl_benchmark.py --scale 1 --days 30 --check
+#   python benchmarks/etl_benchmark.py --scale 1 10 --days 30 --backend postgres --update-baselines
+#
+# Each scale and load mode runs in its own process, so peak RSS is per run. Absolute throughput depends
+# on the machine, so --check compares the speed-up of each load mode over insert, measured in the same
+# run, against baselines.json, and exits with status 1 when a speed-up drops or peak memory grows by
+# more than --tolerance.
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINES_PATH = os.path.join(BENCHMARK_DIR, 'baselines.json')
+DATA_ROOT = os.path.join(tempfile.gettempdir(), 'etl-benchmark-data')
+LOAD_MODES = ['insert', 'copy']
+
+
+class NullResult:
+    rowcount = 0
+
+    def all(self):
+        return []
+
+    def one(self):
+        return None, None
+
+    def mappings(self):
+        return self
+
+    def scalar(self):
+        return None
+
+
+class NullCursor:
+    def execute(self, *args):
+        pass
+
+    def copy_expert(self, sql, buffer):
+        buffer.read()
+
+    def fetchone(self):
+        # Merge counts: inserted, updated, staged
+        return 0, 0, 0
+
+    def close(self):
+        pass
+
+
+class NullConnection:
+    # Accepts what the ETL sends and discards it; SQLAlchemy statements are still compiled
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self.connection = SimpleNamespace(cursor=NullCursor)
+
+    def execute(self, statement, *args, **kwargs):
+        statement.compile(dialect=self.dialect)
+        return NullResult()
+
+    def exec_driver_sql(self, statement, params=None):
+        return NullResult()
+
+    def begin(self):
+        return self
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def in_transaction(self):
+        return False
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class NullEngine:
+    def __init__(self):
+        self.dialect = postgresql.psycopg2.dialect()
+        self.url = make_url('postgresql+psycopg2://standin@localhost/standin')
+
+    def connect(self):
+        return NullConnection(self.dialect)
+
+    def begin(self):
+        return NullConnection(self.dialect)
+
+
+def standin_etl(data_dir, metrics):
+    from etl import ETL
+    from models import Model
+
+    etl = ETL(None, data_dir=data_dir, metrics=metrics)
+    etl.db_manager = SimpleNamespace(engine=NullEngine())
+    # Table definitions come from create_tables on a mock engine, with nothing to reflect
+    with contextlib.redirect_stdout(io.StringIO()):
+        etl.model = Model(create_mock_engine('postgresql+psycopg2://', lambda *args, **kwargs: None), reflect=False)
+        etl.model.create_tables()
+    # dim_date is diffed against the table; the stand-in table is always empty
+    etl._dates_to_write = lambda connection, dim_date: dim_date
+    return etl
+
+
+@contextlib.contextmanager
+def throwaway_postgres():
+    # A private cluster in a temporary directory, on a free local port, removed afterwards
+    from connectDb import DatabaseManager
+
+    cluster_dir = tempfile.mkdtemp(prefix='etl-benchmark-pg-')
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+
+    try:
+        subprocess.run(['initdb', '-D', cluster_dir, '-U', 'bench', '-A', 'trust'], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        subprocess.run(['pg_ctl', '-D', cluster_dir, '-w', '-l', os.path.join(cluster_dir, 'server.log'),
+                        '-o', f"-p {port} -k {cluster_dir} -c listen_addresses=127.0.0.1 -c fsync=off", 'start'],
+                       check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield DatabaseManager('bench', '', f'127.0.0.1:{port}', 'postgres')
+        finally:
+            subprocess.run(['pg_ctl', '-D', cluster_dir, '-m', 'fast', 'stop'], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(cluster_dir, ignore_errors=True)
+
+
+def postgres_available():
+    return shutil.which('initdb') is not None and shutil.which('pg_ctl') is not None
+
+
+def data_dir_for(scale, days):
+    data_dir = os.path.join(DATA_ROOT, f'{scale}x_{days or "all"}d')
+    if not os.path.exists(os.path.join(data_dir, 'sales.csv')):
+        print(f"Generating {scale}x data in {data_dir} ...")
+        generate(data_dir, scale=scale, days=days)
+    return data_dir
+
+
+def run_once(scale, days, backend, load_mode, chunk_size, load_options):
+    # One benchmark run in this process; returns the result record
+    data_dir = data_dir_for(scale, days)
+    metrics = ETLMetrics()
+    modes = {'fact_sales': load_mode, 'aggregate_sales': load_mode}
+
+    postgres = throwaway_postgres() if backend == 'postgres' else contextlib.nullcontext()
+    with postgres as db_manager:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            if db_manager is None:
+                etl = standin_etl(data_dir, metrics)
+            else:
+                from etl import ETL
+                etl = ETL(db_manager, data_dir=data_dir, metrics=metrics)
+                etl.model.create_tables()
+            etl.load_data(**load_options.get('load_data', {}))
+            etl.load_to_db(chunk_size=chunk_size, load_modes=modes, **load_options.get('load_to_db', {}))
+        wall = time.perf_counter() - started
+
+    summary = metrics.summary()
+    rows = summary['read_sales.csv']['rows'] if 'read_sales.csv' in summary else \
+        summary.get('read_sales.csv_chunk', {}).get('rows', 0)
+    return {
+        'rows': rows,
+        'wall_s': round(wall, 3),
+        'rows_per_sec': round(rows / wall, 1),
+        'peak_rss_mb': round(peak_rss() / 2 ** 20, 1) if peak_rss() else None,
+        'tables': {stage[len('write_'):]: round(total['wall_s'], 3)
+                   for stage, total in summary.items() if stage.startswith('write_')},
+        'stages': {stage: round(total['wall_s'], 3) for stage, total in summary.items()
+                   if stage.startswith(('read_', 'load_', 'merge_'))}
+    }
+
+
+def run_isolated(scale, load_mode, args):
+    # Runs one scale and load mode in a fresh interpreter and reads its JSON result from the last output line
+    command = [sys.executable, os.path.abspath(__file__), '--single', '--scale', str(scale),
+               '--backend', args.backend, '--load-mode', load_mode, '--chunk-size', str(args.chunk_size),
+               '--options', json.dumps(args.options)]
+    if args.days:
+        command += ['--days', str(args.days)]
+    completed = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True)
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def baseline_key(backend, scale, days, options):
+    key = f'{backend}/{scale}x/{days or "all"}d'
+    return f'{key}/{json.dumps(options, sort_keys=True)}' if options else key
+
+
+def speedups(results):
+    # Throughput of each load mode relative to insert on the same machine and run
+    if 'insert' not in results:
+        return {}
+    return {mode: round(result['rows_per_sec'] / results['insert']['rows_per_sec'], 2)
+            for mode, result in results.items() if mode != 'insert'}
+
+
+def check_regressions(key, results, baseline, tolerance):
+    problems = []
+    for mode, speedup in speedups(results).items():
+        baseline_speedup = baseline.get('speedups', {}).get(mode)
+        if baseline_speedup and speedup < baseline_speedup * (1 - tolerance):
+            problems.append(f"{mode} is {speedup}x insert vs baseline {baseline_speedup}x")
+    for mode, result in results.items():
+        baseline_rss = baseline.get('results', {}).get(mode, {}).get('peak_rss_mb')
+        if result['peak_rss_mb'] and baseline_rss and result['peak_rss_mb'] > baseline_rss * (1 + tolerance):
+            problems.append(f"{mode} peak memory {result['peak_rss_mb']} MB vs baseline {baseline_rss} MB")
+    return [f'{key}: {problem}' for problem in problems]
+
+
+def print_result(key, result):
+    print(f"\n{key}: {result['rows']} rows in {result['wall_s']}s "
+          f"({result['rows_per_sec']:,.0f} rows/sec), peak RSS {result['peak_rss_mb']} MB")
+    for table, seconds in sorted(result['tables'].items(), key=lambda item: -item[1]):
+        print(f"    {table:<22} {seconds:>9.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end ETL benchmark on synthetic data.')
+    parser.add_argument('--scale', type=int, nargs='+', default=[1])
+    parser.add_argument('--days', type=int, default=None, help='limit the data to the first N days')
+    parser.add_argument('--backend', choices=['auto', 'postgres', 'standin'], default='auto')
+    parser.add_argument('--load-mode', nargs='+', choices=LOAD_MODES, default=LOAD_MODES,
+                        help='--check compares each mode with insert, so include insert')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--options', type=json.loads, default={},
+                        help='extra ETL options, e.g. \'{"load_to_db": {"lookup_mode": "array"}}\'')
+    parser.add_argument('--check', action='store_true', help='fail if results regress against baselines.json')
+    parser.add_argument('--update-baselines', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--single', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.backend == 'auto':
+        args.backend = 'postgres' if postgres_available() else 'standin'
+    if args.backend == 'postgres' and not postgres_available():
+        parser.error('initdb/pg_ctl not found on PATH')
+    if args.backend == 'standin' and 'copy' in args.load_mode:
+        print("Note: the stand-in backend discards COPY data after serialising it.")
+
+    if args.single:
+        result = run_once(args.scale[0], args.days, args.backend, args.load_mode[0], args.chunk_size, args.options)
+        print(json.dumps(result))
+        return
+
+    baselines = {}
+    if os.path.exists(BASELINES_PATH):
+        with open(BASELINES_PATH) as baselines_file:
+            baselines = json.load(baselines_file)
+
+    problems = []
+    for scale in args.scale:
+        key = baseline_key(args.backend, scale, args.days, args.options)
+        results = {}
+        for load_mode in args.load_mode:
+            results[load_mode] = run_isolated(scale, load_mode, args)
+            print_result(f'{key}/{load_mode}', results[load_mode])
+        for mode, speedup in speedups(results).items():
+            print(f"\n{key}: {mode} is {speedup}x insert")
+
+        if args.check:
+            if key in baselines:
+                problems += check_regressions(key, results, baselines[key], args.tolerance)
+            else:
+                print(f"    no baseline for {key}")
+        if args.update_baselines:
+            baseline = baselines.setdefault(key, {'speedups': {}, 'results': {}})
+            baseline['speedups'].update(speedups(results))
+            baseline['results'].update(results)
+
+    if args.update_baselines:
+        with open(BASELINES_PATH, 'w') as baselines_file:
+            json.dump(dict(sorted(baselines.items())), baselines_file, indent=2)
+            baselines_file.write('\n')
+        print(f"\nBaselines written to {BASELINES_PATH}")
+
+    if problems:
+        print("\nRegressions:")
+        for problem in problems:
+            print(f"    {problem}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
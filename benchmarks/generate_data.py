@@ -0,0 +1,139 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Synthetic Favorita-shaped input files for the ETL benchmarks. At scale 1 the cardinalities match the
+# real data set (54 stores in 22 cities and 16 states, 33 product families, one sales row per
+# store/family/day from 2013-01-01 to 2017-08-15, about 3M rows); each scale step multiplies the stores,
+# cities and states, so scale 10 is about 30M sales rows and scale 100 about 300M.
+
+FAMILIES = [
+    'AUTOMOTIVE', 'BABY CARE', 'BEAUTY', 'BEVERAGES', 'BOOKS', 'BREAD/BAKERY', 'CELEBRATION', 'CLEANING',
+    'DAIRY', 'DELI', 'EGGS', 'FROZEN FOODS', 'GROCERY I', 'GROCERY II', 'HARDWARE', 'HOME AND KITCHEN I',
+    'HOME AND KITCHEN II', 'HOME APPLIANCES', 'HOME CARE', 'LADIESWEAR', 'LAWN AND GARDEN', 'LINGERIE',
+    'LIQUOR,WINE,BEER', 'MAGAZINES', 'MEATS', 'PERSONAL CARE', 'PET SUPPLIES', 'PLAYERS AND ELECTRONICS',
+    'POULTRY', 'PREPARED FOODS', 'PRODUCE', 'SCHOOL AND OFFICE SUPPLIES', 'SEAFOOD'
+]
+
+BASE_STORES = 54
+BASE_CITIES = 22
+BASE_STATES = 16
+START_DATE = '2013-01-01'
+END_DATE = '2017-08-15'
+
+
+def generate(output_dir, scale=1, days=None, seed=0, block_days=30):
+    # Writes sales.csv, stores.csv, oil.csv and holidays.csv to output_dir; returns the sales row count.
+    # days limits the date range (from START_DATE) for quick runs
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    dates = pd.date_range(START_DATE, END_DATE, freq='D')
+    if days:
+        dates = dates[:days]
+
+    stores = make_stores(rng, scale)
+    stores.to_csv(os.path.join(output_dir, 'stores.csv'), index=False)
+    make_oil(rng, dates).to_csv(os.path.join(output_dir, 'oil.csv'), index=False)
+    make_holidays(rng, dates, stores).to_csv(os.path.join(output_dir, 'holidays.csv'), index=False)
+    return write_sales(rng, dates, stores['store_nbr'].to_numpy(), os.path.join(output_dir, 'sales.csv'), block_days)
+
+
+def make_stores(rng, scale):
+    store_count = BASE_STORES * scale
+    cities = np.array([f'City {n}' for n in range(BASE_CITIES * scale)])
+    city_states = np.array([f'State {n % (BASE_STATES * scale)}' for n in range(len(cities))])
+
+    # A few large cities hold most stores, as Quito and Guayaquil do in the real data
+    city_weights = 1.0 / np.arange(1, len(cities) + 1)
+    city_index = rng.choice(len(cities), size=store_count, p=city_weights / city_weights.sum())
+    return pd.DataFrame({
+        'store_nbr': np.arange(1, store_count + 1),
+        'city': cities[city_index],
+        'state': city_states[city_index],
+        'type': rng.choice(list('ABCDE'), size=store_count, p=[0.17, 0.15, 0.28, 0.33, 0.07]),
+        'cluster': rng.integers(1, 18, size=store_count)
+    })
+
+
+def make_oil(rng, dates):
+    business_days = dates[dates.dayofweek < 5]
+    prices = 95 + np.cumsum(rng.normal(-0.03, 1.2, size=len(business_days)))
+    prices = np.clip(prices, 26, 110).round(2)
+    # About 3.5% of the real prices are missing
+    prices[rng.random(len(prices)) < 0.035] = np.nan
+    return pd.DataFrame({
+        'date': business_days.strftime('%Y-%m-%d'),
+        'dcoilwtico': prices,
+        'year': business_days.year
+    })
+
+
+def make_holidays(rng, dates, stores):
+    # About one event per six days: half national, the rest mostly local, some dates shared by several events
+    count = max(len(dates) // 6, 1)
+    holiday_dates = pd.DatetimeIndex(np.sort(rng.choice(dates, size=count)))
+    locale = rng.choice(['National', 'Regional', 'Local'], size=count, p=[0.5, 0.07, 0.43])
+    store_index = rng.integers(0, len(stores), size=count)
+    locale_name = np.where(locale == 'National', 'Ecuador',
+                           np.where(locale == 'Regional', stores['state'].to_numpy()[store_index],
+                                    stores['city'].to_numpy()[store_index]))
+    transferred = rng.random(count) < 0.035
+
+    return pd.DataFrame({
+        'date': holiday_dates.strftime('%Y-%m-%d'),
+        'type': rng.choice(['Holiday', 'Event', 'Additional', 'Transfer', 'Bridge', 'Work Day'], size=count,
+                           p=[0.63, 0.16, 0.14, 0.035, 0.015, 0.02]),
+        'locale': locale,
+        'locale_name': locale_name,
+        'description': [f'Holiday {n}' for n in range(count)],
+        'transferred': transferred,
+        'is_transfered': transferred.astype(int),
+        'day_of_week': holiday_dates.dayofweek,
+        'is_weekend': (holiday_dates.dayofweek >= 5).astype(int)
+    })
+
+
+def write_sales(rng, dates, store_numbers, path, block_days):
+    # Written in blocks of days, so memory stays flat at any scale
+    families = np.array(FAMILIES, dtype=object)
+    family_levels = rng.lognormal(3.0, 1.5, size=len(families))
+    rows_per_day = len(store_numbers) * len(families)
+    next_id = 0
+
+    with open(path, 'w', newline='') as sales_file:
+        for block_start in range(0, len(dates), block_days):
+            block_dates = dates[block_start:block_start + block_days]
+            rows = len(block_dates) * rows_per_day
+            family_index = np.tile(np.arange(len(families)), len(block_dates) * len(store_numbers))
+
+            # About 31% of the real sales are zero; the rest are skewed, scaled per family
+            sales = rng.lognormal(0.0, 1.0, size=rows) * family_levels[family_index]
+            sales[rng.random(rows) < 0.31] = 0.0
+            promotions = np.where(rng.random(rows) < 0.8, 0, rng.poisson(10, size=rows))
+
+            block = pd.DataFrame({
+                'id': np.arange(next_id, next_id + rows),
+                'date': np.repeat(block_dates.strftime('%Y-%m-%d').to_numpy(), rows_per_day),
+                'store_nbr': np.tile(np.repeat(store_numbers, len(families)), len(block_dates)),
+                'family': families[family_index],
+                'sales': sales.round(3),
+                'onpromotion': promotions
+            })
+            block.to_csv(sales_file, index=False, header=next_id == 0)
+            next_id += rows
+
+    return next_id
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate synthetic Favorita-shaped CSVs.')
+    parser.add_argument('output_dir')
+    parser.add_argument('--scale', type=int, default=1, help='multiplies stores, cities and states (1, 10, 100)')
+    parser.add_argument('--days', type=int, default=None, help='only the first N days from 2013-01-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    row_count = generate(args.output_dir, scale=args.scale, days=args.days, seed=args.seed)
+    print(f"Wrote {row_count} sales rows to {args.output_dir}")
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dimLookup import DimensionLookup
+
+# Compares the DataFrame.merge chain used by ETL.load_aggregate_sales with array-indexed lookups
+# on synthetic Favorita-shaped data (54 stores, 33 families, one row per store/family/day).
+# Usage: python benchmarks/lookup_benchmark.py [rows ...]
+
+
+def make_frames(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2013-01-01', '2017-08-15', freq='D')
+
+    stores = pd.DataFrame({
+        'store_nbr': np.arange(1, 55),
+        'city': [f'City {n % 22}' for n in range(54)],
+        'state': [f'State {n % 16}' for n in range(54)],
+        'store_type': [chr(ord('A') + n % 5) for n in range(54)]
+    })
+    families = pd.DataFrame({'family_id': np.arange(1, 34), 'family': [f'FAMILY {n}' for n in range(1, 34)]})
+    holiday_dates = pd.Series(rng.choice(dates, size=350, replace=False)).sort_values()
+    holidays = pd.DataFrame({
+        'date': holiday_dates.to_numpy(),
+        'holiday_type': rng.choice(['Holiday', 'Event', 'Additional', 'Transfer'], size=350),
+        'is_weekend': holiday_dates.dt.dayofweek.to_numpy() >= 5,
+        'description': [f'Holiday {n}' for n in range(350)]
+    })
+
+    sales = pd.DataFrame({
+        'date': rng.choice(dates, size=rows),
+        'store_nbr': rng.integers(1, 55, size=rows),
+        'family_id': rng.integers(1, 34, size=rows),
+        'sale_amount': rng.gamma(2.0, 200.0, size=rows),
+        'onpromotion': rng.integers(0, 20, size=rows)
+    })
+    return sales, families, holidays, stores
+
+
+def merge_chain(sales, families, holidays, stores):
+    result = sales.merge(families, on='family_id', how='left')
+    result = result.merge(holidays, on='date', how='left')
+    return result.merge(stores, on='store_nbr', how='left')
+
+
+def array_chain(sales, families, holidays, stores):
+    result = sales.copy()  # keeps the input reusable between runs; the lookups themselves do not copy
+    DimensionLookup(families, 'family_id').assign(result)
+    DimensionLookup(holidays, 'date').assign(result)
+    return DimensionLookup(stores, 'store_nbr').assign(result)
+
+
+def measure(function, *frames):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(*frames)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def main(row_counts):
+    for rows in row_counts:
+        frames = make_frames(rows)
+
+        merged, merge_time, merge_peak = measure(merge_chain, *frames)
+        indexed, array_time, array_peak = measure(array_chain, *frames)
+
+        pd.testing.assert_frame_equal(merged, indexed[merged.columns], check_dtype=False)
+
+        print(f"{rows} rows: merge {merge_time:.3f}s peak {merge_peak / 2 ** 20:.1f} MB | "
+              f"array {array_time:.3f}s peak {array_peak / 2 ** 20:.1f} MB | "
+              f"{merge_time / array_time:.1f}x faster")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [100000, 1000000, 3000000])
@@ -1,26 +1,43 @@
-from sqlalchemy import create_engine, MetaData
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import make_url
+from sqlalchemy.orm import declarative_base
 import pandas as pd
+from engineRegistry import get_engine, get_session_factory
+from schemaCache import load_metadata
+from queryStream import iter_query_chunks, aggregate_chunks, fast_fetch, DEFAULT_CHUNK_SIZE
+from queryCache import QueryCache, statement_tables
+from queryProfiler import get_profiler
 
 Base = declarative_base()
 
 class DatabaseManager:
-    def __init__(self, username, password, host, database_name):
+    def __init__(self, username, password, host, database_name, **pool_options):
         self.username = username
         self.password = password
         self.host = host
         self.database_name = database_name
+        # pool_size, max_overflow, pool_timeout, pool_recycle, pool_pre_ping; defaults from the environment
+        self.pool_options = pool_options
         self.engine = self.create_engine()
-        self.Session = sessionmaker(bind=self.engine)
-        self.metadata = MetaData()
+        self.Session = get_session_factory(self.engine.url)
         self.reflect_metadata()
+        # Results of cached_query, invalidated per table by the ETL's load versions (None: caching off)
+        self.query_cache = QueryCache.from_env()
+
+    @classmethod
+    def from_url(cls, db_url):
+        # Used by worker processes, which receive the connection URL instead of the parent's engine
+        url = make_url(db_url)
+        host = f'{url.host}:{url.port}' if url.port else url.host
+        return cls(url.username, url.password, host, url.database)
 
     def create_engine(self):
+        # Engines are shared per URL through engineRegistry, so managers for the same database share a pool
         db_url = f'postgresql+psycopg2://{self.username}:{self.password}@{self.host}/{self.database_name}'
-        return create_engine(db_url)
+        return get_engine(db_url, **self.pool_options)
 
     def reflect_metadata(self):
-        self.metadata.reflect(bind=self.engine)
+        # Loaded from the schema cache while the schema is unchanged; Model reuses this metadata
+        self.metadata = load_metadata(self.engine)
 
     def test_connection(self):
         try:
@@ -37,7 +54,42 @@ class DatabaseManager:
     def get_session(self):
         return self.Session()
 
+    def pool_stats(self):
+        return self.engine.pool.stats()
+
+    def duckdb(self, parquet_dir=None, export=True, tables=None):
+        # Embedded DuckDB backend over this database's tables, for Analysis and dbQueries: views over
+        # Parquet exports in parquet_dir (exported first when export is set, skipping tables whose load
+        # version is unchanged), or with parquet_dir=None, over the tables attached directly
+        from duckDbBackend import DuckDBManager, export_parquet
+        if parquet_dir and export:
+            export_parquet(self, parquet_dir, tables)
+        return DuckDBManager(parquet_dir=parquet_dir, source=self, tables=tables)
+
+    def profile_queries(self):
+        # Attaches the process query profiler to this engine (as QUERY_PROFILE=1 does for every engine);
+        # its report() lists the slowest statements and their callers
+        return get_profiler().attach(self.engine)
+
     def query(self, sql):
         with self.engine.connect() as connection:
             df = pd.read_sql(sql, connection)
         return df
+
+    def cached_query(self, sql, params=None, tables=None):
+        # Like query, for repeated reads: the result is reused until a load changes one of the tables it
+        # reads. tables defaults to the tables named in sql; pass them for SQL that hides them (e.g. views).
+        load = lambda: fast_fetch(self.engine, sql, params=params)
+        if self.query_cache is None:
+            return load()
+        return self.query_cache.fetch(self.engine, sql, params, tables or statement_tables(sql), load)
+
+    def query_chunks(self, sql, params=None, chunk_size=DEFAULT_CHUNK_SIZE, output='pandas'):
+        # Streams the result in DataFrame (or Arrow record batch) chunks from a server-side cursor
+        return iter_query_chunks(self.engine, sql, params=params, chunk_size=chunk_size, output=output)
+
+    def query_aggregate(self, sql, by, aggregations, params=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        # Grouped sum/count/min/max/mean over a streamed result, e.g.
+        # query_aggregate('SELECT store_nbr, year, sale_amount FROM aggregate_sales', ['store_nbr', 'year'],
+        #                 {'sale_amount': 'sum'})
+        return aggregate_chunks(self.query_chunks(sql, params=params, chunk_size=chunk_size), by, aggregations)
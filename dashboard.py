@@ -4,7 +4,6 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 from analysis import Analysis
 from connectDb import DatabaseManager
-from cachetools import cached, TTLCache
 from multiprocessing import Pool
 import plotly.express as px
 
@@ -105,13 +104,11 @@ class Dashboard:
 
         self.register_callbacks()
 
-    @cached(cache=TTLCache(maxsize=10, ttl=300))
     def query_aggregate_sales_data(self):
         sales_data = self.analysis.query_aggregate_sales_data()
         print("Sales Data Loaded:\n", sales_data.head())  # Debugging print
         return sales_data
 
-    @cached(cache=TTLCache(maxsize=10, ttl=300))
     def query_family_sales_data(self):
         query = """
         SELECT 
@@ -124,11 +121,10 @@ class Dashboard:
             "SalesSum2018" 
         FROM "summary_family_sales"
         """
-        df = self.analysis.db_manager.query(query)
+        df = self.analysis.db_manager.cached_query(query)
         print("Family Sales Data Loaded:\n", df.head())  # Debugging print
         return df
 
-    @cached(cache=TTLCache(maxsize=10, ttl=300))
     def query_store_sales_data(self):
         query = """
         SELECT 
@@ -141,7 +137,7 @@ class Dashboard:
             "SalesSum2018" 
         FROM "summary_store_sales"
         """
-        df = self.analysis.db_manager.query(query)
+        df = self.analysis.db_manager.cached_query(query)
         print("Store Sales Data Loaded:\n", df.head())  # Debugging print
         return df
 
@@ -241,7 +237,6 @@ from dash import dcc, html
 from dash.dependencies import Input, Output
 from analysis import Analysis
 from connectDb import DatabaseManager
-from cachetools import cached, TTLCache
 from multiprocessing import Pool
 import plotly.express as px
 
@@ -347,13 +342,11 @@ class Dashboard:
 
         self.register_callbacks()
 
-    @cached(cache=TTLCache(maxsize=10, ttl=300))
     def query_aggregate_sales_data(self):
         sales_data = self.analysis.query_aggregate_sales_data()
         print("Sales Data Loaded:\n", sales_data.head())  # Debugging print
         return sales_data
 
-    @cached(cache=TTLCache(maxsize=10, ttl=300))
     def query_family_sales_data(self):
         query = """
         SELECT 
@@ -366,11 +359,10 @@ class Dashboard:
             "SalesSum2018" 
         FROM "summary_family_sales"
         """
-        df = self.analysis.db_manager.query(query)
+        df = self.analysis.db_manager.cached_query(query)
         print("Family Sales Data Loaded:\n", df.head())  # Debugging print
         return df
 
-    @cached(cache=TTLCache(maxsize=10, ttl=300))
     def query_store_sales_data(self):
         query = """
         SELECT 
@@ -383,7 +375,7 @@ class Dashboard:
             "SalesSum2018" 
         FROM "summary_store_sales"
         """
-        df = self.analysis.db_manager.query(query)
+        df = self.analysis.db_manager.cached_query(query)
         print("Store Sales Data Loaded:\n", df.head())  # Debugging print
         return df
 
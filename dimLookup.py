@@ -0,0 +1,113 @@
+import numpy as np
+import pandas as pd
+
+
+class KeyDomain:
+    # Maps the values of one key column to integer codes. Small integer and date keys (store_nbr,
+    # family_id, calendar days) are dense, so the code is just the offset from the smallest key;
+    # other keys (e.g. family names) are hashed once through a pandas Index.
+    def __init__(self, series, max_dense_size=1 << 22):
+        self.index = None
+        self.offset = 0
+
+        if self._is_integer_like(series):
+            values, present = self._as_integers(series)
+            values = values[present]
+            low = int(values.min()) if len(values) else 0
+            high = int(values.max()) if len(values) else -1
+            if high - low + 1 <= max(max_dense_size, len(values)):
+                self.offset = low
+                self.size = high - low + 1
+                return
+
+        self.index = pd.Index(series.dropna().unique())
+        self.size = len(self.index)
+
+    @staticmethod
+    def _is_integer_like(series):
+        return (pd.api.types.is_integer_dtype(series) or pd.api.types.is_bool_dtype(series)
+                or pd.api.types.is_datetime64_any_dtype(series))
+
+    @staticmethod
+    def _as_integers(series):
+        present = series.notna().to_numpy()
+        if pd.api.types.is_datetime64_any_dtype(series):
+            # Day numbers since the epoch; sub-day precision is not used by any dimension
+            values = series.to_numpy(dtype='datetime64[ns]').astype('datetime64[D]').astype(np.int64)
+        else:
+            values = series.to_numpy(dtype=np.int64, na_value=0)
+        return values, present
+
+    def codes(self, series):
+        # Returns (codes, valid); invalid rows are keys that are missing or outside the dimension
+        if self.index is None:
+            if not (self._is_integer_like(series) or pd.api.types.is_float_dtype(series)):
+                series = pd.to_numeric(series, errors='coerce')
+            if pd.api.types.is_float_dtype(series):
+                present = series.notna().to_numpy()
+                values = series.fillna(0).to_numpy().astype(np.int64)
+            else:
+                values, present = self._as_integers(series)
+            codes = values - self.offset
+            return codes, present & (codes >= 0) & (codes < self.size)
+
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # Look up each category once and broadcast through the category codes
+            category_codes = self.index.get_indexer(series.cat.categories)
+            source_codes = series.cat.codes.to_numpy()
+            codes = np.where(source_codes >= 0, category_codes[source_codes], -1)
+        else:
+            codes = self.index.get_indexer(series)
+        return codes, codes >= 0
+
+
+class DimensionLookup:
+    # Enriches fact rows from a dimension by position: each key is encoded as an integer code,
+    # a precomputed array maps the combined code to the dimension row, and attribute columns are
+    # gathered with NumPy fancy indexing. Unlike DataFrame.merge, the fact frame is never copied.
+    def __init__(self, data_frame, keys):
+        self.keys = [keys] if isinstance(keys, str) else list(keys)
+        self.columns = [column for column in data_frame.columns if column not in self.keys]
+        # Plain ndarrays where possible: assigning a wrapped object array makes pandas rescan it for NaN
+        self.values = {
+            column: data_frame[column].array if pd.api.types.is_extension_array_dtype(data_frame[column])
+            else data_frame[column].to_numpy()
+            for column in self.columns
+        }
+
+        self.domains = [KeyDomain(data_frame[key]) for key in self.keys]
+        self.shape = tuple(max(domain.size, 1) for domain in self.domains)
+
+        codes, valid = self._codes(data_frame)
+        flat = np.ravel_multi_index(codes, self.shape)[valid]
+        if len(np.unique(flat)) != len(flat):
+            raise ValueError(f"Dimension lookup keys {self.keys} are not unique.")
+
+        self.positions_by_code = np.full(int(np.prod(self.shape)), -1, dtype=np.int64)
+        self.positions_by_code[flat] = np.arange(len(data_frame), dtype=np.int64)[valid]
+
+    def _codes(self, data_frame):
+        codes = []
+        valid = np.ones(len(data_frame), dtype=bool)
+        for key, domain in zip(self.keys, self.domains):
+            key_codes, key_valid = domain.codes(data_frame[key])
+            codes.append(np.where(key_valid, key_codes, 0))
+            valid &= key_valid
+        return tuple(codes), valid
+
+    def positions(self, data_frame):
+        # Dimension row for every fact row, -1 where the fact key has no match
+        codes, valid = self._codes(data_frame)
+        positions = self.positions_by_code[np.ravel_multi_index(codes, self.shape)]
+        positions[~valid] = -1
+        return positions
+
+    def take(self, column, positions):
+        # Missing matches become NaN with the same dtype promotion a left merge applies
+        return pd.api.extensions.take(self.values[column], positions, allow_fill=True)
+
+    def assign(self, data_frame, columns=None):
+        positions = self.positions(data_frame)
+        for column in columns or self.columns:
+            data_frame[column] = self.take(column, positions)
+        return data_frame
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import os
+import warnings
+from datetime import datetime
+from sqlalchemy import MetaData, make_url, select, text, Integer, SmallInteger, BigInteger, Float, Numeric, String, \
+    Date, DateTime, Boolean
+from atomicFile import atomic_write, write_json
+from connectDb import DatabaseManager
+from engineRegistry import get_engine, get_session_factory
+from queryCache import QueryCache, LOAD_VERSION_TABLE
+from queryStream import iter_query_chunks, DEFAULT_CHUNK_SIZE
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional; only export_parquet needs it
+    pa = None
+    pq = None
+
+# Embedded DuckDB backend for the analytical reads of Analysis and dbQueries, which are full scans with
+# GROUP BY/SUM over aggregate_sales and the rollup and summary tables. DuckDBManager is a DatabaseManager
+# whose engine is an in-process DuckDB database (duckdb_engine dialect) with one view per table, either
+# over Parquet exports of the PostgreSQL tables or over the tables themselves, attached through DuckDB's
+# postgres extension. The views keep the PostgreSQL table names and columns, so the same SQLAlchemy
+# statements and SQL text run on either backend; DuckDB scans them column-wise on all cores.
+#
+# The DuckDB backend is read-only: the Analysis methods that store summary rows need PostgreSQL.
+
+# Tables exported and exposed by default; fact_sales is left out, no analytical query reads it
+ANALYTICS_TABLES = [
+    'aggregate_sales', 'summary_family_sales', 'summary_store_sales',
+    'rollup_sales_daily', 'rollup_sales_monthly', 'rollup_sales_year_store', 'rollup_sales_year_family',
+    'rollup_sales_daily_total',
+    'dim_store', 'dim_product_family', 'dim_date', 'dim_holiday', 'dim_city_state', 'dim_oil',
+    LOAD_VERSION_TABLE
+]
+MANIFEST_NAME = 'manifest.json'
+ATTACHED_NAME = 'source'
+
+# Arrow types of the exported columns, so every chunk of a table is written with the same schema
+ARROW_TYPES = [
+    (SmallInteger, 'int16'), (BigInteger, 'int64'), (Integer, 'int32'), (Float, 'float64'), (Numeric, 'float64'),
+    (Boolean, 'bool_'), (Date, 'date32'), (DateTime, 'timestamp_us'), (String, 'string')
+]
+
+
+def arrow_schema(table):
+    fields = []
+    for column in table.columns:
+        type_name = next((name for sql_type, name in ARROW_TYPES if isinstance(column.type, sql_type)), 'string')
+        arrow_type = pa.timestamp('us') if type_name == 'timestamp_us' else getattr(pa, type_name)()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def export_parquet(db_manager, export_dir, tables=None, chunk_size=DEFAULT_CHUNK_SIZE, force=False):
+    # Writes each table to export_dir/<table>.parquet, streamed from a server-side cursor one chunk (one
+    # row group) at a time. A table is only exported again when its load version (etl_load_version, bumped
+    # by the ETL) changed since the last export, or with force=True. Returns the names of the tables written.
+    if pq is None:
+        raise ImportError("Parquet exports need pyarrow.")
+    os.makedirs(export_dir, exist_ok=True)
+    manifest_path = os.path.join(export_dir, MANIFEST_NAME)
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+
+    versions = {}
+    if LOAD_VERSION_TABLE in db_manager.metadata.tables:
+        with db_manager.engine.connect() as connection:
+            versions = dict(connection.execute(text(f'SELECT table_name, version FROM {LOAD_VERSION_TABLE}')).all())
+
+    exported = []
+    for table_name in tables or ANALYTICS_TABLES:
+        table = db_manager.metadata.tables.get(table_name)
+        if table is None:
+            continue
+        path = os.path.join(export_dir, f'{table_name}.parquet')
+        # etl_load_version itself is always exported, so the DuckDB query cache sees the exported versions
+        version = versions.get(table_name, 0)
+        unchanged = table_name in manifest and manifest[table_name]['version'] == version and os.path.exists(path)
+        if unchanged and not force and table_name != LOAD_VERSION_TABLE:
+            continue
+
+        rows = _write_parquet(db_manager.engine, table, path, chunk_size)
+        manifest[table_name] = {'version': version, 'rows': rows, 'exported_at': datetime.now().isoformat()}
+        exported.append(table_name)
+        print(f"Exported {table_name}: {rows} rows to {path}")
+
+    write_json(manifest_path, manifest)
+    return exported
+
+
+def _write_parquet(engine, table, path, chunk_size):
+    schema = arrow_schema(table)
+
+    def write(temporary_path):
+        rows = 0
+        with pq.ParquetWriter(temporary_path, schema) as writer:
+            for batch in iter_query_chunks(engine, select(table), chunk_size=chunk_size, output='arrow'):
+                writer.write_table(pa.Table.from_batches([batch]).cast(schema))
+                rows += batch.num_rows
+            if rows == 0:
+                writer.write_table(schema.empty_table())
+        return rows
+
+    return atomic_write(path, write)
+
+
+def _libpq_string(url):
+    # Connection string for DuckDB's postgres extension, from a SQLAlchemy URL
+    parts = {'host': url.host, 'port': url.port, 'dbname': url.database, 'user': url.username,
+             'password': url.password}
+    quoted = []
+    for key, value in parts.items():
+        if value not in (None, ''):
+            value = str(value).replace('\\', '\\\\').replace("'", "\\'")
+            quoted.append(f"{key}='{value}'")
+    return ' '.join(quoted)
+
+
+class DuckDBManager(DatabaseManager):
+    # DatabaseManager on an embedded DuckDB database. With parquet_dir, the tables are views over the
+    # Parquet files export_parquet wrote there (source, if given, is what refresh exports from); with only
+    # source (a PostgreSQL DatabaseManager), they are views over its attached tables. Engines come from
+    # engineRegistry like PostgreSQL ones, so the pool settings, the query profiler and the query cache
+    # apply to DuckDB too.
+    def __init__(self, parquet_dir=None, source=None, tables=None, **pool_options):
+        if parquet_dir is None and source is None:
+            raise ValueError("Pass parquet_dir, source or both.")
+        self.parquet_dir = os.path.abspath(parquet_dir) if parquet_dir else None
+        self.source = source
+        self.tables = tables or ANALYTICS_TABLES
+        self.database_name = self._instance_name()
+        self.pool_options = pool_options
+        self.engine = self.create_engine()
+        self.Session = get_session_factory(self.engine.url)
+        self.create_views()
+        self.reflect_metadata()
+        self.query_cache = QueryCache.from_env()
+
+    @classmethod
+    def from_url(cls, db_url):
+        # duckdb:///<parquet_dir> reads the Parquet exports in that directory; a PostgreSQL URL attaches
+        # that database. The in-memory URL of an engine (duckdb:///:memory:analytics_...) only exists in
+        # the process that created it, so it cannot be opened again.
+        url = make_url(db_url)
+        if url.get_backend_name() != 'duckdb':
+            return cls(source=DatabaseManager.from_url(db_url))
+        if not url.database or url.database.startswith(':memory:'):
+            raise ValueError(f"Cannot open {db_url} again; use duckdb:///<parquet_dir>, or pass parquet_dir "
+                             f"or source to DuckDBManager.")
+        return cls(parquet_dir=url.database)
+
+    def _instance_name(self):
+        # A named in-memory database is shared by every pooled connection of this process (no file, so no
+        # lock between processes); one per Parquet directory or attached database
+        origin = self.parquet_dir or self.source.engine.url.render_as_string(hide_password=True)
+        return f"analytics_{hashlib.sha256(origin.encode()).hexdigest()[:12]}"
+
+    def create_engine(self):
+        return get_engine(f'duckdb:///:memory:{self.database_name}', **self.pool_options)
+
+    def create_views(self):
+        # (Re)creates one view per available table; called again after a new export or load
+        with self.engine.begin() as connection:
+            if self.parquet_dir:
+                sources = {}
+                for table_name in self.tables:
+                    path = os.path.join(self.parquet_dir, f'{table_name}.parquet')
+                    if os.path.exists(path):
+                        sources[table_name] = f"read_parquet('{path.replace(chr(39), chr(39) * 2)}')"
+            else:
+                connection.execute(text('INSTALL postgres'))
+                connection.execute(text('LOAD postgres'))
+                libpq = _libpq_string(self.source.engine.url).replace("'", "''")
+                connection.execute(text(f'DETACH DATABASE IF EXISTS {ATTACHED_NAME}'))
+                connection.execute(text(f"ATTACH '{libpq}' AS {ATTACHED_NAME} (TYPE postgres, READ_ONLY)"))
+                sources = {table_name: f'{ATTACHED_NAME}.public.{table_name}' for table_name in self.tables
+                           if table_name in self.source.metadata.tables}
+
+            for table_name, table_source in sources.items():
+                connection.execute(text(f'CREATE OR REPLACE VIEW {table_name} AS SELECT * FROM {table_source}'))
+        print(f"DuckDB views created for {len(sources)} tables.")
+
+    def reflect_metadata(self):
+        # The views are what Model and Analysis see as tables; duckdb_engine warns that it cannot
+        # reflect indexes, which views do not have anyway
+        self.metadata = MetaData()
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='.*reflection on indices')
+            self.metadata.reflect(bind=self.engine, views=True)
+
+    def refresh(self, force=False):
+        # Re-exports the tables whose load version changed (Parquet mode) and rebuilds the views
+        if self.parquet_dir and self.source is None:
+            print("No source database to export from; only the views are rebuilt.")
+        elif self.parquet_dir:
+            export_parquet(self.source, self.parquet_dir, self.tables, force=force)
+        self.create_views()
+        self.reflect_metadata()
+        if self.query_cache is not None:
+            self.query_cache.expire_versions()
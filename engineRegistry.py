@@ -0,0 +1,156 @@
+import os
+import threading
+import time
+from sqlalchemy import create_engine, make_url, exc
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from load_dotenv import load_dotenv
+from envSettings import read_settings
+from queryProfiler import get_profiler, profiling_enabled
+
+load_dotenv()
+
+# One engine (and connection pool) per database URL and process, shared by DatabaseManager, the
+# LangChain sessions and the helpers, so a query reuses a pooled connection instead of paying for a
+# new engine and connection. Pool settings come from the environment, or per call from get_engine.
+# With QUERY_PROFILE=1, every engine is created with the process query profiler attached.
+POOL_SETTINGS = {
+    'pool_size': ('DB_POOL_SIZE', int, 5),
+    'max_overflow': ('DB_MAX_OVERFLOW', int, 10),
+    'pool_timeout': ('DB_POOL_TIMEOUT', float, 30.0),
+    'pool_recycle': ('DB_POOL_RECYCLE', int, 1800),
+    'pool_pre_ping': ('DB_POOL_PRE_PING', lambda value: value.lower() in ('1', 'true', 'yes'), True)
+}
+
+_lock = threading.Lock()
+_engines = {}
+_session_factories = {}
+_owner_pid = os.getpid()
+
+
+class TimedQueuePool(QueuePool):
+    # QueuePool that records how long checkouts take: time spent waiting for a free connection
+    # (or running the pre-ping) apart from time spent opening new connections
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.checkout_s = 0.0
+        self.connect_s = 0.0
+        self.max_wait_s = 0.0
+        self.max_checked_out = 0
+        self.timeouts = 0
+        self.local = threading.local()
+
+    def connect(self):
+        self.local.connect_s = 0.0
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            with self.stats_lock:
+                self.timeouts += 1
+            raise
+
+        elapsed = time.perf_counter() - started
+        wait = elapsed - self.local.connect_s
+        with self.stats_lock:
+            self.checkouts += 1
+            self.checkout_s += elapsed
+            self.max_wait_s = max(self.max_wait_s, wait)
+            self.max_checked_out = max(self.max_checked_out, self.checkedout())
+        return connection
+
+    def _create_connection(self):
+        started = time.perf_counter()
+        record = super()._create_connection()
+        elapsed = time.perf_counter() - started
+        # New connections are also opened on invalidation, outside connect()
+        if hasattr(self.local, 'connect_s'):
+            self.local.connect_s += elapsed
+        with self.stats_lock:
+            self.connects += 1
+            self.connect_s += elapsed
+        return record
+
+    def stats(self):
+        with self.stats_lock:
+            wait_s = max(self.checkout_s - self.connect_s, 0.0)
+            return {
+                'pool_size': self.size(),
+                'checked_out': self.checkedout(),
+                'checked_in': self.checkedin(),
+                'overflow': self.overflow(),
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'timeouts': self.timeouts,
+                'wait_s': round(wait_s, 6),
+                'avg_wait_ms': round(wait_s / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_s * 1000, 3),
+                'connect_s': round(self.connect_s, 6)
+            }
+
+
+def pool_options(**overrides):
+    # Environment settings with the given overrides; None leaves a setting at its environment value
+    options = read_settings(POOL_SETTINGS)
+    options.update({name: value for name, value in overrides.items() if value is not None})
+    return options
+
+
+def _registry_key(url):
+    return make_url(url).render_as_string(hide_password=False)
+
+
+def _forget_parent_engines():
+    # A forked worker must not reuse the parent's pooled connections; it starts its own engines
+    global _owner_pid
+    if os.getpid() != _owner_pid:
+        for engine in _engines.values():
+            engine.dispose(close=False)
+        _engines.clear()
+        _session_factories.clear()
+        _owner_pid = os.getpid()
+
+
+def get_engine(url, **pool_overrides):
+    # Pool options only apply when the URL's engine is first created in this process
+    key = _registry_key(url)
+    with _lock:
+        _forget_parent_engines()
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine(key, poolclass=TimedQueuePool, **pool_options(**pool_overrides))
+            _engines[key] = engine
+            if profiling_enabled():
+                get_profiler().attach(engine)
+        elif pool_overrides:
+            print(f"Engine for {make_url(key)} already exists; pool options {pool_overrides} not applied.")
+    return engine
+
+
+def get_session_factory(url):
+    key = _registry_key(url)
+    engine = get_engine(key)
+    with _lock:
+        if key not in _session_factories:
+            _session_factories[key] = sessionmaker(bind=engine)
+        return _session_factories[key]
+
+
+def pool_stats():
+    # Statistics per database URL (password hidden)
+    with _lock:
+        engines = dict(_engines)
+    return {str(engine.url): engine.pool.stats() for engine in engines.values()
+            if isinstance(engine.pool, TimedQueuePool)}
+
+
+def dispose_all():
+    with _lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _session_factories.clear()
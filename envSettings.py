@@ -0,0 +1,10 @@
+import os
+
+
+def read_settings(settings):
+    # settings: name -> (environment variable, parser, default); unset or empty variables give the default
+    options = {}
+    for name, (variable, parse, default) in settings.items():
+        value = os.getenv(variable)
+        options[name] = parse(value) if value not in (None, '') else default
+    return options
@@ -1,18 +1,166 @@
+import hashlib
+import io
+import itertools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
 import pandas as pd
-from sqlalchemy import insert
+from sqlalchemy import insert, select, delete, func, extract, cast, and_, or_, false, true, Integer
 from sqlalchemy.dialects.postgresql import insert as pg_insert
-from models import Model
-from datetime import date, timedelta
+from models import Model, PARTITION_KEYS
+from connectDb import DatabaseManager
+from stagingCache import StagingCache, file_checksum
+from dimLookup import DimensionLookup
+from etlMetrics import ETLMetrics, timed_stage, frame_rows
+from salesRollups import SalesRollups, ROLLUP_TABLES
+from queryCache import bump_load_versions
+from datetime import date
+
+# Compact dtypes for sales.csv; 'family' has 33 distinct values and store_nbr fits in int16
+SALES_DTYPES = {
+    'id': 'int32',
+    'store_nbr': 'int16',
+    'family': 'category',
+    'sales': 'float64',
+    'onpromotion': 'int16'
+}
+
+# Compact in-memory schema for the ETL working frames (compact mode)
+COMPACT_DTYPES = {
+    'family': 'category',
+    'family_name': 'category',
+    'store_city': 'category',
+    'store_state': 'category',
+    'store_type': 'category',
+    'holiday_type': 'category',
+    'city': 'category',
+    'state': 'category',
+    'type': 'category',
+    'store_nbr': 'int16',
+    'family_id': 'int16',
+    'onpromotion': 'int16',
+    'day': 'int8',
+    'month': 'int8',
+    'year': 'int16',
+    'is_holiday': 'int8',
+    'is_weekend': 'bool'
+}
+
+# Measures that may be held as float32 when allow_float32 is set; PostgreSQL stores them as double
+FLOAT32_COLUMNS = ['sales', 'sale_amount']
+
+SOURCE_FILES = ['sales.csv', 'stores.csv', 'oil.csv', 'holidays.csv']
+
+# Source file behind each table, used by incremental runs to skip unchanged inputs
+TABLE_SOURCES = {
+    'dim_oil': 'oil.csv',
+    'dim_store': 'stores.csv',
+    'dim_city_state': 'stores.csv',
+    'dim_holiday': 'holidays.csv',
+    'dim_product_family': 'sales.csv',
+    'dim_date': 'sales.csv',
+    'fact_sales': 'sales.csv',
+    'aggregate_sales': 'sales.csv'
+}
+
+# Sources whose dates dim_date covers
+DIM_DATE_SOURCES = ['sales.csv', 'oil.csv', 'holidays.csv']
+
+# Transform method for each dimension; dimensions are independent of each other
+DIMENSION_LOADERS = {
+    'dim_oil': 'load_dim_oil',
+    'dim_store': 'load_dim_store',
+    'dim_product_family': 'load_dim_products_family',
+    'dim_date': 'load_dim_date',
+    'dim_holiday': 'load_dim_holiday',
+    'dim_city_state': 'load_dim_city_state'
+}
+
+# Dimensions that must be committed before each sales table is transformed and written
+SALES_DEPENDENCIES = {
+    'fact_sales': ['dim_product_family'],
+    'aggregate_sales': ['dim_product_family', 'dim_holiday', 'dim_store', 'dim_date']
+}
+
+# ETL settings copied into each partition worker, so it transforms and writes like the parent would
+PARTITION_SETTINGS = ['compact', 'allow_float32', 'load_modes', 'merge_policies', 'copy_chunk_size', 'aggregate_mode',
+                      'holiday_match', 'lookup_mode', 'resume', 'committed_chunks', 'pipeline_workers', 'queue_depth',
+                      'partition_by', 'staging_key']
+
+# ETL instance of a partition worker process, built once per process by _init_partition_worker
+_partition_etl = None
+
+
+def _init_partition_worker(db_url, data_dir, staging_dir, settings, dimensions, metrics_options):
+    # Runs once per worker: the dimension frames arrive here instead of with every partition
+    global _partition_etl
+    db_manager = DatabaseManager.from_url(db_url) if db_url else None
+    _partition_etl = ETL(db_manager, data_dir=data_dir, staging_dir=staging_dir,
+                         metrics=ETLMetrics(**metrics_options))
+    for name, value in settings.items():
+        setattr(_partition_etl, name, value)
+    for name, data_frame in dimensions.items():
+        setattr(_partition_etl, name, data_frame)
+
+
+def _transform_partition(partition_key, sales, row_offset, chunk_size, target):
+    return _partition_etl.transform_partition(partition_key, sales, row_offset, chunk_size, target)
+
+
+def frame_hash(data_frame):
+    return hashlib.sha1(pd.util.hash_pandas_object(data_frame, index=False).values.tobytes()).hexdigest()
+
+
+def compact_frame(data_frame, allow_float32=False):
+    # Converts columns in place, one at a time, so the peak is one extra column rather than a frame copy
+    for column in data_frame.columns:
+        series = data_frame[column]
+        if column == 'date':
+            if not pd.api.types.is_datetime64_any_dtype(series):
+                data_frame[column] = pd.to_datetime(series, errors='coerce')
+            continue
+
+        dtype = COMPACT_DTYPES.get(column)
+        if allow_float32 and column in FLOAT32_COLUMNS:
+            dtype = 'float32'
+        if dtype is None or series.dtype == dtype:
+            continue
+        # numpy integer and bool types cannot hold missing values
+        if dtype != 'category' and series.isna().any():
+            continue
+        data_frame[column] = series.astype(dtype)
+    return data_frame
+
+
+def driver_params(compiled, dialect):
+    # Apply each column type's bind processor (e.g. 0/1 -> bool) as Connection.execute would
+    processors = {}
+    params = {}
+    for name, value in compiled.params.items():
+        bind_type = compiled.binds[name].type
+        if bind_type not in processors:
+            processors[bind_type] = bind_type.bind_processor(dialect)
+        processor = processors[bind_type]
+        params[name] = processor(value) if processor and value is not None else value
+    return params
 
 
 class ETL:
-    def __init__(self, db_manager):
+    def __init__(self, db_manager, data_dir='Data', staging_dir=None, metrics=None):
         self.db_manager = db_manager
-        self.model = Model(db_manager.engine)
+        self.data_dir = data_dir
+        # Stage timings, row counts and memory; pass ETLMetrics(report_path=..., trace_path=...) to write them out
+        self.metrics = metrics or ETLMetrics()
+        # Columnar cache of parsed sources and derived frames, reused while the sources are unchanged
+        self.staging = StagingCache(staging_dir) if staging_dir else None
+        self.staging_key = None
+        # Without a db_manager (partition workers writing to staging) only the transforms are usable
+        self.model = Model(db_manager.engine, metadata=db_manager.metadata) if db_manager is not None else None
 
         # Initialize data attributes
         self.dim_product_family = pd.DataFrame()  # Placeholder for product family data
-        self.dim_date = []  # Placeholder for date data
+        self.dim_date = pd.DataFrame()  # Placeholder for date data
         self.dim_holiday = pd.DataFrame()  # Placeholder for holiday data
         self.fact_sales = pd.DataFrame()  # Placeholder for sales data
         self.dim_city_state = pd.DataFrame()
@@ -20,25 +168,120 @@ class ETL:
         self.dim_store = pd.DataFrame()
         self.aggregate_sales = pd.DataFrame()
 
-    def load_data(self):
-        self.sales = pd.read_csv('Data/sales.csv')
-        self.stores = pd.read_csv('Data/stores.csv')
-        self.oil = pd.read_csv('Data/oil.csv')
-        self.holidays = pd.read_csv('Data/holidays.csv')
+        # Write path per table ('insert', 'copy' or 'merge'), set by load_to_db
+        self.load_modes = {}
+        self.copy_chunk_size = 100000
+        # Merge mode: 'update' applies changed source values, 'ignore' only adds new keys (per table)
+        self.merge_policies = {}
+        self.merge_counts = {}  # table name -> inserted / updated / unchanged rows in this run
+
+        # Streaming mode reads sales.csv in chunks during load_to_db, set by load_data
+        self.streaming = False
+        self.sales_chunk_size = 500000
+
+        # Compact mode keeps working frames as categoricals and small integer types, set by load_data
+        self.compact = False
+        self.allow_float32 = False
+        self.memory_savings = {}  # frame name -> (bytes before, bytes after)
+
+        # Incremental mode state, set by load_to_db
+        self.incremental = False
+        self.watermarks = {}  # source file -> {'max_date', 'checksum'} from the last committed load
+        self.source_checksums = {}
+        self.source_max_dates = {}  # source file -> max date seen in this run
+        self.skip_tables = set()
+
+        # 'pandas' builds aggregate_sales in Python, 'sql' builds it inside PostgreSQL from fact_sales
+        self.aggregate_mode = 'pandas'
+        self.elt_workers = 1
+        # 'date' matches any holiday on the sale date, 'locale' only holidays that apply to the store's city/state
+        self.holiday_match = 'date'
+        # 'merge' joins dimensions with DataFrame.merge, 'array' gathers them by integer key (dimLookup)
+        self.lookup_mode = 'merge'
+
+        # Chunk checkpoints: resume skips chunks already committed by a previous, failed run
+        self.resume = False
+        self.committed_chunks = {}  # (table name, start row, end row) -> content hash
+        self.row_offsets = {}  # table name -> rows written before the current frame (streaming mode)
+
+        # Chunked inserts: workers serialise up to queue_depth chunks ahead of the writer (0 = no pipeline)
+        self.pipeline_workers = 0
+        self.queue_depth = 4
+
+        # Partitioned transform: sales split by 'year' or 'store' range across process_workers processes,
+        # each writing its partition to the database ('db') or to the staging cache ('staging')
+        self.process_workers = 0
+        self.partition_by = 'year'
+        self.partition_target = 'db'
 
+        # Sales rollups refreshed after each load for the range of sales dates written (first, last)
+        self.rollups = True
+        self.rollup_range = None
+
+        # Tables written in this run; their load versions are bumped at the end, invalidating cached queries
+        self.changed_tables = set()
+
+    def load_data(self, streaming=False, sales_chunk_size=500000, compact=False, allow_float32=False):
+        self.streaming = streaming
+        self.sales_chunk_size = sales_chunk_size
+        self.compact = compact
+        self.allow_float32 = allow_float32
+
+        if streaming:
+            # Only the family column is read up front (for dim_product_family);
+            # the rest of sales.csv is streamed chunk by chunk in load_to_db
+            self.sales = self._read_source('sales.csv', usecols=['family'], dtype={'family': 'category'})
+        elif compact:
+            self.sales = self._read_source('sales.csv', dtype=SALES_DTYPES, parse_dates=['date'])
+        else:
+            self.sales = self._read_source('sales.csv')
+        self.stores = self._read_source('stores.csv')
+        self.oil = self._read_source('oil.csv')
+        self.holidays = self._read_source('holidays.csv')
+
+    def _read_source(self, source, **read_csv_kwargs):
+        with self.metrics.stage(f'read_{source}') as record:
+            if self.staging:
+                data_frame = self.staging.read_csv(f'{self.data_dir}/{source}', **read_csv_kwargs)
+            else:
+                data_frame = pd.read_csv(f'{self.data_dir}/{source}', **read_csv_kwargs)
+            record['rows_out'] = len(data_frame)
+        return data_frame
+
+    def iter_sales_chunks(self):
+        if self.staging:
+            chunks = self.staging.iter_csv_chunks(f'{self.data_dir}/sales.csv', self.sales_chunk_size,
+                                                  dtype=SALES_DTYPES, parse_dates=['date'])
+        else:
+            chunks = pd.read_csv(f'{self.data_dir}/sales.csv', dtype=SALES_DTYPES, parse_dates=['date'],
+                                 chunksize=self.sales_chunk_size)
+
+        # Reading is timed separately from the transforms and writes the caller runs on each chunk
+        while True:
+            with self.metrics.stage('read_sales.csv_chunk') as record:
+                sales_chunk = next(chunks, None)
+                record['rows_out'] = frame_rows(sales_chunk)
+            if sales_chunk is None:
+                return
+            yield sales_chunk
+
+    @timed_stage(rows_in='oil', rows_out='dim_oil')
     def load_dim_oil(self):
         self.dim_oil['date'] = pd.to_datetime(self.oil['date']).dt.date
         self.dim_oil['price'] = self.oil['dcoilwtico'].astype(float)
         self.dim_oil['year'] = self.oil['year'].astype(int)
 
+    @timed_stage(rows_in='stores', rows_out='dim_store')
     def load_dim_store(self):
         self.dim_store = self.stores[['store_nbr', 'city', 'state', 'type', 'cluster']].drop_duplicates().reset_index(
             drop=True)
 
+    @timed_stage(rows_in='sales', rows_out='dim_product_family')
     def load_dim_products_family(self):
         self.dim_product_family['family'] = self.sales['family'].drop_duplicates().reset_index(drop=True)
         self.dim_product_family['family_id'] = self.dim_product_family.index + 1
 
+    @timed_stage(rows_in='holidays', rows_out='dim_holiday')
     def load_dim_holiday(self):
         self.dim_holiday['date'] = pd.to_datetime(self.holidays['date']).dt.date
         self.dim_holiday['type'] = self.holidays['type'].astype(str)
@@ -50,42 +293,74 @@ class ETL:
         self.dim_holiday['day_of_week'] = self.holidays['day_of_week'].astype(int)
         self.dim_holiday['is_weekend'] = self.holidays['is_weekend'].astype(bool)
 
-    def load_dim_date(self, start_year=2013, end_year=2017):
-        current_date = date(start_year, 1, 1)
-        end_date = date(end_year + 1, 1, 1)  # Up to but not including end_year + 1
-        dim_date_entries = []
-
-        while current_date < end_date:
-            weekday = current_date.weekday()
-            is_weekend = weekday >= 5
-            dim_date_entry = {
-                'date': current_date,
-                'year': current_date.year,
-                'month': current_date.month,
-                'day': current_date.day,
-                'weekday': weekday,
-                'is_weekend': is_weekend
-            }
-            dim_date_entries.append(dim_date_entry)
-            current_date += timedelta(days=1)
-
-        self.dim_date = dim_date_entries  # Store as list of dictionaries
+    @timed_stage(rows_out='dim_date')
+    def load_dim_date(self, start_date=None, end_date=None):
+        # One row per day over the dates present in sales, oil and holidays, built column-wise
+        data_start, data_end = self._source_date_range()
+        dates = pd.date_range(start_date or data_start, end_date or data_end, freq='D')
+        iso_calendar = dates.isocalendar()
+        holiday_dates = pd.to_datetime(self.holidays['date']).unique() if 'date' in self.holidays else []
+
+        self.dim_date = pd.DataFrame({
+            'date': dates.date,
+            'year': dates.year,
+            'month': dates.month,
+            'day': dates.day,
+            'weekday': dates.weekday,
+            'is_weekend': dates.weekday >= 5,
+            'quarter': dates.quarter,
+            'iso_year': iso_calendar['year'].to_numpy(dtype='int32'),
+            'iso_week': iso_calendar['week'].to_numpy(dtype='int32'),
+            'day_of_year': dates.dayofyear,
+            # Public sector wages are paid on the 15th and on the last day of the month
+            'is_payday': (dates.day == 15) | dates.is_month_end,
+            'is_holiday': dates.isin(holiday_dates)
+        })
+
+    def _source_date_range(self):
+        # ISO date strings order like the dates, so min/max need no parsing of the full column
+        bounds = []
+        for source in ('sales', 'oil', 'holidays'):
+            data_frame = getattr(self, source, None)
+            if data_frame is not None and 'date' in data_frame.columns and not data_frame.empty:
+                bounds += [pd.Timestamp(data_frame['date'].min()), pd.Timestamp(data_frame['date'].max())]
+        # Streaming loads only see the sales dates chunk by chunk; a snapshot, as a parallel load's sales
+        # thread may add to the dict meanwhile
+        bounds += [pd.Timestamp(max_date) for max_date in list(self.source_max_dates.values())]
+
+        if not bounds:
+            raise ValueError("No dates found in sales, oil or holidays to build dim_date from.")
+        return min(bounds), max(bounds)
 
+    @timed_stage(rows_in='stores', rows_out='dim_city_state')
     def load_dim_city_state(self):
         self.dim_city_state['city'] = self.stores['city'].drop_duplicates().reset_index(drop=True)
         self.dim_city_state['state'] = self.stores['state'].drop_duplicates().reset_index(drop=True)
         self.dim_city_state['location_id'] = self.dim_city_state.index + 1
 
+    @timed_stage(rows_in='sales', rows_out='fact_sales')
     def load_fact_sale(self):
         self.fact_sales['date'] = self.sales['date']
         self.fact_sales['store_nbr'] = self.sales['store_nbr']
         self.fact_sales['sales'] = self.sales['sales']
         self.fact_sales['onpromotion'] = self.sales['onpromotion']
 
-        self.fact_sales['family_id'] = self.sales['family'].map(
-            self.dim_product_family.set_index('family')['family_id']
-        )
+        if self.lookup_mode == 'array':
+            family_lookup = DimensionLookup(self.dim_product_family[['family', 'family_id']], 'family')
+            family_ids = family_lookup.take('family_id', family_lookup.positions(self.sales))
+        else:
+            family_ids = self.sales['family'].map(
+                self.dim_product_family.set_index('family')['family_id']
+            )
+            # Mapping a categorical column yields a categorical result; keep family_id numeric
+            if isinstance(family_ids.dtype, pd.CategoricalDtype):
+                family_ids = family_ids.astype(family_ids.cat.categories.dtype)
+        self.fact_sales['family_id'] = family_ids
+
+        if self.compact:
+            self._compact('fact_sales')
 
+    @timed_stage(rows_in='fact_sales', rows_out='aggregate_sales')
     def load_aggregate_sales(self):
         try:
             print("\nLoading Aggregate Sales Data Initiated....")
@@ -109,21 +384,15 @@ class ETL:
 
             # Merge with dim_product_family to get family_name
             if 'family_id' in self.dim_product_family.columns:
-                self.aggregate_sales = self.aggregate_sales.merge(
-                    self.dim_product_family[['family_id', 'family']],
-                    on='family_id',
-                    how='left'
-                )
+                self._merge_aggregate('dim_product_family', self.dim_product_family[['family_id', 'family']],
+                                      on='family_id')
                 self.aggregate_sales.rename(columns={'family': 'family_name'}, inplace=True)
             else:
                 raise ValueError("Column 'family_id' not found in self.dim_product_family.")
 
-            # Merge with dim_holiday to get holiday information
-            self.aggregate_sales = self.aggregate_sales.merge(
-                self.dim_holiday[['date', 'type', 'is_weekend', 'description']],
-                on='date',
-                how='left'
-            )
+            # Merge with dim_holiday to get holiday information, at most one holiday row per sales row
+            holidays, holiday_keys = self._holiday_lookup()
+            self._merge_aggregate('dim_holiday', holidays, on=holiday_keys)
             self.aggregate_sales.rename(columns={'type': 'holiday_type', 'description': 'holiday_description'},
                                         inplace=True)
 
@@ -134,11 +403,7 @@ class ETL:
             self.aggregate_sales['is_holiday'] = self.aggregate_sales['holiday_type'].notna().astype(int)
 
             # Merge with dim_store to get store information
-            self.aggregate_sales = self.aggregate_sales.merge(
-                self.dim_store[['store_nbr', 'city', 'state', 'type']],
-                on='store_nbr',
-                how='left'
-            )
+            self._merge_aggregate('dim_store', self.dim_store[['store_nbr', 'city', 'state', 'type']], on='store_nbr')
             self.aggregate_sales.rename(columns={'type': 'store_type', 'state': 'store_state', 'city': 'store_city'},
                                         inplace=True)
 
@@ -152,6 +417,9 @@ class ETL:
                                 'family_name', 'sale_amount', 'onpromotion', 'is_weekend', 'day', 'month', 'year']
             self.aggregate_sales = self.aggregate_sales[expected_columns]
 
+            if self.compact:
+                self._compact('aggregate_sales')
+
             print("\nLoading Aggregate Sales Data Successfully Executed....")
 
         except KeyError as e:
@@ -162,128 +430,929 @@ class ETL:
             print(f"Error preparing data for database insertion: {str(e)}")
             raise
 
-    def load_to_db(self, chunk_size=10000):
+    def _holiday_lookup(self):
+        holidays = self.dim_holiday[['date', 'type', 'locale', 'locale_name', 'is_weekend', 'description']]
+        columns = ['type', 'is_weekend', 'description']
+
+        if self.holiday_match == 'locale':
+            # National holidays apply to every store, Regional ones to stores in that state
+            # and Local ones to stores in that city; one row per (date, store) is kept
+            stores = self.dim_store[['store_nbr', 'city', 'state']]
+            matched = pd.concat([
+                holidays[holidays['locale'] == 'National'].merge(stores[['store_nbr']], how='cross'),
+                holidays[holidays['locale'] == 'Regional'].merge(stores, left_on='locale_name', right_on='state'),
+                holidays[holidays['locale'] == 'Local'].merge(stores, left_on='locale_name', right_on='city')
+            ], ignore_index=True)
+            return matched.drop_duplicates(['date', 'store_nbr'])[['date', 'store_nbr'] + columns], ['date', 'store_nbr']
+
+        # Several events can share a date (e.g. a national and a local holiday); keep the first one,
+        # which is the row the old fan-out left in aggregate_sales after the ON CONFLICT DO NOTHING insert
+        return holidays.drop_duplicates('date')[['date'] + columns], ['date']
+
+    def _merge_aggregate(self, name, data_frame, on):
+        rows_before = len(self.aggregate_sales)
+        with self.metrics.stage(f'merge_{name}', rows_in=rows_before, mode=self.lookup_mode) as record:
+            if self.lookup_mode == 'array':
+                # Attributes are gathered into new columns by position, without copying aggregate_sales
+                DimensionLookup(self._lookup(data_frame), on).assign(self.aggregate_sales)
+            else:
+                self.aggregate_sales = self.aggregate_sales.merge(self._lookup(data_frame), on=on, how='left')
+            rows_after = record['rows_out'] = len(self.aggregate_sales)
+
+        print(f"Merge with {name}: {rows_before} -> {rows_after} rows")
+        if rows_after != rows_before:
+            raise ValueError(f"Merge with {name} changed the aggregate_sales row count "
+                             f"({rows_before} -> {rows_after}), the lookup has duplicate keys.")
+
+    def _lookup(self, data_frame):
+        # In compact mode dimension attributes join as categoricals, so merged columns stay compact
+        return compact_frame(data_frame.copy()) if self.compact else data_frame
+
+    def _compact(self, frame_name):
+        data_frame = getattr(self, frame_name)
+        before = data_frame.memory_usage(deep=True).sum()
+        compact_frame(data_frame, self.allow_float32)
+        after = data_frame.memory_usage(deep=True).sum()
+
+        self.memory_savings[frame_name] = (before, after)
+        print(f"\n{frame_name}: {before / 2 ** 20:.1f} MB -> {after / 2 ** 20:.1f} MB "
+              f"({(before - after) / 2 ** 20:.1f} MB saved)\n")
+
+    def load_to_db(self, chunk_size=10000, load_modes=None, copy_chunk_size=100000, incremental=False,
+                   parallel=False, max_workers=4, aggregate_mode='pandas', elt_workers=1, resume=False,
+                   pipeline_workers=0, queue_depth=4, holiday_match='date', lookup_mode='merge', process_workers=0,
+                   partition_by='year', partition_target='db', merge_policies=None, rollups=True):
+        # load_modes selects the write path per table: 'insert' (default), 'copy', or 'merge' to upsert
+        # changed rows, e.g. {'fact_sales': 'copy', 'aggregate_sales': 'copy', 'dim_oil': 'merge'}; dim_date
+        # is always merged, as its changed dates are replaced
+        self.load_modes = load_modes or {}
+        self.copy_chunk_size = copy_chunk_size
+        self.merge_policies = merge_policies or {}
+        self.merge_counts = {}
+        # incremental only loads rows newer than the stored watermark and skips unchanged source files
+        self.incremental = incremental
+        # aggregate_mode='sql' builds aggregate_sales server-side, split by year across elt_workers connections
+        self.aggregate_mode = aggregate_mode
+        self.elt_workers = elt_workers
+        # resume skips aggregate chunks already checkpointed by a previous run with the same data
+        self.resume = resume
+        # pipeline_workers > 0 overlaps chunk serialisation with database writes in _insert_chunked
+        self.pipeline_workers = pipeline_workers
+        self.queue_depth = queue_depth
+        self.holiday_match = holiday_match
+        self.lookup_mode = lookup_mode
+        # process_workers > 0 runs the fact and aggregate transforms per partition in a process pool
+        # (in-memory loads only; streaming mode already bounds the work per chunk)
+        self.process_workers = 0 if self.streaming else process_workers
+        self.partition_by = partition_by
+        self.partition_target = partition_target
+        self.rollups = rollups
+        self.rollup_range = None
+        self.changed_tables = set()
+
         try:
-            self.load_dim_oil()
-            self.load_dim_store()
-            self.load_dim_holiday()
+            self._prepare_watermarks()
+            self._prepare_checkpoints()
+            self._prepare_staging()
+
+            if parallel:
+                self._load_parallel(chunk_size, max_workers)
+                return
+
+            for table_name in DIMENSION_LOADERS:
+                self._transform_dimension(table_name)
+            if not self.streaming and not self.process_workers and 'fact_sales' not in self.skip_tables:
+                self._transform_fact_sales()
+                if self.aggregate_mode == 'pandas':
+                    self._transform_aggregate_sales()
+
+            connection = self.db_manager.engine.connect()
+
+            try:
+                self._store_dimensions(connection)
+
+                if 'fact_sales' in self.skip_tables:
+                    print("\nsales.csv unchanged since last load, skipping Sales Fact and Sale Aggregate\n")
+                elif self.streaming:
+                    self._store_sales_streaming(connection, chunk_size)
+                elif self.process_workers:
+                    self._store_sales_partitioned(connection, chunk_size)
+                else:
+                    self._store_sales(connection, chunk_size)
+
+                if self.aggregate_mode == 'sql' and 'fact_sales' not in self.skip_tables:
+                    self.build_aggregate_sales_in_db(max_workers=self.elt_workers, after_date=self._sales_watermark())
+
+                # Only refreshed when sales rows were written in this run
+                if self.rollups and self.rollup_range is not None:
+                    self.refresh_rollups()
+
+                self._save_watermarks(connection)
+                self._save_load_versions(connection)
+
+            except Exception as e:
+                print(f"Error loading data to database: {str(e)}")
+                raise
+            finally:
+                connection.close()
+                print("Database connection closed!!!")
+
+        except Exception as e:
+            print(f"Error preparing data for database insertion: {str(e)}")
+            raise
+        finally:
+            self.metrics.finish()
+
+    def _dimension_writes(self):
+        # table name -> (label, frame builder, conflict target), in load order
+        return {
+            'dim_oil': ('Oil Dimension', lambda: self.dim_oil.fillna(0), self._oil_conflict_key()),
+            'dim_store': ('Store Dimension', lambda: self.dim_store, ['store_nbr']),
+            'dim_product_family': ('Product Family Dimension', lambda: self.dim_product_family, ['family_id']),
+            'dim_date': ('Date Dimension', lambda: self.dim_date, ['date']),
+            'dim_holiday': ('Holiday Dimension', lambda: self.dim_holiday, ['date', 'locale', 'locale_name']),
+            'dim_city_state': ('City-State Dimension', lambda: self.dim_city_state, ['city', 'state'])
+        }
+
+    def _oil_conflict_key(self):
+        # Merging needs the date constraint create_tables adds to dim_oil (None without it, which merge
+        # rejects); insert and copy skip rows conflicting with any constraint, so they work without it
+        if self.load_modes.get('dim_oil') != 'merge':
+            return None
+        return self.model.conflict_key(self.model.dim_oil, 'uq_dim_oil_date')
+
+    def _store_dimensions(self, connection, table_names=None):
+        dimension_writes = self._dimension_writes()
+        for table_name in table_names or dimension_writes:
+            label, build_frame, index_elements = dimension_writes[table_name]
+            if table_name in self.skip_tables:
+                print(f"\n{TABLE_SOURCES[table_name]} unchanged since last load, skipping {label}\n")
+                continue
+
+            data_frame = build_frame()
+            mode = None
+            if table_name == 'dim_date':
+                data_frame = self._dates_to_write(connection, data_frame)
+                # Merged, so changed dates are replaced in the transaction that inserts the new ones
+                mode = 'merge'
+            elif 'date' in data_frame.columns:
+                data_frame = self._newer_than_watermark(data_frame, TABLE_SOURCES[table_name])
+
+            if not data_frame.empty:
+                self._write_table(connection, getattr(self.model, table_name), data_frame,
+                                  index_elements=index_elements, mode=mode)
+                print(f"\nData Successfully stored into {label}\n")
+
+    def _dates_to_write(self, connection, dim_date):
+        # Only dates that are missing, or whose attributes changed (a new holiday, rows from before the
+        # calendar columns were added), are written; changed rows are replaced by the merge
+        with connection.begin():
+            existing = pd.read_sql(select(self.model.dim_date), connection)
+        if existing.empty:
+            return dim_date
+
+        columns = list(dim_date.columns)
+        existing['date'] = pd.to_datetime(existing['date']).dt.date
+        changed = pd.concat([existing[columns], existing[columns], dim_date]).drop_duplicates(keep=False)
+
+        stale_dates = set(changed['date']) & set(existing['date'])
+        print(f"\ndim_date: {len(changed)} of {len(dim_date)} dates to write ({len(stale_dates)} replaced)\n")
+        return changed
+
+    def _store_sales(self, connection, chunk_size):
+        self._store_fact_sales(connection)
+        self._store_aggregate_sales(connection, chunk_size)
+
+    def _store_fact_sales(self, connection):
+        if not self.fact_sales.empty:
+            self._note_rollup_range(self.fact_sales)
+            self._write_table(connection, self.model.fact_sales, self.fact_sales,
+                              index_elements=self.model.conflict_key(self.model.fact_sales))
+            print("\nData Successfully stored into Sales Fact\n")
+
+    def _store_aggregate_sales(self, connection, chunk_size):
+        if not self.aggregate_sales.empty:
+            self._write_table(connection, self.model.aggregate_sales, self.aggregate_sales,
+                              index_elements=self.model.conflict_key(self.model.aggregate_sales),
+                              chunk_size=chunk_size)
+            print("\nData Successfully stored into Sale Aggregate\n")
+
+    def _store_sales_streaming(self, connection, chunk_size):
+        # Each chunk of sales.csv goes through the fact and aggregate transforms and is written
+        # before the next one is read, so peak memory is bounded by sales_chunk_size
+        count = 1
+        for sales_chunk in self.iter_sales_chunks():
+            print(f"\nSales Stream Chunk No: {count}\n")
+            chunk_max_date = sales_chunk['date'].max()
+            if 'sales.csv' not in self.source_max_dates or chunk_max_date > self.source_max_dates['sales.csv']:
+                self.source_max_dates['sales.csv'] = chunk_max_date
+
+            self.sales = self._newer_than_watermark(sales_chunk, 'sales.csv')
+            self.fact_sales = pd.DataFrame()
+            self.load_fact_sale()
+            if self.aggregate_mode == 'pandas':
+                self.load_aggregate_sales()
+            self._store_sales(connection, chunk_size)
+            self.row_offsets['aggregate_sales'] = self.row_offsets.get('aggregate_sales', 0) + len(self.aggregate_sales)
+            count += 1
+
+        self.sales = pd.DataFrame()
+        self.fact_sales = pd.DataFrame()
+        self.aggregate_sales = pd.DataFrame()
+
+        # dim_date was built before the sales dates were seen; add any dates past its end
+        sales_max_date = self.source_max_dates.get('sales.csv')
+        if not self.dim_date.empty and sales_max_date is not None and \
+                sales_max_date > pd.Timestamp(self.dim_date['date'].max()):
             self.load_dim_date()
-            self.load_dim_city_state()
-            self.load_dim_products_family()
+            self._store_dimensions(connection, ['dim_date'])
+
+    def _store_sales_partitioned(self, connection, chunk_size):
+        # sales is split by year or store range and each partition goes through the fact and aggregate
+        # transforms in its own process; the dimensions are sent to each worker once, at start-up
+        if self.partition_target == 'staging' and not (self.staging and self.staging.enabled):
+            raise ValueError("partition_target='staging' needs a staging_dir and pyarrow.")
+        if self.partition_target not in ('db', 'staging'):
+            raise ValueError(f"Unknown partition target '{self.partition_target}'.")
+
+        self._prepare_sales()
+        if self.partition_target == 'db':
+            # Workers write straight to the database, so the table partitions they need are created first
+            self._ensure_partitions(self.model.fact_sales, self.sales)
+            self._ensure_partitions(self.model.aggregate_sales, self.sales)
+            self._note_rollup_range(self.sales)
+            self.changed_tables.update(['fact_sales', 'aggregate_sales'])
+        settings = {name: getattr(self, name) for name in PARTITION_SETTINGS}
+        dimensions = {name: getattr(self, name) for name in SALES_DEPENDENCIES['aggregate_sales']}
+        db_url = self.db_manager.engine.url.render_as_string(hide_password=False) \
+            if self.partition_target == 'db' else None
+        staging_dir = self.staging.cache_dir if self.staging else None
+
+        first_row = self.row_offsets.get('aggregate_sales', 0)
+        with ProcessPoolExecutor(max_workers=self.process_workers, initializer=_init_partition_worker,
+                                 initargs=(db_url, self.data_dir, staging_dir, settings, dimensions,
+                                           self.metrics.options())) as executor:
+            futures = []
+            row_offset = first_row
+            for partition_key, partition in self._sales_partitions():
+                print(f"\nSales Partition {self.partition_by} {partition_key}: {len(partition)} rows\n")
+                futures.append(executor.submit(_transform_partition, partition_key, partition, row_offset,
+                                               chunk_size, self.partition_target))
+                row_offset += len(partition)
+            self.sales = pd.DataFrame()
+
+            staged_partitions = []
+            for future in futures:
+                staged_frames, (stages, chunks) = future.result()
+                self.metrics.merge(stages, chunks)
+                staged_partitions.append(staged_frames)
+
+        if self.partition_target == 'staging':
+            # Partitions are read back memory-mapped and written one at a time on this connection
+            row_offset = first_row
+            for staged_frames in staged_partitions:
+                for frame_name, staged_name in staged_frames:
+                    self.staging.record_frame(staged_name, self.staging_key)
+                    setattr(self, frame_name, self.staging.load_frame(staged_name, self.staging_key))
+                self.row_offsets['aggregate_sales'] = row_offset
+                self._store_sales(connection, chunk_size)
+                row_offset += len(self.fact_sales)
+
+        self.row_offsets['aggregate_sales'] = row_offset
+        self.fact_sales = pd.DataFrame()
+        self.aggregate_sales = pd.DataFrame()
+
+    def _note_rollup_range(self, data_frame):
+        # An empty frame (or one without dates) has NaT bounds; nothing was written, so no range to widen
+        if data_frame.empty:
+            return
+        dates = pd.to_datetime(data_frame['date']).dropna()
+        if dates.empty:
+            return
+        first_date, last_date = dates.min().date(), dates.max().date()
+        if self.rollup_range is not None:
+            first_date, last_date = min(first_date, self.rollup_range[0]), max(last_date, self.rollup_range[1])
+        self.rollup_range = (first_date, last_date)
+
+    def refresh_rollups(self, first_date=None, last_date=None):
+        # Rebuilds the sales rollups for the dates written in this run (or first_date..last_date) from
+        # aggregate_sales, in one transaction. Empty rollups, e.g. just created next to loaded data,
+        # are first filled from all of aggregate_sales.
+        rollups = SalesRollups(self.model)
+        if not rollups.available():
+            print("\nRollup tables not found, skipping rollup refresh (run create_tables)\n")
+            return {}
+
+        if first_date is None and self.rollup_range is not None:
+            first_date, last_date = self.rollup_range
+
+        with self.metrics.stage('refresh_rollups') as record:
+            with self.db_manager.engine.begin() as connection:
+                if rollups.is_empty(connection):
+                    first_date, last_date = rollups.source_range(connection)
+                if first_date is None:
+                    print("\nNo sales dates to roll up\n")
+                    return {}
+                row_counts = rollups.refresh(connection, first_date, last_date)
+            self.changed_tables.update(ROLLUP_TABLES)
+            record.update(first_date=str(first_date), last_date=str(last_date), rows_out=sum(row_counts.values()))
+
+        print(f"\nSales rollups refreshed for {first_date} to {last_date}: {row_counts}\n")
+        return row_counts
+
+    def _sales_partitions(self):
+        if self.partition_by == 'store':
+            # Contiguous store_nbr ranges with about the same number of stores, one per worker
+            stores = np.sort(self.sales['store_nbr'].unique())
+            ranges = np.array_split(stores, min(self.process_workers, len(stores)))
+            starts = [store_range[0] for store_range in ranges]
+            labels = np.searchsorted(starts, self.sales['store_nbr'].to_numpy(), side='right') - 1
+            names = [f'{store_range[0]}-{store_range[-1]}' for store_range in ranges]
+        elif self.partition_by == 'year':
+            labels = pd.to_datetime(self.sales['date']).dt.year.to_numpy()
+            names = None
+        else:
+            raise ValueError(f"Unknown partition_by '{self.partition_by}', expected 'year' or 'store'.")
+
+        for label, partition in self.sales.groupby(labels, sort=True, observed=True):
+            yield (names[label] if names else label), partition
+
+    def transform_partition(self, partition_key, sales, row_offset, chunk_size, target):
+        # Runs in a partition worker with the dimensions already set by _init_partition_worker
+        self.sales = sales
+        self.fact_sales = pd.DataFrame()
+        self.load_fact_sale()
+        frame_names = ['fact_sales']
+        if self.aggregate_mode == 'pandas':
+            self.load_aggregate_sales()
+            frame_names.append('aggregate_sales')
+
+        if target == 'staging':
+            staged_frames = []
+            for frame_name in frame_names:
+                staged_name = f'{frame_name}_{self.partition_by}_{partition_key}'
+                self.staging.write_frame(staged_name, getattr(self, frame_name))
+                staged_frames.append((frame_name, staged_name))
+            return staged_frames, self.metrics.drain()
+
+        self.row_offsets['aggregate_sales'] = row_offset
+        with self.db_manager.engine.connect() as connection:
+            self._store_sales(connection, chunk_size)
+        # The worker's stage records travel back with the result and are merged into the parent's report
+        return [], self.metrics.drain()
+
+    def aggregate_sales_select(self):
+        # Server-side equivalent of load_aggregate_sales: fact_sales joined to the family, holiday, store
+        # and date dimensions, producing the same columns as the pandas path
+        fact = self.model.fact_sales
+        dim_date = self.model.dim_date
+        dim_store = self.model.dim_store
+        dim_family = self.model.dim_product_family
+
+        # One holiday row per date (or per date and store with holiday_match='locale'), so dates
+        # with several events do not multiply the sales rows
+        dim_holiday = self.model.dim_holiday
+        if self.holiday_match == 'locale':
+            holiday = select(dim_holiday.c.date, dim_holiday.c.is_weekend) \
+                .where(dim_holiday.c.date == fact.c.date) \
+                .where(or_(
+                    dim_holiday.c.locale == 'National',
+                    and_(dim_holiday.c.locale == 'Regional', dim_holiday.c.locale_name == dim_store.c.state),
+                    and_(dim_holiday.c.locale == 'Local', dim_holiday.c.locale_name == dim_store.c.city)
+                )) \
+                .limit(1) \
+                .lateral('holiday')
+            holiday_join = true()
+        else:
+            holiday = select(dim_holiday.c.date, dim_holiday.c.is_weekend) \
+                .distinct(dim_holiday.c.date) \
+                .order_by(dim_holiday.c.date) \
+                .subquery('holiday')
+            holiday_join = holiday.c.date == fact.c.date
+
+        return select(
+            fact.c.date,
+            func.coalesce(dim_date.c.day, cast(extract('day', fact.c.date), Integer)).label('day'),
+            func.coalesce(dim_date.c.month, cast(extract('month', fact.c.date), Integer)).label('month'),
+            func.coalesce(dim_date.c.year, cast(extract('year', fact.c.date), Integer)).label('year'),
+            holiday.c.date.isnot(None).label('is_holiday'),
+            func.coalesce(holiday.c.is_weekend, false()).label('is_weekend'),
+            fact.c.store_nbr,
+            dim_store.c.city.label('store_city'),
+            dim_store.c.state.label('store_state'),
+            dim_store.c.type.label('store_type'),
+            fact.c.family_id,
+            dim_family.c.family.label('family_name'),
+            fact.c.sales.label('sale_amount'),
+            fact.c.onpromotion
+        ).select_from(
+            fact.outerjoin(dim_date, dim_date.c.date == fact.c.date)
+                .outerjoin(dim_store, dim_store.c.store_nbr == fact.c.store_nbr)
+                .outerjoin(holiday, holiday_join)
+                .outerjoin(dim_family, dim_family.c.family_id == fact.c.family_id)
+        )
+
+    def build_aggregate_sales_in_db(self, years=None, max_workers=1, after_date=None):
+        print("\nBuilding Aggregate Sales in Database Initiated....")
+        started = time.perf_counter()
+
+        if years is None:
+            with self.db_manager.engine.connect() as connection:
+                query = select(func.min(self.model.fact_sales.c.date), func.max(self.model.fact_sales.c.date))
+                if after_date is not None:
+                    query = query.where(self.model.fact_sales.c.date > after_date)
+                first_date, last_date = connection.execute(query).one()
+            if first_date is None:
+                print("\nNo new rows in fact_sales, nothing to aggregate\n")
+                return 0
+            years = list(range(first_date.year, last_date.year + 1))
+
+        # Partitions are created up front, not by the per-year workers
+        self.model.ensure_partitions(self.model.aggregate_sales, date(min(years), 1, 1), date(max(years), 12, 31))
+
+        # Each year is a separate INSERT ... SELECT, so years can run concurrently on pooled connections
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                row_counts = list(executor.map(lambda year: self._build_aggregate_year(year, after_date), years))
+        else:
+            row_counts = [self._build_aggregate_year(year, after_date) for year in years]
+
+        elapsed = time.perf_counter() - started
+        print(f"\naggregate_sales: {sum(row_counts)} rows via sql in {elapsed:.2f}s\n")
+        print("\nBuilding Aggregate Sales in Database Successfully Executed....")
+        return sum(row_counts)
+
+    def _build_aggregate_year(self, year, after_date=None):
+        fact = self.model.fact_sales
+        query = self.aggregate_sales_select().where(fact.c.date >= date(year, 1, 1), fact.c.date < date(year + 1, 1, 1))
+        if after_date is not None:
+            query = query.where(fact.c.date > after_date)
+
+        columns = [column.name for column in query.selected_columns]
+        insert_stmt = pg_insert(self.model.aggregate_sales).from_select(columns, query)
+        on_conflict_stmt = insert_stmt.on_conflict_do_nothing(
+            index_elements=self.model.conflict_key(self.model.aggregate_sales))
+
+        with self.metrics.stage('build_aggregate_year', year=year) as record:
+            with self.db_manager.engine.begin() as connection:
+                result = connection.execute(on_conflict_stmt)
+            record['rows_out'] = result.rowcount
+        if result.rowcount:
+            self.changed_tables.add('aggregate_sales')
+        print(f"\nAggregate Sales for {year}: {result.rowcount} rows inserted\n")
+        return result.rowcount
+
+    def _sales_watermark(self):
+        watermark = self.watermarks.get('sales.csv') if self.incremental else None
+        return watermark['max_date'] if watermark else None
+
+    def _load_parallel(self, chunk_size, max_workers):
+        # Independent dimensions are transformed and written concurrently, each worker on its own pooled
+        # connection; the sales tables start as soon as the dimensions they depend on are committed
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dimension_futures = {table_name: executor.submit(self._load_dimension, table_name)
+                                 for table_name in DIMENSION_LOADERS}
+            sales_futures = []
+
+            if 'fact_sales' in self.skip_tables:
+                print("\nsales.csv unchanged since last load, skipping Sales Fact and Sale Aggregate\n")
+            elif self.streaming:
+                self._wait_for(dimension_futures, SALES_DEPENDENCIES['aggregate_sales'])
+                self._run_on_new_connection(self._store_sales_streaming, chunk_size)
+            elif self.process_workers:
+                self._wait_for(dimension_futures, SALES_DEPENDENCIES['aggregate_sales'])
+                self._run_on_new_connection(self._store_sales_partitioned, chunk_size)
+            else:
+                self._wait_for(dimension_futures, SALES_DEPENDENCIES['fact_sales'])
+                self._transform_fact_sales()
+                sales_futures.append(executor.submit(self._run_on_new_connection, self._store_fact_sales))
+
+                self._wait_for(dimension_futures, SALES_DEPENDENCIES['aggregate_sales'])
+                if self.aggregate_mode == 'pandas':
+                    self._transform_aggregate_sales()
+                    sales_futures.append(executor.submit(self._run_on_new_connection, self._store_aggregate_sales,
+                                                         chunk_size))
+
+            for future in list(dimension_futures.values()) + sales_futures:
+                future.result()
+
+        if self.aggregate_mode == 'sql' and 'fact_sales' not in self.skip_tables:
+            self.build_aggregate_sales_in_db(max_workers=self.elt_workers, after_date=self._sales_watermark())
+
+        # Only refreshed when sales rows were written in this run
+        if self.rollups and self.rollup_range is not None:
+            self.refresh_rollups()
+
+        self._run_on_new_connection(self._save_watermarks)
+        self._run_on_new_connection(self._save_load_versions)
+
+    def _load_dimension(self, table_name):
+        self._transform_dimension(table_name)
+        self._run_on_new_connection(self._store_dimensions, [table_name])
+
+    def _run_on_new_connection(self, store, *args):
+        with self.db_manager.engine.connect() as connection:
+            store(connection, *args)
+
+    def _wait_for(self, futures, table_names):
+        for table_name in table_names:
+            futures[table_name].result()
+
+    def _transform_dimension(self, table_name):
+        if not self._restore_staged(table_name):
+            getattr(self, DIMENSION_LOADERS[table_name])()
+            self._stage(table_name)
+
+    def _transform_fact_sales(self):
+        self._prepare_sales()
+        if not self._restore_staged('fact_sales'):
             self.load_fact_sale()
+            self._stage('fact_sales')
+
+    def _transform_aggregate_sales(self):
+        if not self._restore_staged('aggregate_sales'):
             self.load_aggregate_sales()
+            self._stage('aggregate_sales')
 
-            connection = self.db_manager.engine.connect()
+    def _prepare_staging(self):
+        if not self.staging:
+            return
 
-            try:
+        # Derived frames depend on the sources, the incremental watermark and the in-memory schema
+        key_parts = [self.staging.source_key(f'{self.data_dir}/{source}') for source in SOURCE_FILES]
+        key_parts += [str(self._sales_watermark()), str(self.compact), str(self.allow_float32),
+                      self.holiday_match]
+        self.staging_key = hashlib.md5(':'.join(key_parts).encode()).hexdigest()
 
-                if not self.dim_oil.empty:
-                    transaction = connection.begin()
-                    self.dim_oil.fillna(0, inplace=True)
-                    data_to_insert = self.dim_oil.to_dict(orient='records')
-                    insert_stmt = pg_insert(self.model.dim_oil).values(data_to_insert)
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing()
-                    connection.execute(on_conflict_stmt)
-                    transaction.commit()
-                    print("\nData Successfully stored into Oil Dimension\n")
+    def _restore_staged(self, frame_name):
+        if not self.staging:
+            return False
 
-                if not self.dim_store.empty:
-                    transaction = connection.begin()
-                    insert_stmt = pg_insert(self.model.dim_store).values(self.dim_store.to_dict(orient='records'))
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=['store_nbr'])
-                    connection.execute(on_conflict_stmt)
-                    transaction.commit()
-                    print("\nData Successfully stored into Store Dimension\n")
+        data_frame = self.staging.load_frame(frame_name, self.staging_key)
+        if data_frame is None:
+            return False
 
-                if not self.dim_product_family.empty:
-                    transaction = connection.begin()
-                    insert_stmt = pg_insert(self.model.dim_product_family).values(self.dim_product_family.to_dict(orient='records'))
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=['family_id'])
-                    connection.execute(on_conflict_stmt)
-                    transaction.commit()
-                    print("\nData Successfully stored into Product Family Dimension\n")
+        setattr(self, frame_name, data_frame)
+        print(f"\nLoaded {frame_name} from staging cache\n")
+        return True
 
-                if self.dim_date:  # Check if dim_date is not empty
-                    transaction = connection.begin()
-                    insert_stmt = pg_insert(self.model.dim_date).values(self.dim_date)
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=['date'])
-                    connection.execute(on_conflict_stmt)
-                    transaction.commit()
-                    print("\nData Successfully stored into Date Dimension\n")
+    def _stage(self, frame_name):
+        if self.staging:
+            self.staging.save_frame(frame_name, pd.DataFrame(getattr(self, frame_name)), self.staging_key)
 
-                if not self.dim_holiday.empty:
-                    transaction = connection.begin()
-                    insert_stmt = pg_insert(self.model.dim_holiday).values(self.dim_holiday.to_dict(orient='records'))
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=['date', 'locale', 'locale_name'])
-                    connection.execute(on_conflict_stmt)
-                    transaction.commit()
-                    print("\nData Successfully stored into Holiday Dimension\n")
+    def _prepare_sales(self):
+        self.source_max_dates['sales.csv'] = pd.Timestamp(self.sales['date'].max())
+        self.sales = self._newer_than_watermark(self.sales, 'sales.csv')
 
-                if not self.dim_city_state.empty:
-                    transaction = connection.begin()
-                    insert_stmt = pg_insert(self.model.dim_city_state).values(self.dim_city_state.to_dict(orient='records'))
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=['city', 'state'])
-                    connection.execute(on_conflict_stmt)
-                    transaction.commit()
-                    print("\nData Successfully stored into City-State Dimension\n")
+    def _prepare_checkpoints(self):
+        self.committed_chunks = {}
+        self.row_offsets = {}
+
+        if self.model.etl_checkpoint is None:
+            if self.resume:
+                raise ValueError("Table 'etl_checkpoint' not found. Run create_tables() before resuming a load.")
+            return
+
+        checkpoint = self.model.etl_checkpoint
+        with self.db_manager.engine.begin() as connection:
+            if self.resume:
+                rows = connection.execute(select(checkpoint.c.table_name, checkpoint.c.start_row,
+                                                 checkpoint.c.end_row, checkpoint.c.content_hash)).all()
+                self.committed_chunks = {(row.table_name, row.start_row, row.end_row): row.content_hash
+                                         for row in rows}
+                print(f"\nResuming load, {len(self.committed_chunks)} committed chunks found\n")
+            else:
+                # A fresh run starts a new set of checkpoints
+                connection.execute(delete(checkpoint))
+
+    def _prepare_watermarks(self):
+        self.watermarks = {}
+        self.source_max_dates = {}
+        self.skip_tables = set()
+        checksum = self.staging.source_key if self.staging else file_checksum
+        self.source_checksums = {source: checksum(f'{self.data_dir}/{source}') for source in SOURCE_FILES}
+
+        if not self.incremental:
+            return
+
+        if self.model.etl_watermark is None:
+            raise ValueError("Table 'etl_watermark' not found. Run create_tables() before an incremental load.")
 
-                if not self.fact_sales.empty:
+        with self.db_manager.engine.connect() as connection:
+            rows = connection.execute(select(self.model.etl_watermark)).mappings().all()
+        self.watermarks = {row['source_file']: row for row in rows}
+
+        unchanged_sources = {source for source, checksum in self.source_checksums.items()
+                             if source in self.watermarks and self.watermarks[source]['checksum'] == checksum}
+        self.skip_tables = {table for table, source in TABLE_SOURCES.items() if source in unchanged_sources}
+        # dim_date spans the sales, oil and holiday dates, and carries the holiday flag
+        if not unchanged_sources.issuperset(DIM_DATE_SOURCES):
+            self.skip_tables.discard('dim_date')
+
+    def _newer_than_watermark(self, data_frame, source):
+        watermark = self.watermarks.get(source)
+        if not self.incremental or watermark is None or watermark['max_date'] is None:
+            return data_frame
+
+        newer = pd.to_datetime(data_frame['date']) > pd.Timestamp(watermark['max_date'])
+        return data_frame[newer]
+
+    def _save_watermarks(self, connection):
+        if self.model.etl_watermark is None:
+            return
+
+        if 'oil.csv' not in self.source_max_dates and not self.oil.empty:
+            self.source_max_dates['oil.csv'] = pd.Timestamp(self.oil['date'].max())
+        if 'holidays.csv' not in self.source_max_dates and not self.holidays.empty:
+            self.source_max_dates['holidays.csv'] = pd.Timestamp(self.holidays['date'].max())
+
+        records = []
+        for source, checksum in self.source_checksums.items():
+            if source in self.watermarks and self.watermarks[source]['checksum'] == checksum:
+                continue
+
+            max_date = self.source_max_dates.get(source)
+            if source in self.watermarks and self.watermarks[source]['max_date'] is not None:
+                previous = pd.Timestamp(self.watermarks[source]['max_date'])
+                max_date = previous if max_date is None or pd.isna(max_date) else max(max_date, previous)
+            records.append({
+                'source_file': source,
+                'max_date': None if max_date is None or pd.isna(max_date) else max_date.date(),
+                'checksum': checksum
+            })
+
+        if records:
+            transaction = connection.begin()
+            insert_stmt = pg_insert(self.model.etl_watermark).values(records)
+            on_conflict_stmt = insert_stmt.on_conflict_do_update(
+                index_elements=['source_file'],
+                set_={'max_date': insert_stmt.excluded.max_date, 'checksum': insert_stmt.excluded.checksum,
+                      'updated_at': func.now()}
+            )
+            connection.execute(on_conflict_stmt)
+            transaction.commit()
+            print("\nETL watermarks updated\n")
+
+    def _save_load_versions(self, connection):
+        if not self.changed_tables or self.model.etl_load_version is None:
+            return
+        with connection.begin():
+            bump_load_versions(connection, self.model.etl_load_version, self.changed_tables)
+        # Readers sharing this manager see the new versions right away
+        query_cache = getattr(self.db_manager, 'query_cache', None)
+        if query_cache is not None:
+            query_cache.expire_versions()
+        print(f"\nLoad versions bumped for {', '.join(sorted(self.changed_tables))}\n")
+
+    def _write_table(self, connection, table_model, data_frame, index_elements=None, chunk_size=None, mode=None):
+        mode = mode or self.load_modes.get(table_model.name, 'insert')
+        self._ensure_partitions(table_model, data_frame)
+        started = time.perf_counter()
+
+        with self.metrics.stage(f'write_{table_model.name}', rows_in=len(data_frame), mode=mode) as record:
+            if mode == 'merge':
+                record.update(self._merge_staged(connection, table_model, data_frame,
+                                                 chunk_size or self.copy_chunk_size, index_elements))
+            elif mode == 'copy':
+                self._copy_chunked(connection, table_model, data_frame, chunk_size or self.copy_chunk_size,
+                                   index_elements=index_elements)
+            elif mode == 'insert':
+                if chunk_size:
+                    self._insert_chunked(connection, table_model, data_frame, chunk_size,
+                                         index_elements=index_elements)
+                else:
                     transaction = connection.begin()
-                    insert_stmt = pg_insert(self.model.fact_sales).values(self.fact_sales.to_dict(orient='records'))
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=['date', 'store_nbr', 'family_id'])
+                    insert_stmt = pg_insert(table_model).values(data_frame.to_dict(orient='records'))
+                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=index_elements)
                     connection.execute(on_conflict_stmt)
                     transaction.commit()
-                    print("\nData Successfully stored into Sales Fact\n")
+            else:
+                raise ValueError(f"Unknown load mode '{mode}' for table {table_model.name}.")
+        self.changed_tables.add(table_model.name)
 
+        elapsed = time.perf_counter() - started
+        rows_per_sec = len(data_frame) / elapsed if elapsed > 0 else float('inf')
+        print(f"\n{table_model.name}: {len(data_frame)} rows via {mode} in {elapsed:.2f}s "
+              f"({rows_per_sec:,.0f} rows/sec)\n")
 
-                if not self.aggregate_sales.empty:
-                    self._insert_chunked(connection, self.model.aggregate_sales, self.aggregate_sales, chunk_size,
-                                         index_elements=['date', 'store_nbr', 'family_id'])
-                    print("\nData Successfully stored into Sale Aggregate\n")
+    def _ensure_partitions(self, table_model, data_frame):
+        # Range-partitioned sales tables only accept rows for partitions that exist
+        partition_by = self.model.partition_by
+        if partition_by and table_model.name in PARTITION_KEYS[partition_by] and not data_frame.empty:
+            dates = pd.to_datetime(data_frame['date'])
+            self.model.ensure_partitions(table_model, dates.min(), dates.max())
 
-            except Exception as e:
-                print(f"Error loading data to database: {str(e)}")
-            finally:
-                connection.close()
-                print("Database connection closed!!!")
+    def _copy_chunked(self, connection, table_model, data_frame, chunk_size, index_elements=None):
+        # Stream the frame through COPY FROM STDIN into a temp staging table,
+        # then merge the staged rows into the target with a single INSERT ... SELECT
+        columns = [column for column in data_frame.columns if column in table_model.c]
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        staging_table = f"{table_model.name}_copy_staging"
+        conflict_target = f"({', '.join(index_elements)})" if index_elements else ''
+
+        transaction = connection.begin()
+        try:
+            cursor = connection.connection.cursor()
+            cursor.execute(f'CREATE TEMP TABLE "{staging_table}" (LIKE "{table_model.name}" INCLUDING DEFAULTS) '
+                           f'ON COMMIT DROP')
+
+            self._copy_frame(cursor, table_model, staging_table, data_frame, columns, chunk_size)
+
+            cursor.execute(f'INSERT INTO "{table_model.name}" ({column_list}) '
+                           f'SELECT {column_list} FROM "{staging_table}" '
+                           f'ON CONFLICT {conflict_target} DO NOTHING')
+            cursor.close()
+            transaction.commit()
 
         except Exception as e:
-            print(f"Error preparing data for database insertion: {str(e)}")
+            transaction.rollback()
+            print(f"Error copying data into database: {str(e)}")
+            raise
+
+    def _copy_frame(self, cursor, table_model, staging_table, data_frame, columns, chunk_size):
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        # Integer columns that picked up NaN become float in pandas and would be written as "1.0"
+        integer_columns = [column for column in columns
+                           if isinstance(table_model.c[column].type, Integer)
+                           and pd.api.types.is_float_dtype(data_frame[column])]
+
+        row_offset = self.row_offsets.get(table_model.name, 0)
+        count = 1
+        for start in range(0, len(data_frame), chunk_size):
+            print(f"\nData Copy Chunk No: {count}\n")
+            with self.metrics.stage(f'copy_{table_model.name}', chunk=count, start_row=row_offset + start,
+                                    mode='copy') as record:
+                chunk = data_frame.iloc[start:start + chunk_size][columns]
+                record['rows_in'] = len(chunk)
+                if integer_columns:
+                    chunk = chunk.astype({column: 'Int64' for column in integer_columns})
+
+                serialise_started = time.perf_counter()
+                buffer = io.StringIO()
+                chunk.to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                write_started = time.perf_counter()
+                cursor.copy_expert(f'COPY "{staging_table}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+                record['serialise_s'] = round(write_started - serialise_started, 6)
+                record['write_s'] = round(time.perf_counter() - write_started, 6)
+            count += 1
+
+    def _merge_staged(self, connection, table_model, data_frame, chunk_size, index_elements):
+        # Bulk-load the frame into a temporary staging table, then apply it with one set-based
+        # INSERT ... ON CONFLICT statement. With the 'update' policy, rows whose values differ are
+        # updated; identical rows are left alone, so they are neither rewritten nor counted as updated
+        if not index_elements:
+            raise ValueError(f"Merge mode needs a conflict target for {table_model.name}; "
+                             f"run create_tables to add its unique constraint.")
+
+        policy = self.merge_policies.get(table_model.name, 'update')
+        if policy not in ('update', 'ignore'):
+            raise ValueError(f"Unknown merge policy '{policy}' for table {table_model.name}.")
+
+        columns = [column for column in data_frame.columns if column in table_model.c]
+        column_list = ', '.join(f'"{column}"' for column in columns)
+        key_list = ', '.join(f'"{column}"' for column in index_elements)
+        value_columns = [column for column in columns if column not in index_elements]
+        staging_table = f"{table_model.name}_merge_staging"
+
+        if policy == 'update' and value_columns:
+            target_values = ', '.join(f'"{table_model.name}"."{column}"' for column in value_columns)
+            new_values = ', '.join(f'EXCLUDED."{column}"' for column in value_columns)
+            assignments = ', '.join(f'"{column}" = EXCLUDED."{column}"' for column in value_columns)
+            conflict_action = f'DO UPDATE SET {assignments} WHERE ({target_values}) IS DISTINCT FROM ({new_values})'
+        else:
+            conflict_action = 'DO NOTHING'
+
+        transaction = connection.begin()
+        try:
+            cursor = connection.connection.cursor()
+            # A temporary table is private to this connection, so concurrent workers do not lock each other,
+            # has no WAL, and is created from the target's current columns and dropped at commit
+            cursor.execute(f'CREATE TEMP TABLE "{staging_table}" '
+                           f'(LIKE "{table_model.name}" INCLUDING DEFAULTS) ON COMMIT DROP')
+
+            self._copy_frame(cursor, table_model, staging_table, data_frame, columns, chunk_size)
+
+            # A batch may hold the same key twice; the row loaded last wins. xmax = 0 marks rows
+            # that were inserted rather than updated
+            cursor.execute(f'WITH merged AS ('
+                           f'INSERT INTO "{table_model.name}" ({column_list}) '
+                           f'SELECT DISTINCT ON ({key_list}) {column_list} FROM "{staging_table}" '
+                           f'ORDER BY {key_list}, ctid DESC '
+                           f'ON CONFLICT ({key_list}) {conflict_action} '
+                           f'RETURNING (xmax = 0) AS inserted) '
+                           f'SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted), '
+                           f'(SELECT count(DISTINCT ({key_list})) FROM "{staging_table}") FROM merged')
+            inserted, updated, staged = cursor.fetchone()
+            cursor.close()
+            transaction.commit()
+
+        except Exception as e:
+            transaction.rollback()
+            print(f"Error merging data into database: {str(e)}")
+            raise
+
+        counts = {'inserted': inserted, 'updated': updated, 'unchanged': staged - inserted - updated}
+        totals = self.merge_counts.setdefault(table_model.name, {'inserted': 0, 'updated': 0, 'unchanged': 0})
+        for name, value in counts.items():
+            totals[name] += value
+        print(f"\n{table_model.name} merge ({policy}): {inserted} inserted, {updated} updated, "
+              f"{counts['unchanged']} unchanged\n")
+        return counts
 
     def _insert_chunked(self, connection, table_model, data_frame, chunk_size, index_elements=None):
+        checkpoint = self.model.etl_checkpoint
+        row_offset = self.row_offsets.get(table_model.name, 0)
+        chunk_ranges = [(start, min(start + chunk_size, len(data_frame)))
+                        for start in range(0, len(data_frame), chunk_size)]
+
+        def prepare(chunk_range):
+            # Serialisation time is measured where it runs, which may be a pipeline worker
+            started = time.perf_counter()
+            prepared_chunk = self._prepare_chunk(table_model, data_frame, chunk_range, row_offset, index_elements,
+                                                 connection.dialect)
+            return prepared_chunk + (time.perf_counter() - started,)
+
         count = 1
         try:
-            for start in range(0, len(data_frame), chunk_size):
-                print(f"\nData Insertion Chunk No: {count}\n")
-                end = min(start + chunk_size, len(data_frame))
-                chunk = data_frame.iloc[start:end].to_dict(orient='records')
-
-                transaction = connection.begin()
-                insert_stmt = pg_insert(table_model).values(chunk)
-                if index_elements:
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=index_elements)
-                else:
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing()
-                connection.execute(on_conflict_stmt)
-                transaction.commit()
+            waited = time.perf_counter()
+            for start_row, end_row, content_hash, prepared, serialise_s in self._iter_prepared_chunks(prepare,
+                                                                                                   chunk_ranges):
+                with self.metrics.stage(f'insert_{table_model.name}', chunk=count, rows_in=end_row - start_row,
+                                        start_row=start_row, end_row=end_row, content_hash=content_hash,
+                                        serialise_s=round(serialise_s, 6),
+                                        wait_s=round(time.perf_counter() - waited, 6)) as record:
+                    if prepared is None:
+                        print(f"\nSkipping committed Chunk No: {count}\n")
+                        record['status'] = 'skipped'
+                    else:
+                        print(f"\nData Insertion Chunk No: {count}\n")
+                        transaction = connection.begin()
+                        statement, params = prepared
+                        connection.exec_driver_sql(statement, params)
 
-                count += 1
+                        # The checkpoint commits atomically with the chunk it describes
+                        if checkpoint is not None:
+                            checkpoint_stmt = pg_insert(checkpoint).values(
+                                table_name=table_model.name, start_row=start_row, end_row=end_row,
+                                content_hash=content_hash
+                            )
+                            connection.execute(checkpoint_stmt.on_conflict_do_update(
+                                index_elements=['table_name', 'start_row', 'end_row'],
+                                set_={'content_hash': checkpoint_stmt.excluded.content_hash, 'committed_at': func.now()}
+                            ))
+                        transaction.commit()
 
-            # Insert remaining rows (less than chunk_size)
-            remaining_rows = len(data_frame) % chunk_size
-            if remaining_rows > 0:
-                print(f"\nInserting remaining {remaining_rows} rows...\n")
-                remaining_chunk = data_frame.tail(remaining_rows).to_dict(orient='records')
-                transaction = connection.begin()
-                insert_stmt = pg_insert(table_model).values(remaining_chunk)
-                if index_elements:
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=index_elements)
-                else:
-                    on_conflict_stmt = insert_stmt.on_conflict_do_nothing()
-                connection.execute(on_conflict_stmt)
-                transaction.commit()
+                count += 1
+                waited = time.perf_counter()
 
         except Exception as e:
-            print(f"Error inserting chunked data into database: {str(e)}")
+            if connection.in_transaction():
+                connection.rollback()
+            print(f"Error inserting chunked data into database at Chunk No {count}: {str(e)}")
             raise
 
+    def _prepare_chunk(self, table_model, data_frame, chunk_range, row_offset, index_elements, dialect):
+        # Slicing, hashing, serialisation and statement compilation for one chunk;
+        # runs on a pipeline worker so it overlaps with the writer's database round trip
+        start, end = chunk_range
+        chunk_frame = data_frame.iloc[start:end]
+        start_row, end_row = row_offset + start, row_offset + end
+        content_hash = frame_hash(chunk_frame)
+
+        if self.committed_chunks.get((table_model.name, start_row, end_row)) == content_hash:
+            return start_row, end_row, content_hash, None
+
+        insert_stmt = pg_insert(table_model).values(chunk_frame.to_dict(orient='records'))
+        if index_elements:
+            on_conflict_stmt = insert_stmt.on_conflict_do_nothing(index_elements=index_elements)
+        else:
+            on_conflict_stmt = insert_stmt.on_conflict_do_nothing()
+        compiled = on_conflict_stmt.compile(dialect=dialect)
+        return start_row, end_row, content_hash, (compiled.string, driver_params(compiled, dialect))
+
+    def _iter_prepared_chunks(self, prepare, chunk_ranges):
+        if self.pipeline_workers < 1:
+            for chunk_range in chunk_ranges:
+                yield prepare(chunk_range)
+            return
+
+        # Bounded producer/consumer pipeline: at most queue_depth prepared chunks wait for the writer
+        executor = ThreadPoolExecutor(max_workers=self.pipeline_workers)
+        pending = deque()
+        try:
+            remaining = iter(chunk_ranges)
+            pending.extend(executor.submit(prepare, chunk_range)
+                           for chunk_range in itertools.islice(remaining, max(self.queue_depth, 1)))
+            while pending:
+                prepared = pending.popleft().result()
+                next_range = next(remaining, None)
+                if next_range is not None:
+                    pending.append(executor.submit(prepare, next_range))
+                yield prepared
+        finally:
+            # Chunks not started yet are dropped when the writer stops early (shutdown's cancel_futures
+            # needs Python 3.9)
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
@@ -0,0 +1,181 @@
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # not available on Windows; peak RSS is then left out of the report
+    resource = None
+
+
+def current_rss():
+    # Resident set size in bytes, from /proc where available
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def frame_rows(data_frame):
+    return None if data_frame is None else len(data_frame)
+
+
+class ETLMetrics:
+    # Records wall time, CPU time, row counts and memory for each ETL stage. Chunk writes are recorded
+    # the same way but kept apart, as the per-chunk trace. Stages can run on several threads at once,
+    # so records are appended under a lock and memory peaks are tracked for every open stage.
+    def __init__(self, report_path=None, trace_path=None, trace_memory=False):
+        self.report_path = report_path
+        self.trace_path = trace_path
+        # tracemalloc slows down allocation-heavy code, so Python heap peaks are opt-in; RSS is always recorded
+        self.trace_memory = trace_memory
+
+        self.lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.stages = []
+        self.chunks = []
+        self.open_stages = []
+
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def options(self):
+        # Settings to rebuild an equivalent collector in a worker process (without output paths)
+        return {'trace_memory': self.trace_memory}
+
+    def _fold_memory_peak(self):
+        # tracemalloc keeps one global peak; fold it into every open stage before it is reset. Without
+        # reset_peak (Python < 3.9) the peak cannot be split between stages, so only the traced sizes
+        # at the stage boundaries are recorded (python_start_bytes, python_delta_bytes).
+        if not self.trace_memory or not hasattr(tracemalloc, 'reset_peak'):
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for record in self.open_stages:
+            record['python_peak_bytes'] = max(record.get('python_peak_bytes', 0), peak)
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name, rows_in=None, chunk=None, **attributes):
+        record = dict(attributes, stage=name, chunk=chunk, process=os.getpid(), thread=threading.current_thread().name,
+                      rows_in=rows_in, rows_out=None, status='ok', rss_start_bytes=current_rss())
+        with self.lock:
+            self._fold_memory_peak()
+            self.open_stages.append(record)
+        if self.trace_memory:
+            record['python_start_bytes'] = tracemalloc.get_traced_memory()[0]
+
+        wall_started = time.perf_counter()
+        # CPU time of this thread only; work handed to pipeline or process workers is not included
+        cpu_started = time.thread_time()
+        record['offset_s'] = round(wall_started - self.started, 6)
+        try:
+            yield record
+        except BaseException as e:
+            record['status'] = 'error'
+            record['error'] = f'{type(e).__name__}: {e}'
+            raise
+        finally:
+            wall = time.perf_counter() - wall_started
+            record['wall_s'] = round(wall, 6)
+            record['cpu_s'] = round(time.thread_time() - cpu_started, 6)
+            rows = record['rows_out'] if record['rows_out'] is not None else record['rows_in']
+            record['rows_per_sec'] = round(rows / wall, 1) if rows is not None and wall > 0 else None
+            record['rss_end_bytes'] = current_rss()
+            if self.trace_memory:
+                # Net Python allocations of the stage (and of stages running beside it on other threads)
+                record['python_delta_bytes'] = tracemalloc.get_traced_memory()[0] - record['python_start_bytes']
+            with self.lock:
+                self._fold_memory_peak()
+                self.open_stages.remove(record)
+                (self.stages if chunk is None else self.chunks).append(record)
+
+    def merge(self, stages, chunks):
+        # Records returned by a partition worker process
+        with self.lock:
+            self.stages.extend(stages)
+            self.chunks.extend(chunks)
+
+    def drain(self):
+        with self.lock:
+            stages, chunks = self.stages, self.chunks
+            self.stages, self.chunks = [], []
+        return stages, chunks
+
+    def summary(self):
+        # Totals per stage name, e.g. all 'write_aggregate_sales' calls of a streaming run together
+        totals = {}
+        for record in self.stages + self.chunks:
+            total = totals.setdefault(record['stage'], {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'rows': 0})
+            total['calls'] += 1
+            total['wall_s'] = round(total['wall_s'] + record['wall_s'], 6)
+            total['cpu_s'] = round(total['cpu_s'] + record['cpu_s'], 6)
+            rows = record['rows_out'] if record['rows_out'] is not None else record['rows_in']
+            total['rows'] += rows or 0
+        return totals
+
+    def report(self):
+        with self.lock:
+            stages = list(self.stages)
+            summary = self.summary()
+            chunk_count = len(self.chunks)
+        return {
+            'started_at': self.started_at.isoformat(),
+            'wall_s': round(time.perf_counter() - self.started, 6),
+            # ru_maxrss: the peak of the whole process so far, not of any one stage
+            'process_rss_peak_bytes': peak_rss(),
+            'chunks': chunk_count,
+            'summary': summary,
+            'stages': sorted(stages, key=lambda record: record['offset_s'])
+        }
+
+    def write_report(self, path=None):
+        path = path or self.report_path
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2, default=str)
+        print(f"\nETL run report written to {path}\n")
+
+    def write_chunk_trace(self, path=None):
+        # One JSON object per line in a stable order, so traces of two runs can be diffed line by line
+        path = path or self.trace_path
+        with self.lock:
+            chunks = sorted(self.chunks, key=lambda record: (record['stage'], record.get('start_row') or 0,
+                                                             record['chunk']))
+        with open(path, 'w') as trace_file:
+            for chunk in chunks:
+                trace_file.write(json.dumps(chunk, sort_keys=True, default=str) + '\n')
+        print(f"\nChunk trace written to {path}\n")
+
+    def finish(self):
+        if self.report_path:
+            self.write_report()
+        if self.trace_path:
+            self.write_chunk_trace()
+
+
+def timed_stage(name=None, rows_in=None, rows_out=None):
+    # Decorator for ETL methods: rows_in/rows_out name the frame attributes counted before and after
+    def decorate(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.metrics.stage(name or method.__name__,
+                                    rows_in=frame_rows(getattr(self, rows_in, None)) if rows_in else None) as record:
+                result = method(self, *args, **kwargs)
+                if rows_out:
+                    record['rows_out'] = frame_rows(getattr(self, rows_out, None))
+            return result
+        return wrapper
+    return decorate
@@ -31,7 +31,7 @@ if __name__ == "__main__":
         # Initialize ETL process
         etl = ETL(db_manager)
         # etl.load_data()
-        # Create tables if they do not exist
+        # Create tables if they do not exist (partition_by='year' or 'month' range-partitions the sales tables)
         # etl.model.create_tables()
         # Load transformed data into database
         # etl.load_to_db()
@@ -1,15 +1,41 @@
-from sqlalchemy import Table, Column, Integer, Float, String, Date, Boolean, MetaData, UniqueConstraint
+from sqlalchemy import Table, Column, Integer, Float, String, Date, DateTime, Boolean, MetaData, UniqueConstraint, Index, \
+    func, text
 from load_dotenv import load_dotenv
+from datetime import date
 
 load_dotenv()
 
+# Partition keys of the range-partitioned sales tables per partition_by setting (see create_tables).
+# aggregate_sales is read by year, month and day, fact_sales by date range
+PARTITION_KEYS = {
+    'year': {'fact_sales': ['date'], 'aggregate_sales': ['year']},
+    'month': {'fact_sales': ['date'], 'aggregate_sales': ['year', 'month']}
+}
+
+
+def dim_date_calendar_columns():
+    # Calendar attributes added to dim_date after its first version; new Column objects on every call,
+    # since a Column can only belong to one Table
+    return [
+        Column('quarter', Integer),
+        Column('iso_year', Integer),
+        Column('iso_week', Integer),
+        Column('day_of_year', Integer),
+        Column('is_payday', Boolean),
+        Column('is_holiday', Boolean)
+    ]
+
+
 class Model:
-    def __init__(self, engine):
+    def __init__(self, engine, reflect=True, metadata=None):
         self.engine = engine
-        self.metadata = MetaData()
+        # metadata already reflected for this engine (DatabaseManager.metadata) is used as is
+        self.metadata = metadata if metadata is not None else MetaData()
 
-        # Reflect existing tables into metadata
-        self.metadata.reflect(bind=self.engine)
+        # Reflect existing tables into metadata; reflect=False starts from an empty schema
+        # (e.g. with a mock engine, where create_tables only builds the table definitions)
+        if reflect and metadata is None:
+            self.metadata.reflect(bind=self.engine)
 
         # Ensure all table attributes are set
         self.dim_oil = self.metadata.tables.get('dim_oil')
@@ -22,21 +48,44 @@ class Model:
         self.aggregate_sales = self.metadata.tables.get('aggregate_sales')
         self.summary_family_sales = self.metadata.tables.get('summary_family_sales')
         self.summary_store_sales = self.metadata.tables.get('summary_store_sales')
+        self.etl_watermark = self.metadata.tables.get('etl_watermark')
+        self.etl_checkpoint = self.metadata.tables.get('etl_checkpoint')
+        self.etl_load_version = self.metadata.tables.get('etl_load_version')
+        self.rollup_sales_daily = self.metadata.tables.get('rollup_sales_daily')
+        self.rollup_sales_monthly = self.metadata.tables.get('rollup_sales_monthly')
+        self.rollup_sales_year_store = self.metadata.tables.get('rollup_sales_year_store')
+        self.rollup_sales_year_family = self.metadata.tables.get('rollup_sales_year_family')
+        self.rollup_sales_daily_total = self.metadata.tables.get('rollup_sales_daily_total')
+
+        # 'year' or 'month' once the sales tables are range-partitioned; partition names are read on first use
+        self.partition_by = self._reflect_partitioning() if reflect else None
+        self.partitions = None
+
+    def create_tables(self, partition_by=None):
+        # partition_by='year' or 'month' creates fact_sales and aggregate_sales range-partitioned, with
+        # indexes on the columns the analysis queries filter and sort by; partitions are added by
+        # ensure_partitions as the ETL sees new dates. Existing tables keep their layout.
+        if partition_by not in (None, *PARTITION_KEYS):
+            raise ValueError(f"Unknown partition_by '{partition_by}', expected 'year' or 'month'.")
+        if partition_by and (self.fact_sales is not None or self.aggregate_sales is not None):
+            print("Sales tables already exist, their partitioning is left unchanged.")
 
-    def create_tables(self):
         tables_to_create = []
 
-        if not self.dim_oil:
+        if self.dim_oil is None:
             self.dim_oil = Table(
                 'dim_oil', self.metadata,
                 Column('id', Integer, primary_key=True, autoincrement=True),
                 Column('date', Date),
                 Column('price', Float),
-                Column('year', Integer)
+                Column('year', Integer),
+                UniqueConstraint('date', name='uq_dim_oil_date')
             )
             tables_to_create.append(self.dim_oil)
+        else:
+            self._add_missing_unique(self.dim_oil, 'uq_dim_oil_date', ['date'])
 
-        if not self.dim_store:
+        if self.dim_store is None:
             self.dim_store = Table(
                 'dim_store', self.metadata,
                 Column('store_nbr', Integer, primary_key=True),
@@ -47,7 +96,7 @@ class Model:
             )
             tables_to_create.append(self.dim_store)
 
-        if not self.dim_product_family:
+        if self.dim_product_family is None:
             self.dim_product_family = Table(
                 'dim_product_family', self.metadata,
                 Column('family_id', Integer, primary_key=True),
@@ -55,7 +104,7 @@ class Model:
             )
             tables_to_create.append(self.dim_product_family)
 
-        if not self.dim_date:
+        if self.dim_date is None:
             self.dim_date = Table(
                 'dim_date', self.metadata,
                 Column('date', Date, primary_key=True),
@@ -63,11 +112,14 @@ class Model:
                 Column('month', Integer),
                 Column('day', Integer),
                 Column('weekday', Integer),
-                Column('is_weekend', Boolean)
+                Column('is_weekend', Boolean),
+                *dim_date_calendar_columns()
             )
             tables_to_create.append(self.dim_date)
+        else:
+            self._add_missing_columns(self.dim_date, dim_date_calendar_columns())
 
-        if not self.dim_holiday:
+        if self.dim_holiday is None:
             self.dim_holiday = Table(
                 'dim_holiday', self.metadata,
                 Column('date', Date, primary_key=True),
@@ -83,7 +135,7 @@ class Model:
             )
             tables_to_create.append(self.dim_holiday)
 
-        if not self.dim_city_state:
+        if self.dim_city_state is None:
             self.dim_city_state = Table(
                 'dim_city_state', self.metadata,
                 Column('location_id', Integer, primary_key=True),
@@ -93,7 +145,7 @@ class Model:
             )
             tables_to_create.append(self.dim_city_state)
 
-        if not self.fact_sales:
+        if self.fact_sales is None:
             self.fact_sales = Table(
                 'fact_sales', self.metadata,
                 Column('date', Date),
@@ -101,11 +153,12 @@ class Model:
                 Column('family_id', Integer),
                 Column('sales', Float),
                 Column('onpromotion', Integer),
-                UniqueConstraint('date', 'store_nbr', 'family_id', name='uq_fact_sales')
+                *self._sales_layout('fact_sales', partition_by),
+                **self._partition_options('fact_sales', partition_by)
             )
             tables_to_create.append(self.fact_sales)
 
-        if not self.aggregate_sales:
+        if self.aggregate_sales is None:
             self.aggregate_sales = Table(
                 'aggregate_sales', self.metadata,
                 Column('date', Date),
@@ -124,11 +177,13 @@ class Model:
                 Column('family_name', String),
                 Column('sale_amount', Float),
                 Column('onpromotion', Integer),
-                UniqueConstraint('date', 'store_nbr', 'family_id', name='uq_aggregate_sales')
+                *self._sales_layout('aggregate_sales', partition_by),
+                **self._partition_options('aggregate_sales', partition_by)
             )
             tables_to_create.append(self.aggregate_sales)
+            self.partition_by = partition_by
 
-        if not self.summary_family_sales:
+        if self.summary_family_sales is None:
             self.summary_family_sales = Table(
                 'summary_family_sales', self.metadata,
                 Column('family_id', Integer),
@@ -143,7 +198,7 @@ class Model:
             )
             tables_to_create.append(self.summary_family_sales)
 
-        if not self.summary_store_sales:
+        if self.summary_store_sales is None:
             self.summary_store_sales = Table(
                 'summary_store_sales', self.metadata,
                 Column('store_nbr', Integer),
@@ -157,9 +212,243 @@ class Model:
             )
             tables_to_create.append(self.summary_family_sales)
 
+        if self.etl_watermark is None:
+            # High-water mark per source file for incremental ETL runs
+            self.etl_watermark = Table(
+                'etl_watermark', self.metadata,
+                Column('source_file', String, primary_key=True),
+                Column('max_date', Date),
+                Column('checksum', String),
+                Column('updated_at', DateTime, server_default=func.now())
+            )
+            tables_to_create.append(self.etl_watermark)
+
+        if self.etl_checkpoint is None:
+            # Committed chunks of chunked loads, so a failed load can resume where it stopped
+            self.etl_checkpoint = Table(
+                'etl_checkpoint', self.metadata,
+                Column('table_name', String),
+                Column('start_row', Integer),
+                Column('end_row', Integer),
+                Column('content_hash', String),
+                Column('committed_at', DateTime, server_default=func.now()),
+                UniqueConstraint('table_name', 'start_row', 'end_row', name='uq_etl_checkpoint')
+            )
+            tables_to_create.append(self.etl_checkpoint)
+
+        if self.etl_load_version is None:
+            # Bumped per table by every load that changes it; cached query results are keyed on it
+            self.etl_load_version = Table(
+                'etl_load_version', self.metadata,
+                Column('table_name', String, primary_key=True),
+                Column('version', Integer, nullable=False),
+                Column('loaded_at', DateTime, server_default=func.now())
+            )
+            tables_to_create.append(self.etl_load_version)
+
+        # Sales rollups maintained by the ETL (see salesRollups.py); unique keys rather than primary keys,
+        # since sales rows without a matching store or family are rolled up under NULL
+        if self.rollup_sales_daily is None:
+            self.rollup_sales_daily = Table(
+                'rollup_sales_daily', self.metadata,
+                Column('date', Date),
+                Column('year', Integer),
+                Column('month', Integer),
+                Column('store_nbr', Integer),
+                Column('family_id', Integer),
+                Column('sale_amount', Float),
+                Column('onpromotion', Integer),
+                UniqueConstraint('date', 'store_nbr', 'family_id', name='uq_rollup_sales_daily')
+            )
+            tables_to_create.append(self.rollup_sales_daily)
+
+        if self.rollup_sales_monthly is None:
+            self.rollup_sales_monthly = Table(
+                'rollup_sales_monthly', self.metadata,
+                Column('year', Integer),
+                Column('month', Integer),
+                Column('store_nbr', Integer),
+                Column('family_id', Integer),
+                Column('sale_amount', Float),
+                Column('onpromotion', Integer),
+                UniqueConstraint('year', 'month', 'store_nbr', 'family_id', name='uq_rollup_sales_monthly')
+            )
+            tables_to_create.append(self.rollup_sales_monthly)
+
+        if self.rollup_sales_year_store is None:
+            self.rollup_sales_year_store = Table(
+                'rollup_sales_year_store', self.metadata,
+                Column('year', Integer),
+                Column('store_nbr', Integer),
+                Column('sale_amount', Float),
+                Column('onpromotion', Integer),
+                UniqueConstraint('year', 'store_nbr', name='uq_rollup_sales_year_store')
+            )
+            tables_to_create.append(self.rollup_sales_year_store)
+
+        if self.rollup_sales_year_family is None:
+            self.rollup_sales_year_family = Table(
+                'rollup_sales_year_family', self.metadata,
+                Column('year', Integer),
+                Column('family_id', Integer),
+                Column('family_name', String),
+                Column('sale_amount', Float),
+                Column('onpromotion', Integer),
+                UniqueConstraint('year', 'family_id', name='uq_rollup_sales_year_family')
+            )
+            tables_to_create.append(self.rollup_sales_year_family)
+
+        if self.rollup_sales_daily_total is None:
+            self.rollup_sales_daily_total = Table(
+                'rollup_sales_daily_total', self.metadata,
+                Column('date', Date, primary_key=True),
+                Column('year', Integer),
+                Column('month', Integer),
+                Column('sale_amount', Float),
+                Column('onpromotion', Integer)
+            )
+            tables_to_create.append(self.rollup_sales_daily_total)
+
         if tables_to_create:
             self.metadata.create_all(self.engine)
             print("Tables created successfully.")
         else:
             print("All tables already exist. Skipping table creation.")
 
+    def _add_missing_columns(self, table, columns):
+        # Tables created by an earlier version gain the new columns in place, existing rows get NULLs
+        missing = [column for column in columns if column.name not in table.c]
+        if not missing:
+            return
+
+        with self.engine.begin() as connection:
+            for column in missing:
+                column_type = column.type.compile(dialect=self.engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column.name} {column_type}'))
+                table.append_column(column)
+        print(f"Added columns {[column.name for column in missing]} to {table.name}.")
+
+    def _add_missing_unique(self, table, name, columns):
+        # Conflict targets need a unique constraint. Older tables may hold duplicate keys from loads
+        # without one; those are reported, not removed (see remove_duplicates)
+        if any(set(constraint.columns.keys()) == set(columns) for constraint in table.constraints
+               if isinstance(constraint, UniqueConstraint)):
+            return
+
+        key_list = ', '.join(columns)
+        with self.engine.begin() as connection:
+            duplicates = connection.execute(text(
+                f'SELECT {key_list} FROM {table.name} GROUP BY {key_list} HAVING count(*) > 1 ORDER BY {key_list}'
+            )).all()
+            if duplicates:
+                shown = ', '.join(str(row[0]) if len(row) == 1 else str(tuple(row)) for row in duplicates[:20])
+                more = f' and {len(duplicates) - 20} more' if len(duplicates) > 20 else ''
+                raise ValueError(
+                    f"Cannot add unique constraint {name}: {table.name} has duplicate rows for {key_list} "
+                    f"{shown}{more}. Remove them (Model.remove_duplicates('{table.name}', {columns}) keeps the "
+                    f"first row of each) and run create_tables again."
+                )
+            connection.execute(text(f'ALTER TABLE {table.name} ADD CONSTRAINT {name} UNIQUE ({key_list})'))
+        table.append_constraint(UniqueConstraint(*columns, name=name))
+        print(f"Added unique constraint {name} to {table.name}.")
+
+    def remove_duplicates(self, table_name, columns):
+        # Explicit migration step: keeps the first stored row of each key of columns and deletes the others.
+        # Returns the number of rows deleted.
+        key_match = ' AND '.join(f'kept.{column} = duplicate.{column}' for column in columns)
+        with self.engine.begin() as connection:
+            removed = connection.execute(text(
+                f'DELETE FROM {table_name} duplicate USING {table_name} kept '
+                f'WHERE {key_match} AND duplicate.ctid > kept.ctid'
+            )).rowcount
+        print(f"Removed {removed} duplicate rows from {table_name}.")
+        return removed
+
+    def _sales_layout(self, table_name, partition_by):
+        # Unique key and indexes of a sales table. On a partitioned table the unique key has to include
+        # the partition key, which for aggregate_sales adds year (and month), both functions of date
+        key = ['date', 'store_nbr', 'family_id']
+        if not partition_by:
+            return [UniqueConstraint(*key, name=f'uq_{table_name}')]
+
+        key += [column for column in PARTITION_KEYS[partition_by][table_name] if column not in key]
+        layout = [
+            UniqueConstraint(*key, name=f'uq_{table_name}'),
+            Index(f'ix_{table_name}_date_brin', 'date', postgresql_using='brin')
+        ]
+        if table_name == 'aggregate_sales':
+            layout += [
+                Index('ix_aggregate_sales_year_sale_amount', 'year', 'sale_amount'),
+                Index('ix_aggregate_sales_store_year', 'store_nbr', 'year'),
+                Index('ix_aggregate_sales_family_year', 'family_id', 'year'),
+                Index('ix_aggregate_sales_year_month_day', 'year', 'month', 'day')
+            ]
+        return layout
+
+    @staticmethod
+    def _partition_options(table_name, partition_by):
+        if not partition_by:
+            return {}
+        return {'postgresql_partition_by': f"RANGE ({', '.join(PARTITION_KEYS[partition_by][table_name])})"}
+
+    def _reflect_partitioning(self):
+        # Recovers partition_by from the partition key of an existing aggregate_sales
+        if self.aggregate_sales is None or self.engine.dialect.name != 'postgresql':
+            return None
+        with self.engine.connect() as connection:
+            partition_key = connection.execute(text("SELECT pg_get_partkeydef(to_regclass('aggregate_sales'))")).scalar()
+        for partition_by, keys in PARTITION_KEYS.items():
+            if partition_key == f"RANGE ({', '.join(keys['aggregate_sales'])})":
+                return partition_by
+        return None
+
+    def conflict_key(self, table, name=None):
+        # Columns of the table's uq_<name> constraint (or the named one), the conflict target for upserts;
+        # None when the table does not have it
+        for constraint in table.constraints:
+            if isinstance(constraint, UniqueConstraint) and constraint.name == (name or f'uq_{table.name}'):
+                return list(constraint.columns.keys())
+        return None
+
+    def ensure_partitions(self, table, first_date, last_date):
+        # Creates the missing year or month partitions of a sales table between first_date and last_date;
+        # a no-op for tables that are not partitioned. Returns the names of the partitions created.
+        if not self.partition_by or table.name not in PARTITION_KEYS[self.partition_by] or first_date is None:
+            return []
+        if self.partitions is None:
+            self.partitions = self._existing_partitions()
+
+        missing = [(name, bounds) for name, bounds in self._partition_bounds(table.name, first_date, last_date)
+                   if name not in self.partitions]
+        if not missing:
+            return []
+
+        with self.engine.begin() as connection:
+            for name, bounds in missing:
+                connection.execute(text(f'CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table.name} {bounds}'))
+        self.partitions.update(name for name, bounds in missing)
+        print(f"Created partitions {[name for name, bounds in missing]} of {table.name}.")
+        return [name for name, bounds in missing]
+
+    def _existing_partitions(self):
+        with self.engine.connect() as connection:
+            return set(connection.execute(text(
+                "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE pg_inherits.inhparent IN (to_regclass('fact_sales'), to_regclass('aggregate_sales'))"
+            )).scalars())
+
+    def _partition_bounds(self, table_name, first_date, last_date):
+        # (partition name, FOR VALUES clause) for every year or month from first_date to last_date
+        step = 12 if self.partition_by == 'year' else 1
+        period = first_date.year * 12 + (first_date.month - 1 if step == 1 else 0)
+        while period <= last_date.year * 12 + last_date.month - 1:
+            (year, month), (next_year, next_month) = divmod(period, 12), divmod(period + step, 12)
+            name = f'{table_name}_{year}' if step == 12 else f'{table_name}_{year}_{month + 1:02d}'
+            if table_name == 'fact_sales':
+                bounds = f"FROM ('{date(year, month + 1, 1)}') TO ('{date(next_year, next_month + 1, 1)}')"
+            elif step == 12:
+                bounds = f'FROM ({year}) TO ({next_year})'
+            else:
+                bounds = f'FROM ({year}, {month + 1}) TO ({next_year}, {next_month + 1})'
+            yield name, f'FOR VALUES {bounds}'
+            period += step
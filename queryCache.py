@@ -0,0 +1,225 @@
+import hashlib
+import os
+import pickle
+import re
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.sql.util import find_tables
+from atomicFile import write_pickle
+
+# Query result cache. Results are keyed by the normalised SQL, its parameters and the current load
+# version of every table the query reads; ETL.load_to_db bumps the version of each table it changes
+# (etl_load_version), so a cached result is served until its data actually changes, and a load makes
+# the old entries unreachable. Entries live in an in-memory LRU tier bounded by size and, optionally,
+# in an on-disk tier shared by all processes using the same directory.
+# Settings come from QUERY_CACHE_MB (0 turns caching off), QUERY_CACHE_DIR (the disk tier, off when
+# unset), QUERY_CACHE_DISK_MB and QUERY_CACHE_VERSION_TTL (seconds between reads of the versions).
+
+LOAD_VERSION_TABLE = 'etl_load_version'
+
+_QUOTED = re.compile(r"('(?:[^']|'')*')")
+_TABLE_REFERENCE = re.compile(r'\b(?:from|join)\s+((?:"[^"]+"|[\w$]+)(?:\.(?:"[^"]+"|[\w$]+))?)', re.IGNORECASE)
+
+
+def normalise_sql(sql):
+    # Collapses whitespace outside string literals and drops a trailing semicolon, so the same query
+    # written with different layout shares one cache entry
+    parts = _QUOTED.split(sql.strip().rstrip(';'))
+    return ''.join(part if index % 2 else re.sub(r'\s+', ' ', part) for index, part in enumerate(parts)).strip()
+
+
+def referenced_tables(sql):
+    # Table names after FROM/JOIN, without schema or quotes; subqueries and functions are skipped
+    tables = set()
+    for reference in _TABLE_REFERENCE.findall(sql):
+        name = reference.split('.')[-1].strip('"')
+        if name.lower() != 'select':
+            tables.add(name)
+    return tables
+
+
+def statement_tables(query):
+    # Tables a query reads: from the statement itself, or parsed from SQL text
+    if isinstance(query, str):
+        return referenced_tables(query)
+    return {table.name for table in find_tables(query, include_crud=True) if hasattr(table, 'name')}
+
+
+def bump_load_versions(connection, load_versions, table_names):
+    # Run by every writer inside the transaction that changed the tables; load_versions is
+    # Model.etl_load_version (None before create_tables, when there is nothing to bump)
+    if load_versions is None or not table_names:
+        return
+    insert_stmt = pg_insert(load_versions).values([{'table_name': name, 'version': 1} for name in sorted(table_names)])
+    connection.execute(insert_stmt.on_conflict_do_update(
+        index_elements=['table_name'],
+        set_={'version': load_versions.c.version + 1, 'loaded_at': func.now()}
+    ))
+
+
+class QueryCache:
+    def __init__(self, max_bytes=256 * 2 ** 20, disk_dir=None, disk_max_bytes=2 * 2 ** 30, version_ttl=1.0):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        # Table versions are re-read at most every version_ttl seconds (0 checks on every query)
+        self.version_ttl = version_ttl
+
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # key -> (result, size in bytes)
+        self.size = 0
+        self.versions = None
+        self.versions_read_at = None
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'uncached': 0, 'evictions': 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    @classmethod
+    def from_env(cls):
+        max_mb = float(os.getenv('QUERY_CACHE_MB', '256'))
+        if max_mb <= 0:
+            return None
+        return cls(max_bytes=int(max_mb * 2 ** 20), disk_dir=os.getenv('QUERY_CACHE_DIR') or None,
+                   disk_max_bytes=int(float(os.getenv('QUERY_CACHE_DISK_MB', '2048')) * 2 ** 20),
+                   version_ttl=float(os.getenv('QUERY_CACHE_VERSION_TTL', '1.0')))
+
+    def fetch(self, engine, query, params, tables, load):
+        # Returns the cached result of query, or load() stored under the current table versions.
+        # Results are copied on the way out, as callers modify the frames they get.
+        versions = self._table_versions(engine, tables)
+        if versions is None:
+            # Without load versions there is nothing to invalidate on, so results are not cached
+            with self.lock:
+                self.stats['uncached'] += 1
+            return load()
+
+        key = self._key(engine, query, params, versions)
+        result = self._get(key)
+        if result is None:
+            result = load()
+            self._put(key, result)
+        return result.copy()
+
+    def _key(self, engine, query, params, versions):
+        if isinstance(query, str):
+            sql, bound = normalise_sql(query), dict(params or {})
+        else:
+            compiled = query.compile(dialect=engine.dialect)
+            sql, bound = normalise_sql(compiled.string), compiled.construct_params(params)
+        payload = repr((str(engine.url), sql, sorted(bound.items()), sorted(versions.items())))
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _table_versions(self, engine, tables):
+        now = time.monotonic()
+        with self.lock:
+            fresh = self.versions_read_at is not None and now - self.versions_read_at < self.version_ttl
+            versions = self.versions
+        if not fresh:
+            versions = self._read_versions(engine)
+            with self.lock:
+                self.versions, self.versions_read_at = versions, now
+        if versions is None:
+            return None
+        return {table: versions.get(table, 0) for table in tables}
+
+    def _read_versions(self, engine):
+        with engine.connect() as connection:
+            if not connection.dialect.has_table(connection, LOAD_VERSION_TABLE):
+                return None
+            rows = connection.execute(text(f'SELECT table_name, version FROM {LOAD_VERSION_TABLE}')).all()
+        return dict(rows)
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[0]
+
+        result = self._read_disk(key)
+        with self.lock:
+            if result is None:
+                self.stats['misses'] += 1
+                return None
+            self.stats['disk_hits'] += 1
+        self._remember(key, result)
+        return result
+
+    def _put(self, key, result):
+        self._remember(key, result)
+        self._write_disk(key, result)
+
+    def _remember(self, key, result):
+        size = int(result.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.entries:
+                self.size -= self.entries.pop(key)[1]
+            self.entries[key] = (result, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                self.size -= self.entries.popitem(last=False)[1][1]
+                self.stats['evictions'] += 1
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.pickle')
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, 'rb') as cache_file:
+                result = pickle.load(cache_file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable query cache entry {path}: {e}")
+            return None
+        # Touched on read, so disk eviction removes the least recently used entries
+        os.utime(path)
+        return result
+
+    def _write_disk(self, key, result):
+        if not self.disk_dir:
+            return
+        try:
+            write_pickle(self._disk_path(key), result)
+            self._evict_disk()
+        except OSError as e:
+            print(f"Could not write query cache entry: {e}")
+
+    def _evict_disk(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if name.endswith('.pickle'):
+                stat = os.stat(os.path.join(self.disk_dir, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def expire_versions(self):
+        # The next query re-reads the table versions; a writer in this process calls it after a load,
+        # so its own readers do not wait out version_ttl
+        with self.lock:
+            self.versions_read_at = None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+            self.versions_read_at = None
+
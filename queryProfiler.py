@@ -0,0 +1,373 @@
+import argparse
+import atexit
+import heapq
+import itertools
+import json
+import math
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import event
+from envSettings import read_settings
+
+# Opt-in SQL profiling on the shared engines. Cursor execute events record the latency, rows returned
+# and calling function (module.function) of every statement; statements are grouped by their text with
+# literals replaced, and summarised by calls, total time and latency percentiles. Statements slower
+# than slow_ms are kept with their EXPLAIN (ANALYZE, BUFFERS) plan, sampled and capped per process.
+#
+# QUERY_PROFILE=1 attaches the process profiler to every engine engineRegistry creates; the other
+# QUERY_PROFILE_* settings below tune it, and QUERY_PROFILE_REPORT writes the JSON report at exit.
+# A saved report is printed with:
+#
+#   python queryProfiler.py query_profile.json --top 10 --sort p95
+PROFILE_SETTINGS = {
+    'slow_ms': ('QUERY_PROFILE_SLOW_MS', float, 500.0),
+    'top_n': ('QUERY_PROFILE_TOP_N', int, 20),
+    'explain_rate': ('QUERY_PROFILE_EXPLAIN_RATE', float, 1.0),
+    'max_explains': ('QUERY_PROFILE_MAX_EXPLAINS', int, 20),
+    'explain_timeout_ms': ('QUERY_PROFILE_EXPLAIN_TIMEOUT_MS', int, 10000),
+    'report_path': ('QUERY_PROFILE_REPORT', str, None)
+}
+
+# Latencies kept per statement for the percentiles (a uniform sample once there are more calls)
+LATENCY_SAMPLES = 2000
+PERCENTILES = (50, 90, 95, 99)
+# Slow statements kept with their parameters and plans; later ones are only counted
+SLOW_QUERY_LIMIT = 1000
+
+# Frames of these modules are skipped when looking for the code that issued a statement
+_INTERNAL_MODULES = ('sqlalchemy', 'pandas', 'psycopg2', 'contextlib', 'concurrent', 'threading', 'queryProfiler',
+                     'queryStream', 'queryCache', 'connectDb', 'engineRegistry')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_EXPLAINABLE = re.compile(r'^\s*(select|with|values|table)\b', re.IGNORECASE)
+# Reads that write (data-modifying CTEs, SELECT INTO) or lock rows (FOR UPDATE/SHARE) are never re-run
+_WRITES_OR_LOCKS = re.compile(r'\b(insert|update|delete|merge|into|for\s+(no\s+key\s+update|key\s+share|share))\b',
+                              re.IGNORECASE)
+_QUOTED = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"")
+
+_lock = threading.Lock()
+_profiler = None
+
+
+def statement_fingerprint(statement):
+    # Statements differing only in literal values (f-string SQL, LIMIT 12000) are grouped together
+    return ' '.join(_LITERALS.sub('?', statement).split())
+
+
+def explainable(statement):
+    # Plain reads only: EXPLAIN ANALYZE executes the statement again, while the caller's transaction
+    # may still hold its locks. Keywords inside string literals and quoted names do not count.
+    unquoted = _QUOTED.sub("''", statement)
+    return _EXPLAINABLE.match(unquoted) is not None and _WRITES_OR_LOCKS.search(unquoted) is None
+
+
+def find_caller():
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.split('.')[0] not in _INTERNAL_MODULES:
+            # co_qualname (with the class name) is only there from Python 3.11
+            code = frame.f_code
+            return f"{module}.{getattr(code, 'co_qualname', code.co_name)}"
+        frame = frame.f_back
+    return None
+
+
+def percentile(sorted_values, percent):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    rank = math.ceil(percent * len(sorted_values) / 100)
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class StatementStats:
+    def __init__(self, fingerprint):
+        self.fingerprint = fingerprint
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.latencies = []
+        self.callers = {}
+
+    def add(self, elapsed_ms, rows, caller):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.rows += rows or 0
+        self.callers[caller] = self.callers.get(caller, 0) + 1
+        # Reservoir sample: every call has the same chance of being among the kept latencies
+        if len(self.latencies) < LATENCY_SAMPLES:
+            self.latencies.append(elapsed_ms)
+        else:
+            slot = random.randrange(self.calls)
+            if slot < LATENCY_SAMPLES:
+                self.latencies[slot] = elapsed_ms
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        record = {
+            'statement': self.fingerprint,
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3) if self.calls else None,
+            'max_ms': round(self.max_ms, 3),
+            'rows': self.rows,
+            'callers': dict(sorted(self.callers.items(), key=lambda item: -item[1]))
+        }
+        for percent in PERCENTILES:
+            value = percentile(latencies, percent)
+            record[f'p{percent}_ms'] = round(value, 3) if value is not None else None
+        return record
+
+
+class QueryProfiler:
+    def __init__(self, slow_ms=500.0, top_n=20, explain_rate=1.0, max_explains=20, explain_timeout_ms=10000,
+                 report_path=None):
+        self.slow_ms = slow_ms
+        self.top_n = top_n
+        # Share of slow statements that are explained; EXPLAIN ANALYZE runs the statement again
+        self.explain_rate = explain_rate
+        self.max_explains = max_explains
+        # An explain that waits on the caller's locks or runs long is cancelled after this
+        self.explain_timeout_ms = explain_timeout_ms
+        self.report_path = report_path
+
+        self.lock = threading.Lock()
+        self.started_at = datetime.now()
+        self.started = time.perf_counter()
+        self.statements = {}
+        self.slowest = []  # heap of the top_n slowest executions
+        self.slow_queries = []
+        self.slow_dropped = 0
+        self.explains = 0
+        self.sequence = itertools.count()
+        self.engines = []
+
+    @classmethod
+    def from_env(cls):
+        return cls(**read_settings(PROFILE_SETTINGS))
+
+    def attach(self, engine):
+        with self.lock:
+            if engine in self.engines:
+                return self
+            self.engines.append(engine)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.listen(engine, 'handle_error', self._handle_error)
+        return self
+
+    def detach(self, engine):
+        with self.lock:
+            if engine not in self.engines:
+                return
+            self.engines.remove(engine)
+        event.remove(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.remove(engine, 'after_cursor_execute', self._after_cursor_execute)
+        event.remove(engine, 'handle_error', self._handle_error)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._profiler_started = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_profiler_started', None)
+        if started is None:
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        # rowcount is the number of rows returned for client-side cursors, -1 for server-side ones
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        caller = find_caller()
+        fingerprint = statement_fingerprint(statement)
+
+        with self.lock:
+            stats = self.statements.get(fingerprint)
+            if stats is None:
+                stats = self.statements[fingerprint] = StatementStats(fingerprint)
+            stats.add(elapsed_ms, rows, caller)
+
+            # The sequence number breaks ties, so the heap never compares the other fields
+            execution = (elapsed_ms, next(self.sequence), fingerprint, caller, rows)
+            if len(self.slowest) < self.top_n:
+                heapq.heappush(self.slowest, execution)
+            elif elapsed_ms > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, execution)
+
+            explain = elapsed_ms >= self.slow_ms and not executemany and self.explains < self.max_explains \
+                and random.random() < self.explain_rate and explainable(statement)
+            if explain:
+                self.explains += 1
+
+        if elapsed_ms >= self.slow_ms:
+            slow_query = {
+                'at': datetime.now().isoformat(),
+                'statement': statement,
+                'parameters': _short_repr(parameters),
+                'caller': caller,
+                'elapsed_ms': round(elapsed_ms, 3),
+                'rows': rows
+            }
+            if explain:
+                slow_query.update(self._explain(conn, statement, parameters))
+            with self.lock:
+                if len(self.slow_queries) < SLOW_QUERY_LIMIT:
+                    self.slow_queries.append(slow_query)
+                else:
+                    self.slow_dropped += 1
+
+    def _handle_error(self, exception_context):
+        context = exception_context.execution_context
+        if context is None or getattr(context, '_profiler_started', None) is None:
+            return
+        fingerprint = statement_fingerprint(exception_context.statement or '')
+        with self.lock:
+            stats = self.statements.get(fingerprint)
+            if stats is None:
+                stats = self.statements[fingerprint] = StatementStats(fingerprint)
+            stats.errors += 1
+
+    def _explain(self, conn, statement, parameters):
+        # Runs on a separate pooled connection (its cursor does not fire engine events), so the caller's
+        # result is left unread; statements that depend on the caller's transaction, such as reads of
+        # temporary tables, cannot be explained there and report the error instead
+        if conn.dialect.name != 'postgresql':
+            return {'plan_error': f'EXPLAIN plans are only sampled on PostgreSQL, not {conn.dialect.name}'}
+        started = time.perf_counter()
+        raw_connection = conn.engine.raw_connection()
+        try:
+            cursor = raw_connection.cursor()
+            # Read-only and time-limited, so a statement that slipped past explainable() cannot write,
+            # and one blocked by the caller's own locks does not hang the caller
+            cursor.execute('SET TRANSACTION READ ONLY')
+            cursor.execute('SELECT set_config(%s, %s, true), set_config(%s, %s, true)',
+                           ('statement_timeout', str(self.explain_timeout_ms),
+                            'lock_timeout', str(self.explain_timeout_ms)))
+            # Parameters exactly as the driver got them: an empty dict still means %% escapes in the statement
+            if not isinstance(parameters, dict):
+                parameters = parameters or None
+            cursor.execute(f'EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {statement}', parameters)
+            plan = cursor.fetchone()[0]
+            cursor.close()
+            return {'plan': plan, 'explain_ms': round((time.perf_counter() - started) * 1000, 3)}
+        except Exception as e:
+            return {'plan_error': f'{type(e).__name__}: {e}'}
+        finally:
+            raw_connection.rollback()
+            raw_connection.close()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.now()
+            self.started = time.perf_counter()
+            self.statements = {}
+            self.slowest = []
+            self.slow_queries = []
+            self.slow_dropped = 0
+            self.explains = 0
+
+    def report(self, sort='total_ms'):
+        with self.lock:
+            statements = [stats.summary() for stats in self.statements.values()]
+            slowest = sorted(self.slowest, reverse=True)
+            slow_queries = list(self.slow_queries)
+            slow_dropped = self.slow_dropped
+        statements.sort(key=lambda record: -(record[sort] or 0))
+        return {
+            'started_at': self.started_at.isoformat(),
+            'wall_s': round(time.perf_counter() - self.started, 6),
+            'slow_ms': self.slow_ms,
+            'statements': len(statements),
+            'calls': sum(record['calls'] for record in statements),
+            'total_ms': round(sum(record['total_ms'] for record in statements), 3),
+            'top_statements': statements[:self.top_n],
+            'slowest_executions': [
+                {'elapsed_ms': round(elapsed_ms, 3), 'statement': fingerprint, 'caller': caller, 'rows': rows}
+                for elapsed_ms, _, fingerprint, caller, rows in slowest
+            ],
+            'slow_queries': slow_queries,
+            'slow_queries_dropped': slow_dropped
+        }
+
+    def write_report(self, path=None):
+        path = path or self.report_path
+        with open(path, 'w') as report_file:
+            json.dump(self.report(), report_file, indent=2, default=str)
+        print(f"\nQuery profile written to {path}\n")
+
+
+def _short_repr(parameters, limit=500):
+    text = repr(parameters)
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+def get_profiler():
+    # The process profiler, configured from the environment on first use
+    global _profiler
+    with _lock:
+        if _profiler is None:
+            _profiler = QueryProfiler.from_env()
+            if _profiler.report_path:
+                atexit.register(_profiler.write_report)
+        return _profiler
+
+
+def profiling_enabled():
+    return os.getenv('QUERY_PROFILE', '').lower() in ('1', 'true', 'yes')
+
+
+def print_report(report, top=10, sort='total_ms'):
+    statements = sorted(report['top_statements'], key=lambda record: -(record.get(sort) or 0))[:top]
+    print(f"Query profile from {report['started_at']}: {report['calls']} calls of {report['statements']} "
+          f"statements, {report['total_ms']:.1f} ms in total\n")
+    print(f"{'calls':>7} {'total ms':>10} {'mean':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8} {'rows':>9}  statement")
+    for record in statements:
+        # Statements that only failed have no latencies
+        latencies = ' '.join(f"{record[name]:>8.1f}" if record[name] is not None else f"{'-':>8}"
+                             for name in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+        errors = f" ({record['errors']} failed)" if record['errors'] else ''
+        print(f"{record['calls']:>7} {record['total_ms']:>10.1f} {latencies} {record['rows']:>9}  "
+              f"{record['statement'][:100]}{errors}")
+        for caller, calls in list(record['callers'].items())[:3]:
+            print(f"{'':>71}  <- {caller} ({calls})")
+
+    if report['slow_queries']:
+        print(f"\nStatements over {report['slow_ms']} ms:")
+        for slow_query in sorted(report['slow_queries'], key=lambda record: -record['elapsed_ms'])[:top]:
+            print(f"\n  {slow_query['elapsed_ms']:.1f} ms, {slow_query['rows']} rows, from {slow_query['caller']}")
+            print(f"  {' '.join(slow_query['statement'].split())[:200]}")
+            if 'plan' in slow_query:
+                plan = slow_query['plan'][0]
+                node = plan['Plan']
+                print(f"  plan: {node['Node Type']}, execution {plan.get('Execution Time')} ms, "
+                      f"shared hit/read {node.get('Shared Hit Blocks')}/{node.get('Shared Read Blocks')} blocks")
+            elif 'plan_error' in slow_query:
+                print(f"  plan: {slow_query['plan_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print a saved query profile report.')
+    parser.add_argument('report', help='JSON report written by QueryProfiler.write_report')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--sort', default='total_ms',
+                        choices=['total_ms', 'calls', 'mean_ms', 'p95_ms', 'p99_ms', 'max_ms', 'rows'])
+    parser.add_argument('--json', action='store_true', help='print the report as JSON instead')
+    args = parser.parse_args()
+
+    with open(args.report) as report_file:
+        report = json.load(report_file)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, top=args.top, sort=args.sort)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import io
+from contextlib import nullcontext
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # pyarrow is optional; only output='arrow' needs it
+    pa = None
+    pa_csv = None
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# PostgreSQL type OIDs that COPY's text output does not carry: dates and timestamps are parsed,
+# booleans arrive as t/f, floats may be NaN/Infinity, text must not be type-inferred
+DATE_TYPES = {1082: 'date', 1114: 'timestamp', 1184: 'timestamptz'}
+BOOLEAN_TYPE = 16
+FLOAT_TYPES = {700, 701, 1700}
+TEXT_TYPES = {25, 1042, 1043}
+COPY_NULL = '\\N'
+
+# How a per-chunk partial result is computed and how partials of several chunks are combined
+PARTIAL_AGGREGATES = {
+    'sum': ('sum', 'sum'),
+    'count': ('count', 'sum'),
+    'min': ('min', 'min'),
+    'max': ('max', 'max')
+}
+
+
+def iter_query_chunks(connectable, query, params=None, chunk_size=DEFAULT_CHUNK_SIZE, output='pandas'):
+    # Runs query (SQL text or a SQLAlchemy statement) on a server-side cursor and yields DataFrames,
+    # or pyarrow RecordBatches with output='arrow', of up to chunk_size rows. Only one chunk of rows is
+    # fetched from the server at a time. connectable is an Engine, a Connection or a Session.
+    if output not in ('pandas', 'arrow'):
+        raise ValueError(f"Unknown output '{output}', expected 'pandas' or 'arrow'.")
+    if output == 'arrow' and pa is None:
+        raise ImportError("output='arrow' needs pyarrow.")
+
+    statement = text(query) if isinstance(query, str) else query
+    with _connection(connectable) as connection:
+        # stream_results uses a psycopg2 named cursor; max_row_buffer caps the rows fetched per round trip
+        result = connection.execution_options(stream_results=True, max_row_buffer=chunk_size) \
+            .execute(statement, params or {})
+        columns = list(result.keys())
+        for rows in result.partitions(chunk_size):
+            if output == 'arrow':
+                yield pa.RecordBatch.from_arrays([pa.array(values) for values in zip(*rows)], names=columns)
+            else:
+                yield pd.DataFrame(rows, columns=columns)
+
+
+def _connection(connectable):
+    if isinstance(connectable, Engine):
+        return connectable.connect()
+    if isinstance(connectable, Session):
+        return nullcontext(connectable.connection())
+    return nullcontext(connectable)
+
+
+def reduce_chunks(chunks, reducer, initial=None):
+    # Folds reducer(accumulated, chunk) over the chunks, e.g. to update running totals or fit a model
+    # incrementally (partial_fit) without holding all rows at once
+    accumulated = initial
+    for chunk in chunks:
+        accumulated = reducer(accumulated, chunk)
+    return accumulated
+
+
+def aggregate_chunks(chunks, by, aggregations):
+    # Grouped aggregates over a stream of chunks, e.g. by=['store_nbr', 'year'],
+    # aggregations={'sale_amount': 'sum', 'onpromotion': 'mean'}. Each chunk is reduced to one row per
+    # group and merged into the running result, so memory grows with the groups, not the rows.
+    # Supports sum, count, min, max and mean.
+    by = [by] if isinstance(by, str) else list(by)
+    partial_columns = {}
+    for column, how in aggregations.items():
+        for part in (['sum', 'count'] if how == 'mean' else [how]):
+            if part not in PARTIAL_AGGREGATES:
+                raise ValueError(f"Cannot aggregate '{column}' by '{how}' over chunks.")
+            partial_columns[f'{column}_{part}'] = (column, part)
+    combine = {name: PARTIAL_AGGREGATES[part][1] for name, (column, part) in partial_columns.items()}
+
+    partials = None
+    for chunk in chunks:
+        if pa is not None and isinstance(chunk, pa.RecordBatch):
+            chunk = chunk.to_pandas()
+        partial = chunk.groupby(by, dropna=False).agg(
+            **{name: (column, PARTIAL_AGGREGATES[part][0]) for name, (column, part) in partial_columns.items()})
+        if partials is not None:
+            partial = pd.concat([partials, partial]).groupby(level=by, dropna=False).agg(combine)
+        partials = partial
+
+    if partials is None:
+        return pd.DataFrame(columns=by + list(aggregations))
+
+    result = pd.DataFrame(index=partials.index)
+    for column, how in aggregations.items():
+        if how == 'mean':
+            result[column] = partials[f'{column}_sum'] / partials[f'{column}_count']
+        else:
+            result[column] = partials[f'{column}_{how}']
+    return result.reset_index()
+
+
+def fast_fetch(connectable, query, params=None, output='pandas', fallback=True):
+    # Reads a whole result through COPY (query) TO STDOUT and parses the CSV in one pass into a
+    # typed DataFrame (or pyarrow Table), skipping the per-row Python tuples of fetchall. Used for
+    # large analytical reads on psycopg2. DuckDB connections hand over their columnar result directly;
+    # other drivers, and queries COPY cannot run, take the regular execute/fetchall path, which returns
+    # the same column types.
+    if output not in ('pandas', 'arrow'):
+        raise ValueError(f"Unknown output '{output}', expected 'pandas' or 'arrow'.")
+    if output == 'arrow' and pa is None:
+        raise ImportError("output='arrow' needs pyarrow.")
+
+    statement = text(query) if isinstance(query, str) else query
+    with _connection(connectable) as connection:
+        if connection.dialect.name == 'duckdb':
+            return _duckdb_fetch(connection, statement, params, output)
+        if connection.dialect.driver == 'psycopg2':
+            try:
+                # A savepoint keeps the caller's transaction usable if COPY fails
+                with connection.begin_nested():
+                    return _copy_fetch(connection, statement, params, output)
+            except Exception as e:
+                if not fallback:
+                    raise
+                print(f"COPY fetch failed ({type(e).__name__}: {e}), using the regular fetch path.")
+        return _execute_fetch(connection, statement, params, output)
+
+
+def _copy_fetch(connection, statement, params, output):
+    compiled = statement.compile(dialect=connection.dialect)
+    cursor = connection.connection.cursor()
+    try:
+        # COPY takes no bind parameters, so they are inlined by the driver's own quoting
+        sql = cursor.mogrify(compiled.string, compiled.construct_params(params)).decode()
+        # Column names and types, from the planner only
+        cursor.execute(f'SELECT * FROM ({sql}) AS fast_fetch LIMIT 0')
+        description = cursor.description
+
+        buffer = io.BytesIO()
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv, NULL '{COPY_NULL}')", buffer)
+        buffer.seek(0)
+    finally:
+        cursor.close()
+
+    names = [column.name for column in description]
+    if output == 'arrow':
+        return _read_arrow(buffer, names, description)
+    return _read_frame(buffer, names, description)
+
+
+def _duckdb_fetch(connection, statement, params, output):
+    compiled = statement.compile(dialect=connection.dialect)
+    bound = compiled.construct_params(params)
+    # duckdb_engine compiles to positional $1, $2, ... parameters
+    arguments = [bound[name] for name in compiled.positiontup] if compiled.positiontup else None
+    result = connection.connection.dbapi_connection.execute(compiled.string, arguments)
+    return result.fetch_arrow_table() if output == 'arrow' else result.df()
+
+
+def _read_frame(buffer, names, description):
+    dtypes = {}
+    # Only COPY's NULL marker is missing, so empty and 'NA' strings stay strings; float NaN is read as NaN
+    na_values = {}
+    for column in description:
+        na_values[column.name] = [COPY_NULL]
+        if column.type_code in TEXT_TYPES or column.type_code == BOOLEAN_TYPE:
+            dtypes[column.name] = object
+        elif column.type_code in FLOAT_TYPES:
+            dtypes[column.name] = 'float64'
+            na_values[column.name].append('NaN')
+    frame = pd.read_csv(buffer, header=None, names=names, dtype=dtypes, na_values=na_values,
+                        keep_default_na=False)
+    for column in description:
+        if column.type_code == BOOLEAN_TYPE:
+            frame[column.name] = frame[column.name].map({'t': True, 'f': False})
+    return _parse_dates(frame, description)
+
+
+def _read_arrow(buffer, names, description):
+    column_types = {}
+    for column in description:
+        if column.type_code in TEXT_TYPES:
+            column_types[column.name] = pa.string()
+        elif column.type_code == BOOLEAN_TYPE:
+            column_types[column.name] = pa.bool_()
+        elif column.type_code in FLOAT_TYPES:
+            column_types[column.name] = pa.float64()
+        elif DATE_TYPES.get(column.type_code) == 'date':
+            column_types[column.name] = pa.date32()
+    if not buffer.getbuffer().nbytes:
+        # pyarrow rejects an empty CSV; no rows, so the other columns' types are unknown
+        return pa.table({name: pa.array([], type=column_types.get(name, pa.null())) for name in names})
+    # Float columns parse NaN and Infinity themselves, so only COPY's NULL marker is null; a 'NaN' text value
+    # stays a string
+    return pa_csv.read_csv(
+        buffer,
+        read_options=pa_csv.ReadOptions(column_names=names),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types, null_values=[COPY_NULL],
+                                              strings_can_be_null=True, true_values=['t'], false_values=['f'])
+    )
+
+
+def _execute_fetch(connection, statement, params, output):
+    result = connection.execute(statement, params or {})
+    frame = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    description = getattr(result.cursor, 'description', None) if result.cursor is not None else None
+    if description and connection.dialect.driver == 'psycopg2':
+        frame = _parse_dates(frame, description)
+    return pa.Table.from_pandas(frame, preserve_index=False) if output == 'arrow' else frame
+
+
+def _parse_dates(frame, description):
+    for column in description:
+        if column.type_code in DATE_TYPES:
+            frame[column.name] = pd.to_datetime(frame[column.name], utc=DATE_TYPES[column.type_code] == 'timestamptz')
+    return frame
@@ -0,0 +1,100 @@
+from datetime import date
+from sqlalchemy import select, delete, insert, func, tuple_
+
+# Rollup tables of aggregate_sales, finest grain first. Each level is rebuilt from the level it is
+# derived from, so a refresh reads aggregate_sales once, for the refreshed dates only:
+#
+#   aggregate_sales -> rollup_sales_daily (date x store x family) -> rollup_sales_monthly (month x store x family)
+#                                                                 -> rollup_sales_year_store, rollup_sales_year_family
+#                   -> rollup_sales_daily_total (from rollup_sales_daily)
+ROLLUP_TABLES = ['rollup_sales_daily', 'rollup_sales_monthly', 'rollup_sales_year_store', 'rollup_sales_year_family',
+                 'rollup_sales_daily_total']
+
+
+class SalesRollups:
+    def __init__(self, model):
+        self.model = model
+
+    def available(self):
+        return all(getattr(self.model, name) is not None for name in ROLLUP_TABLES)
+
+    def is_empty(self, connection):
+        return connection.execute(select(self.model.rollup_sales_daily.c.date).limit(1)).scalar() is None
+
+    def source_range(self, connection):
+        aggregate = self.model.aggregate_sales
+        return connection.execute(select(func.min(aggregate.c.date), func.max(aggregate.c.date))).one()
+
+    def refresh(self, connection, first_date, last_date):
+        # Replaces the rollup rows for first_date..last_date at the daily grain, the months and years those
+        # dates fall in at the coarser grains. Deleting and re-aggregating (rather than adding the new
+        # rows' sums) keeps a refresh idempotent when rows were skipped as duplicates or updated in place.
+        first_month = date(first_date.year, first_date.month, 1)
+        next_month = date(last_date.year + last_date.month // 12, last_date.month % 12 + 1, 1)
+        months = ((first_date.year, first_date.month), (last_date.year, last_date.month))
+        years = (first_date.year, last_date.year)
+
+        row_counts = {}
+        for table, condition, source in [
+            (self.model.rollup_sales_daily, lambda table: table.c.date.between(first_date, last_date),
+             self._daily(first_date, last_date)),
+            (self.model.rollup_sales_monthly, lambda table: tuple_(table.c.year, table.c.month).between(*months),
+             self._monthly(first_month, next_month)),
+            (self.model.rollup_sales_year_store, lambda table: table.c.year.between(*years),
+             self._yearly('store_nbr', years)),
+            (self.model.rollup_sales_year_family, lambda table: table.c.year.between(*years),
+             self._yearly('family_id', years)),
+            (self.model.rollup_sales_daily_total, lambda table: table.c.date.between(first_date, last_date),
+             self._daily_total(first_date, last_date))
+        ]:
+            connection.execute(delete(table).where(condition(table)))
+            columns = [column.name for column in source.selected_columns]
+            row_counts[table.name] = connection.execute(insert(table).from_select(columns, source)).rowcount
+        return row_counts
+
+    def _daily(self, first_date, last_date):
+        aggregate = self.model.aggregate_sales
+        return select(
+            aggregate.c.date, aggregate.c.year, aggregate.c.month, aggregate.c.store_nbr, aggregate.c.family_id,
+            func.sum(aggregate.c.sale_amount).label('sale_amount'),
+            func.sum(aggregate.c.onpromotion).label('onpromotion')
+        ).where(
+            aggregate.c.date.between(first_date, last_date),
+            # Redundant with the date range, but lets a year-partitioned aggregate_sales prune partitions
+            aggregate.c.year.between(first_date.year, last_date.year)
+        ).group_by(aggregate.c.date, aggregate.c.year, aggregate.c.month, aggregate.c.store_nbr,
+                   aggregate.c.family_id)
+
+    def _monthly(self, first_month, next_month):
+        daily = self.model.rollup_sales_daily
+        return select(
+            daily.c.year, daily.c.month, daily.c.store_nbr, daily.c.family_id,
+            func.sum(daily.c.sale_amount).label('sale_amount'),
+            func.sum(daily.c.onpromotion).label('onpromotion')
+        ).where(
+            daily.c.date >= first_month, daily.c.date < next_month
+        ).group_by(daily.c.year, daily.c.month, daily.c.store_nbr, daily.c.family_id)
+
+    def _yearly(self, key, years):
+        monthly = self.model.rollup_sales_monthly
+        columns = [monthly.c.year, monthly.c[key]]
+        query = select(
+            *columns,
+            func.sum(monthly.c.sale_amount).label('sale_amount'),
+            func.sum(monthly.c.onpromotion).label('onpromotion')
+        ).where(monthly.c.year.between(*years)).group_by(*columns)
+
+        if key == 'family_id':
+            family = self.model.dim_product_family
+            query = query.add_columns(family.c.family.label('family_name')) \
+                .outerjoin(family, family.c.family_id == monthly.c.family_id) \
+                .group_by(family.c.family)
+        return query
+
+    def _daily_total(self, first_date, last_date):
+        daily = self.model.rollup_sales_daily
+        return select(
+            daily.c.date, daily.c.year, daily.c.month,
+            func.sum(daily.c.sale_amount).label('sale_amount'),
+            func.sum(daily.c.onpromotion).label('onpromotion')
+        ).where(daily.c.date.between(first_date, last_date)).group_by(daily.c.date, daily.c.year, daily.c.month)
@@ -0,0 +1,131 @@
+import hashlib
+import os
+import pickle
+import stat
+import threading
+import sqlalchemy
+from sqlalchemy import MetaData, text
+from atomicFile import write_pickle
+
+# Reflected schema metadata, pickled to a local file keyed by a fingerprint of the schema. Reflecting
+# every table (and, on a partitioned schema, every partition) takes seconds; the fingerprint is two
+# catalog queries, so a process started against an unchanged schema loads the pickle instead.
+# Within a process, every caller for the same database and schema gets the same MetaData object.
+# The cache directory is SCHEMA_CACHE_DIR (an empty value turns the file cache off), by default one in
+# the user's cache directory. Unpickling runs code, so the directory is created private (0700) and a
+# directory or file that another user owns or could write is never read.
+DEFAULT_CACHE_DIR = os.path.join(os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'),
+                                 'genai', 'schema_cache')
+
+FINGERPRINT_QUERIES = [
+    # Columns of every table and partition
+    """
+    SELECT table_name, column_name, data_type, ordinal_position, is_nullable, column_default
+    FROM information_schema.columns
+    WHERE table_schema = current_schema()
+    ORDER BY table_name, ordinal_position
+    """,
+    # Keys and unique constraints, which the ETL uses as conflict targets
+    """
+    SELECT constraints.table_name, constraints.constraint_name, constraints.constraint_type,
+           key_columns.column_name, key_columns.ordinal_position
+    FROM information_schema.table_constraints constraints
+    LEFT JOIN information_schema.key_column_usage key_columns
+        USING (constraint_schema, constraint_name, table_name)
+    WHERE constraints.table_schema = current_schema()
+    ORDER BY constraints.table_name, constraints.constraint_name, key_columns.ordinal_position
+    """
+]
+
+_lock = threading.Lock()
+_loaded = {}  # (database, fingerprint) -> MetaData
+
+
+def schema_fingerprint(connection):
+    digest = hashlib.sha256(sqlalchemy.__version__.encode())
+    for query in FINGERPRINT_QUERIES:
+        for row in connection.execute(text(query)):
+            digest.update(repr(tuple(row)).encode())
+    return digest.hexdigest()[:32]
+
+
+def load_metadata(engine, cache_dir=None):
+    # Reflected MetaData for the engine's database. Only PostgreSQL schemas are fingerprinted,
+    # other databases are always reflected.
+    if engine.dialect.name != 'postgresql':
+        return _reflect(engine)
+    if cache_dir is None:
+        cache_dir = os.getenv('SCHEMA_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+    database = engine.url.render_as_string(hide_password=True)
+    with engine.connect() as connection:
+        fingerprint = schema_fingerprint(connection)
+
+    with _lock:
+        metadata = _loaded.get((database, fingerprint))
+        if metadata is None:
+            metadata = _read_cache(cache_dir, database, fingerprint)
+        if metadata is None:
+            metadata = _reflect(engine)
+            _write_cache(cache_dir, database, fingerprint, metadata)
+        _loaded[(database, fingerprint)] = metadata
+    return metadata
+
+
+def _reflect(engine):
+    metadata = MetaData()
+    metadata.reflect(bind=engine)
+    return metadata
+
+
+def _database_key(database):
+    return hashlib.sha256(database.encode()).hexdigest()[:16]
+
+
+def _cache_path(cache_dir, database, fingerprint):
+    return os.path.join(cache_dir, f'{_database_key(database)}-{fingerprint}.pickle')
+
+
+def _trusted(path):
+    # Owned by this user and not writable by group or others; no such check where there are no uids
+    if not hasattr(os, 'getuid'):
+        return True
+    status = os.stat(path)
+    return status.st_uid == os.getuid() and not status.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _read_cache(cache_dir, database, fingerprint):
+    if not cache_dir:
+        return None
+    path = _cache_path(cache_dir, database, fingerprint)
+    if not os.path.exists(path):
+        return None
+    if not (_trusted(cache_dir) and _trusted(path)):
+        print(f"Ignoring schema cache {path}: it or its directory is owned or writable by another user.")
+        return None
+    try:
+        with open(path, 'rb') as cache_file:
+            return pickle.load(cache_file)
+    except Exception as e:
+        # A truncated or incompatible file is replaced by a fresh reflection
+        print(f"Ignoring unreadable schema cache {path}: {e}")
+        return None
+
+
+def _write_cache(cache_dir, database, fingerprint, metadata):
+    if not cache_dir:
+        return
+    path = _cache_path(cache_dir, database, fingerprint)
+    try:
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+        if not _trusted(cache_dir):
+            print(f"Not writing schema cache to {cache_dir}: it is owned or writable by another user.")
+            return
+        write_pickle(path, metadata)
+
+        # Files of earlier schema versions of this database are not needed any more
+        for name in os.listdir(cache_dir):
+            if name.startswith(f'{_database_key(database)}-') and name != os.path.basename(path):
+                os.remove(os.path.join(cache_dir, name))
+    except OSError as e:
+        print(f"Could not write schema cache {path}: {e}")
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+import pandas as pd
+from atomicFile import atomic_write, discard, temporary_path, write_json
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # pyarrow is optional; without it the cache falls back to plain CSV reads
+    pa = None
+    feather = None
+
+
+def file_checksum(path, block_size=1 << 20):
+    digest = hashlib.md5()
+    with open(path, 'rb') as source:
+        for block in iter(lambda: source.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StagingCache:
+    def __init__(self, cache_dir='Data/.staging'):
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.enabled = feather is not None
+        self.lock = threading.Lock()
+
+        if self.enabled:
+            os.makedirs(cache_dir, exist_ok=True)
+        else:
+            print("pyarrow is not installed, staging cache disabled.")
+
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as manifest_file:
+                return json.load(manifest_file)
+        return {'sources': {}, 'frames': {}}
+
+    def _update_manifest(self, section, name, value):
+        with self.lock:
+            self.manifest[section][name] = value
+            if not self.enabled:
+                return
+            write_json(self.manifest_path, self.manifest)
+
+    def source_key(self, path):
+        # Size and mtime are checked first; the content hash is only recomputed when either changes
+        stat = os.stat(path)
+        entry = self.manifest['sources'].get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            return entry['hash']
+
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'hash': file_checksum(path)}
+        self._update_manifest('sources', path, entry)
+        return entry['hash']
+
+    def _frame_path(self, name):
+        return os.path.join(self.cache_dir, f'{name}.arrow')
+
+    def save_frame(self, name, data_frame, key):
+        if not self.enabled:
+            return
+
+        self.write_frame(name, data_frame)
+        self.record_frame(name, key)
+
+    def write_frame(self, name, data_frame):
+        # Uncompressed Arrow IPC files can be memory-mapped and read without copying the buffers
+        frame = data_frame.reset_index(drop=True)
+        atomic_write(self._frame_path(name),
+                     lambda temporary_path: feather.write_feather(frame, temporary_path, compression='uncompressed'))
+
+    def record_frame(self, name, key):
+        # Worker processes only write frames; the parent records them, since each process
+        # holds its own copy of the manifest
+        self._update_manifest('frames', name, key)
+
+    def load_frame(self, name, key):
+        if not self.enabled or self.manifest['frames'].get(name) != key:
+            return None
+
+        path = self._frame_path(name)
+        if not os.path.exists(path):
+            return None
+
+        table = feather.read_table(path, memory_map=True)
+        return table.to_pandas(split_blocks=True, self_destruct=True)
+
+    def read_csv(self, path, **read_csv_kwargs):
+        if not self.enabled:
+            return pd.read_csv(path, **read_csv_kwargs)
+
+        name, key = self._staged_source(path, read_csv_kwargs)
+        data_frame = self.load_frame(name, key)
+        if data_frame is None:
+            print(f"\nStaging {path} as Arrow\n")
+            data_frame = pd.read_csv(path, **read_csv_kwargs)
+            self.save_frame(name, data_frame, key)
+        return data_frame
+
+    def iter_csv_chunks(self, path, chunk_size, **read_csv_kwargs):
+        if not self.enabled:
+            yield from pd.read_csv(path, chunksize=chunk_size, **read_csv_kwargs)
+            return
+
+        name, key = self._staged_source(path, dict(read_csv_kwargs, chunksize=chunk_size))
+        staged_path = self._frame_path(name)
+        dtypes = read_csv_kwargs.get('dtype') or {}
+
+        if self.manifest['frames'].get(name) == key and os.path.exists(staged_path):
+            with pa.memory_map(staged_path) as source:
+                reader = pa.ipc.open_file(source)
+                for batch_index in range(reader.num_record_batches):
+                    yield reader.get_batch(batch_index).to_pandas().astype(dtypes)
+            return
+
+        # First pass: stream the CSV and write each chunk as an Arrow record batch as it goes.
+        # Categoricals are written as plain strings, since each chunk has its own categories.
+        # The file is renamed into place once every chunk is written (see atomicFile.py).
+        print(f"\nStaging {path} as Arrow\n")
+        writer = None
+        temporary = temporary_path(staged_path)
+        try:
+            for chunk in pd.read_csv(path, chunksize=chunk_size, **read_csv_kwargs):
+                batch = pa.RecordBatch.from_pandas(
+                    chunk.astype({column: 'object' for column, dtype in dtypes.items() if dtype == 'category'}),
+                    preserve_index=False
+                )
+                if writer is None:
+                    writer = pa.ipc.new_file(temporary, batch.schema)
+                writer.write_batch(batch)
+                yield chunk
+            if writer is not None:
+                writer.close()
+                writer = None
+                os.replace(temporary, staged_path)
+        finally:
+            if writer is not None:
+                writer.close()
+                discard(temporary)
+
+        self._update_manifest('frames', name, key)
+
+    def _staged_source(self, path, read_csv_kwargs):
+        # The staged copy depends on the file contents and on how it was parsed
+        options = json.dumps(read_csv_kwargs, sort_keys=True, default=str)
+        key = hashlib.md5(f'{self.source_key(path)}:{options}'.encode()).hexdigest()
+        name = f"source_{os.path.splitext(os.path.basename(path))[0]}_{hashlib.md5(options.encode()).hexdigest()[:8]}"
+        return name, key
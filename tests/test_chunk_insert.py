@@ -0,0 +1,133 @@
+import datetime
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, MetaData, Table, Column, Integer, Float, Date, Boolean, String, select, \
+    UniqueConstraint
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from etl import ETL, frame_hash
+
+
+def make_table(engine):
+    metadata = MetaData()
+    table = Table('chunk_target', metadata,
+                  Column('id', Integer), Column('date', Date), Column('sales', Float),
+                  Column('is_weekend', Boolean), Column('family', String),
+                  UniqueConstraint('id'))
+    metadata.create_all(engine)
+    return table
+
+
+@pytest.fixture
+def engine():
+    # Named parameters, like psycopg2's pyformat, so the prepared statement runs unchanged on SQLite
+    return create_engine('sqlite://', paramstyle='named')
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        'id': [1, 2, 3, 4, 5],
+        'date': [datetime.date(2017, 1, day) for day in range(1, 6)],
+        'sales': [1.5, None, 2.0, 0.0, 7.25],
+        'is_weekend': [False, False, True, True, False],
+        'family': ['A', None, 'B', 'A', 'C']
+    })
+
+
+def make_etl():
+    etl = ETL(None)
+    etl.model = SimpleNamespace(etl_checkpoint=None)
+    return etl
+
+
+def rows(engine, table):
+    with engine.connect() as connection:
+        return connection.execute(select(table).order_by(table.c.id)).fetchall()
+
+
+def test_prepared_chunk_writes_what_execute_wrote(engine, frame):
+    table = make_table(engine)
+    old_engine = create_engine('sqlite://', paramstyle='named')
+    old_table = make_table(old_engine)
+
+    # The original path: Connection.execute on the ON CONFLICT DO NOTHING insert
+    with old_engine.begin() as connection:
+        connection.execute(pg_insert(old_table).values(frame.to_dict(orient='records')).on_conflict_do_nothing(
+            index_elements=['id']))
+
+    with engine.begin() as connection:
+        start_row, end_row, content_hash, prepared = make_etl()._prepare_chunk(
+            table, frame, (0, len(frame)), 0, ['id'], connection.dialect)
+        connection.exec_driver_sql(*prepared)
+
+    assert (start_row, end_row, content_hash) == (0, 5, frame_hash(frame))
+    assert rows(engine, table) == rows(old_engine, old_table)
+
+
+def test_committed_chunks_are_skipped(engine, frame):
+    table = make_table(engine)
+    etl = make_etl()
+    # A previous run committed rows 0-2; rows 2-4 were committed with different content
+    etl.committed_chunks = {
+        ('chunk_target', 0, 2): frame_hash(frame.iloc[0:2]),
+        ('chunk_target', 2, 4): 'stale'
+    }
+
+    with engine.connect() as connection:
+        assert etl._prepare_chunk(table, frame, (0, 2), 0, None, connection.dialect)[3] is None
+        assert etl._prepare_chunk(table, frame, (2, 4), 0, None, connection.dialect)[3] is not None
+        etl._insert_chunked(connection, table, frame, chunk_size=2)
+
+    assert [row.id for row in rows(engine, table)] == [3, 4, 5]
+
+
+def test_row_offset_keys_checkpoints_by_table_row(engine, frame):
+    table = make_table(engine)
+    etl = make_etl()
+    # A streamed frame starting at row 10 of the table: its first chunk covers table rows 10-12
+    etl.committed_chunks = {('chunk_target', 10, 12): frame_hash(frame.iloc[0:2])}
+
+    with engine.connect() as connection:
+        start_row, end_row, _, prepared = etl._prepare_chunk(table, frame, (0, 2), 10, None, connection.dialect)
+    assert (start_row, end_row, prepared) == (10, 12, None)
+
+
+@pytest.mark.parametrize('pipeline_workers, queue_depth', [(1, 1), (2, 2), (3, 8)])
+def test_pipeline_matches_serial_writes(engine, frame, pipeline_workers, queue_depth):
+    serial_engine = create_engine('sqlite://', paramstyle='named')
+    serial_table = make_table(serial_engine)
+    with serial_engine.connect() as connection:
+        make_etl()._insert_chunked(connection, serial_table, frame, chunk_size=2)
+
+    table = make_table(engine)
+    etl = make_etl()
+    etl.pipeline_workers, etl.queue_depth = pipeline_workers, queue_depth
+    with engine.connect() as connection:
+        etl._insert_chunked(connection, table, frame, chunk_size=2)
+
+    assert rows(engine, table) == rows(serial_engine, serial_table)
+
+
+def test_pipeline_yields_chunks_in_order():
+    etl = make_etl()
+    etl.pipeline_workers, etl.queue_depth = 4, 2
+    chunk_ranges = [(start, start + 1) for start in range(20)]
+    assert list(etl._iter_prepared_chunks(lambda chunk_range: chunk_range, chunk_ranges)) == chunk_ranges
+
+
+def test_pipeline_raises_the_failed_chunk_error():
+    def prepare(chunk_range):
+        if chunk_range[0] == 3:
+            raise ValueError('bad chunk')
+        return chunk_range
+
+    etl = make_etl()
+    etl.pipeline_workers, etl.queue_depth = 2, 2
+    prepared = []
+    with pytest.raises(ValueError, match='bad chunk'):
+        for chunk in etl._iter_prepared_chunks(prepare, [(start, start + 1) for start in range(10)]):
+            prepared.append(chunk)
+    assert prepared == [(0, 1), (1, 2), (2, 3)]
@@ -0,0 +1,60 @@
+import io
+import math
+from collections import namedtuple
+
+import pandas as pd
+import pytest
+
+from queryStream import _read_frame, _read_arrow
+
+# cursor.description entries: name and PostgreSQL type OID
+Column = namedtuple('Column', ['name', 'type_code'])
+DESCRIPTION = [Column('id', 23), Column('label', 25), Column('flag', 16), Column('amount', 701),
+               Column('day', 1082)]
+NAMES = [column.name for column in DESCRIPTION]
+
+# COPY ... TO STDOUT WITH (FORMAT csv, NULL '\N') output: quoted commas and quotes, NULLs, empty and
+# 'NA'/'NaN' strings, float NaN and Infinity
+COPY_OUTPUT = (
+    b'1,"a,b",t,\\N,2017-01-02\n'
+    b'2,"say ""hi""",f,NaN,\\N\n'
+    b'3,,\\N,Infinity,2017-01-03\n'
+    b'4,NA,t,-1.5,2017-01-04\n'
+    b'5,NaN,f,1e3,2017-01-05\n'
+)
+
+
+def test_read_frame():
+    frame = _read_frame(io.BytesIO(COPY_OUTPUT), NAMES, DESCRIPTION)
+    assert frame['id'].tolist() == [1, 2, 3, 4, 5]
+    assert frame['label'].tolist() == ['a,b', 'say "hi"', '', 'NA', 'NaN']
+    assert frame['flag'].tolist()[:2] == [True, False] and pd.isna(frame['flag'][2])
+    assert frame['amount'].isna().tolist() == [True, True, False, False, False]
+    assert math.isinf(frame['amount'][2]) and frame['amount'][4] == 1000.0
+    assert pd.api.types.is_datetime64_any_dtype(frame['day'])
+    assert pd.isna(frame['day'][1]) and frame['day'][0] == pd.Timestamp('2017-01-02')
+
+
+def test_read_arrow():
+    pytest.importorskip('pyarrow')
+    table = _read_arrow(io.BytesIO(COPY_OUTPUT), NAMES, DESCRIPTION).to_pydict()
+    assert table['label'] == ['a,b', 'say "hi"', '', 'NA', 'NaN']
+    assert table['flag'] == [True, False, None, True, False]
+    assert table['amount'][0] is None and math.isnan(table['amount'][1]) and math.isinf(table['amount'][2])
+    assert table['day'][1] is None and str(table['day'][0]) == '2017-01-02'
+
+
+def test_empty_result():
+    frame = _read_frame(io.BytesIO(b''), NAMES, DESCRIPTION)
+    assert frame.empty and list(frame.columns) == NAMES
+
+    pa = pytest.importorskip('pyarrow')
+    table = _read_arrow(io.BytesIO(b''), NAMES, DESCRIPTION)
+    assert table.num_rows == 0 and table.column_names == NAMES
+    assert table.schema.field('amount').type == pa.float64()
+
+
+def test_timestamptz_is_utc():
+    description = [Column('loaded_at', 1184)]
+    frame = _read_frame(io.BytesIO(b'2017-01-02 10:00:00+02\n'), ['loaded_at'], description)
+    assert frame['loaded_at'][0] == pd.Timestamp('2017-01-02 08:00:00', tz='UTC')
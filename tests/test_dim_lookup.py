@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from dimLookup import KeyDomain, DimensionLookup
+
+
+def test_integer_keys_are_dense_offsets():
+    domain = KeyDomain(pd.Series([12, 10, 11]))
+    assert domain.index is None
+    assert (domain.offset, domain.size) == (10, 3)
+
+    codes, valid = domain.codes(pd.Series([10, 12, 13, 9]))
+    assert codes[:2].tolist() == [0, 2]
+    assert valid.tolist() == [True, True, False, False]
+
+
+def test_null_keys_are_invalid():
+    domain = KeyDomain(pd.Series([1, None, 3], dtype='Int64'))
+    assert (domain.offset, domain.size) == (1, 3)
+
+    # Float keys (an integer column that picked up NaN) and nullable integers
+    assert domain.codes(pd.Series([1.0, np.nan, 3.0]))[1].tolist() == [True, False, True]
+    assert domain.codes(pd.Series([pd.NA, 2], dtype='Int64'))[1].tolist() == [False, True]
+
+
+def test_string_and_categorical_keys():
+    domain = KeyDomain(pd.Series(['b', 'a', None, 'b']))
+    assert domain.index is not None and domain.size == 2
+
+    codes, valid = domain.codes(pd.Series(['a', None, 'z', 'b']))
+    assert valid.tolist() == [True, False, False, True]
+    categorical = domain.codes(pd.Series(['a', None, 'z', 'b'], dtype='category'))
+    assert categorical[0][categorical[1]].tolist() == codes[valid].tolist()
+    assert categorical[1].tolist() == valid.tolist()
+
+
+def test_date_keys_are_day_numbers():
+    domain = KeyDomain(pd.Series(pd.to_datetime(['2017-01-01', '2017-01-03'])))
+    assert domain.index is None and domain.size == 3
+
+    codes, valid = domain.codes(pd.Series(pd.to_datetime(['2017-01-02', None, '2017-02-01'])))
+    assert codes[0] == 1
+    assert valid.tolist() == [True, False, False]
+
+
+def test_empty_domain_matches_nothing():
+    domain = KeyDomain(pd.Series([], dtype='int64'))
+    assert domain.size == 0
+    assert not domain.codes(pd.Series([0, 1]))[1].any()
+
+    lookup = DimensionLookup(pd.DataFrame({'family_id': pd.Series([], dtype='int64'), 'family': []}), 'family_id')
+    assert lookup.positions(pd.DataFrame({'family_id': [0, 1]})).tolist() == [-1, -1]
+
+
+def test_lookup_matches_a_left_merge():
+    stores = pd.DataFrame({'store_nbr': [1, 2, 4], 'city': ['Quito', 'Quito', 'Cuenca'], 'cluster': [13, 13, 2]})
+    sales = pd.DataFrame({'store_nbr': [4, 1, 3, 4, None]})
+
+    lookup = DimensionLookup(stores, 'store_nbr')
+    assert lookup.positions(sales).tolist() == [2, 0, -1, 2, -1]
+
+    expected = sales.merge(stores, on='store_nbr', how='left')
+    result = lookup.assign(sales.copy())
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+def test_composite_keys():
+    holidays = pd.DataFrame({'date': pd.to_datetime(['2017-01-01', '2017-01-01', '2017-01-02']),
+                             'locale_name': ['Ecuador', 'Quito', 'Ecuador'], 'type': ['Holiday', 'Event', 'Bridge']})
+    lookup = DimensionLookup(holidays, ['date', 'locale_name'])
+    facts = pd.DataFrame({'date': pd.to_datetime(['2017-01-01', '2017-01-02', '2017-01-02']),
+                          'locale_name': ['Quito', 'Ecuador', 'Quito']})
+    assert lookup.take('type', lookup.positions(facts)).tolist()[:2] == ['Event', 'Bridge']
+    assert pd.isna(lookup.take('type', lookup.positions(facts))[2])
+
+
+def test_duplicate_keys_raise():
+    with pytest.raises(ValueError):
+        DimensionLookup(pd.DataFrame({'family_id': [1, 1], 'family': ['A', 'B']}), 'family_id')
+
+
+def test_empty_fact_frame():
+    lookup = DimensionLookup(pd.DataFrame({'family_id': [1, 2], 'family': ['A', 'B']}), 'family_id')
+    result = lookup.assign(pd.DataFrame({'family_id': pd.Series([], dtype='int64')}))
+    assert result.empty and list(result.columns) == ['family_id', 'family']
@@ -0,0 +1,284 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, insert
+
+from etl import ETL
+from models import Model
+from stagingCache import StagingCache
+
+
+SALES = """id,date,store_nbr,family,sales,onpromotion
+0,2013-01-01,1,GROCERY,10.5,0
+1,2013-01-01,2,GROCERY,3.0,1
+2,2013-01-01,3,BEVERAGES,0.0,0
+3,2013-01-02,1,BEVERAGES,7.25,2
+4,2013-01-02,2,GROCERY,1.0,0
+5,2013-01-02,3,GROCERY,4.5,0
+6,2014-03-05,1,BEVERAGES,2.0,3
+7,2014-03-05,3,BEVERAGES,9.0,0
+8,2013-01-03,1,GROCERY,5.0,0
+9,2013-01-03,2,BEVERAGES,6.5,1
+"""
+
+STORES = """store_nbr,city,state,type,cluster
+1,Quito,Pichincha,D,13
+2,Guayaquil,Guayas,B,6
+3,Cuenca,Azuay,C,2
+"""
+
+OIL = """date,dcoilwtico,year
+2013-01-01,93.1,2013
+2013-01-02,93.2,2013
+"""
+
+# 2013-01-01 has a national and a local holiday; 2013-01-02 only a local (Quito) one and
+# 2014-03-05 only a regional (Azuay) one; 2013-01-03 is not a holiday
+HOLIDAYS = """date,type,locale,locale_name,description,transferred,is_transfered,day_of_week,is_weekend
+2013-01-01,Holiday,National,Ecuador,Primer dia del ano,False,0,1,0
+2013-01-01,Holiday,Local,Guayaquil,Fundacion de Guayaquil,False,0,1,0
+2013-01-02,Holiday,Local,Quito,Fundacion de Quito,False,0,2,0
+2014-03-05,Additional,Regional,Azuay,Independencia de Cuenca,False,0,2,0
+"""
+
+
+@pytest.fixture
+def source_dir(tmp_path):
+    for name, content in [('sales.csv', SALES), ('stores.csv', STORES), ('oil.csv', OIL),
+                          ('holidays.csv', HOLIDAYS)]:
+        (tmp_path / name).write_text(content)
+    return tmp_path
+
+
+def transformed(source_dir, compact=False, allow_float32=False, **settings):
+    etl = ETL(None, data_dir=str(source_dir))
+    for name, value in settings.items():
+        setattr(etl, name, value)
+    etl.load_data(compact=compact, allow_float32=allow_float32)
+    etl.load_dim_products_family()
+    etl.load_dim_store()
+    etl.load_dim_holiday()
+    etl.load_fact_sale()
+    etl.load_aggregate_sales()
+    return etl
+
+
+def plain_values(data_frame):
+    # Categoricals and small integer types compared as the plain object and int64 columns
+    return data_frame.apply(lambda column: column.astype(object) if isinstance(column.dtype, pd.CategoricalDtype)
+                            else column)
+
+
+def test_compact_aggregate_sales_matches_plain(source_dir):
+    plain = transformed(source_dir)
+    compact = transformed(source_dir, compact=True)
+
+    pd.testing.assert_frame_equal(plain_values(compact.aggregate_sales), plain.aggregate_sales, check_dtype=False)
+    assert isinstance(compact.aggregate_sales['family_name'].dtype, pd.CategoricalDtype)
+    before, after = compact.memory_savings['aggregate_sales']
+    assert after < before
+
+
+def test_float32_sale_amount_is_close_to_plain(source_dir):
+    plain = transformed(source_dir)
+    compact = transformed(source_dir, compact=True, allow_float32=True)
+
+    assert compact.aggregate_sales['sale_amount'].dtype == np.float32
+    np.testing.assert_allclose(compact.aggregate_sales['sale_amount'], plain.aggregate_sales['sale_amount'],
+                               rtol=1e-6)
+
+
+def test_compact_array_lookup_matches_plain_merge(source_dir):
+    plain = transformed(source_dir)
+    compact = transformed(source_dir, compact=True, lookup_mode='array')
+
+    pd.testing.assert_frame_equal(plain_values(compact.aggregate_sales), plain.aggregate_sales, check_dtype=False)
+
+
+def holiday_stores(aggregate_sales):
+    holidays = aggregate_sales[aggregate_sales['is_holiday'] == 1]
+    return sorted(zip(holidays['date'].dt.strftime('%Y-%m-%d'), holidays['store_nbr']))
+
+
+def test_date_holiday_join_keeps_the_first_row_of_the_old_fan_out(source_dir):
+    etl = transformed(source_dir)
+    assert len(etl.aggregate_sales) == len(etl.sales)
+
+    # The original join: every holiday on the sale date, one output row per holiday; the ON CONFLICT DO
+    # NOTHING insert then kept the first row written for each sales row
+    sales = etl.fact_sales[['date', 'store_nbr', 'family_id']].reset_index(names='row')
+    sales['date'] = pd.to_datetime(sales['date'])
+    fan_out = sales.merge(etl.dim_holiday[['date', 'type', 'description']], on='date', how='left')
+    assert len(fan_out) > len(sales)
+    first = fan_out.drop_duplicates('row').set_index('row')
+
+    holidays, keys = etl._holiday_lookup()
+    assert keys == ['date']
+    joined = sales.merge(holidays, on='date', how='left').set_index('row')
+    pd.testing.assert_frame_equal(joined[['type', 'description']], first[['type', 'description']])
+    assert (etl.aggregate_sales['is_holiday'].to_numpy() == first['type'].notna().to_numpy()).all()
+
+
+def test_locale_holiday_join_only_matches_the_stores_it_applies_to(source_dir):
+    by_date = transformed(source_dir)
+    by_locale = transformed(source_dir, holiday_match='locale')
+
+    assert len(by_locale.aggregate_sales) == len(by_date.aggregate_sales)
+    assert holiday_stores(by_date.aggregate_sales) == [
+        ('2013-01-01', 1), ('2013-01-01', 2), ('2013-01-01', 3),
+        ('2013-01-02', 1), ('2013-01-02', 2), ('2013-01-02', 3),
+        ('2014-03-05', 1), ('2014-03-05', 3)
+    ]
+    # National: every store; Local (Quito): store 1 only; Regional (Azuay): store 3 only
+    assert holiday_stores(by_locale.aggregate_sales) == [
+        ('2013-01-01', 1), ('2013-01-01', 2), ('2013-01-01', 3),
+        ('2013-01-02', 1),
+        ('2014-03-05', 3)
+    ]
+
+    # Where a national and a local holiday share a date, the national one is kept
+    holidays, keys = by_locale._holiday_lookup()
+    assert keys == ['date', 'store_nbr']
+    assert not holidays.duplicated(keys).any()
+    store_2 = holidays[(holidays['date'] == pd.Timestamp('2013-01-01')) & (holidays['store_nbr'] == 2)]
+    assert store_2['description'].tolist() == ['Primer dia del ano']
+
+
+def test_locale_holiday_join_in_compact_and_array_modes(source_dir):
+    plain = transformed(source_dir, holiday_match='locale')
+    for settings in [{'compact': True}, {'lookup_mode': 'array'}, {'compact': True, 'lookup_mode': 'array'}]:
+        other = transformed(source_dir, holiday_match='locale', **settings)
+        pd.testing.assert_frame_equal(plain_values(other.aggregate_sales), plain.aggregate_sales, check_dtype=False)
+
+
+@pytest.mark.parametrize('partition_by, process_workers, expected', [
+    ('year', 2, {2013: 8, 2014: 2}),
+    ('store', 2, {'1-2': 7, '3-3': 3}),
+    ('store', 8, {'1-1': 4, '2-2': 3, '3-3': 3})
+])
+def test_sales_partitions_cover_every_row_once(source_dir, partition_by, process_workers, expected):
+    etl = ETL(None, data_dir=str(source_dir))
+    etl.partition_by, etl.process_workers = partition_by, process_workers
+    etl.load_data()
+
+    partitions = list(etl._sales_partitions())
+    assert {key: len(partition) for key, partition in partitions} == expected
+    rows = np.concatenate([partition.index.to_numpy() for _, partition in partitions])
+    assert sorted(rows.tolist()) == etl.sales.index.tolist()
+
+
+def test_unknown_partition_by_is_rejected(source_dir):
+    etl = ETL(None, data_dir=str(source_dir))
+    etl.partition_by = 'month'
+    etl.load_data()
+    with pytest.raises(ValueError, match='partition_by'):
+        list(etl._sales_partitions())
+
+
+@pytest.mark.parametrize('partition_by', ['year', 'store'])
+def test_partitioned_transform_matches_whole_frame_transform(source_dir, tmp_path, partition_by):
+    etl = transformed(source_dir)
+    expected_frames = {'fact_sales': etl.fact_sales, 'aggregate_sales': etl.aggregate_sales}
+    etl.staging = StagingCache(str(tmp_path / 'staging'))
+    if not etl.staging.enabled:
+        pytest.skip('the staging cache needs pyarrow')
+    etl.partition_by, etl.process_workers = partition_by, 2
+
+    # Each partition goes through transform_partition as a worker would run it, staged and read back
+    frames = {'fact_sales': [], 'aggregate_sales': []}
+    rows = []
+    for partition_key, partition in list(etl._sales_partitions()):
+        staged_frames, _ = etl.transform_partition(partition_key, partition, 0, 1000, 'staging')
+        for frame_name, staged_name in staged_frames:
+            etl.staging.record_frame(staged_name, 'test')
+            frames[frame_name].append(etl.staging.load_frame(staged_name, 'test'))
+        rows.extend(partition.index)
+
+    for frame_name, partitioned in frames.items():
+        expected = expected_frames[frame_name].iloc[rows].reset_index(drop=True)
+        pd.testing.assert_frame_equal(pd.concat(partitioned, ignore_index=True), expected, check_dtype=False)
+
+
+def original_dim_date(start_year, end_year):
+    # load_dim_date before it was vectorised: one dict per day of the fixed year range
+    current_date = datetime.date(start_year, 1, 1)
+    entries = []
+    while current_date < datetime.date(end_year + 1, 1, 1):
+        entries.append({'date': current_date, 'year': current_date.year, 'month': current_date.month,
+                        'day': current_date.day, 'weekday': current_date.weekday(),
+                        'is_weekend': current_date.weekday() >= 5})
+        current_date += datetime.timedelta(days=1)
+    return pd.DataFrame(entries)
+
+
+def test_dim_date_matches_the_original_loop(source_dir):
+    etl = ETL(None, data_dir=str(source_dir))
+    etl.load_data()
+    etl.load_dim_date(start_date='2013-01-01', end_date='2017-12-31')
+
+    original = original_dim_date(2013, 2017)
+    pd.testing.assert_frame_equal(etl.dim_date[original.columns], original, check_dtype=False)
+
+
+def test_dim_date_calendar_columns(source_dir):
+    etl = ETL(None, data_dir=str(source_dir))
+    etl.load_data()
+    etl.load_dim_date()
+
+    # The range defaults to the dates in sales, oil and holidays
+    assert (etl.dim_date['date'].iloc[0], etl.dim_date['date'].iloc[-1]) == \
+           (datetime.date(2013, 1, 1), datetime.date(2014, 3, 5))
+    holiday_dates = {datetime.date.fromisoformat(day) for day in etl.holidays['date']}
+    for row in etl.dim_date.itertuples():
+        day = row.date
+        assert (row.iso_year, row.iso_week) == tuple(day.isocalendar())[:2]
+        assert row.quarter == (day.month - 1) // 3 + 1
+        assert row.day_of_year == day.timetuple().tm_yday
+        assert row.is_payday == (day.day == 15 or (day + datetime.timedelta(days=1)).day == 1)
+        assert row.is_holiday == (day in holiday_dates)
+
+
+@pytest.fixture
+def dim_date_etl(source_dir):
+    etl = ETL(None, data_dir=str(source_dir))
+    etl.model = Model(create_engine('sqlite://'), reflect=False)
+    etl.model.create_tables()
+    etl.load_data()
+    etl.load_dim_date()
+    return etl
+
+
+def write_dim_date(etl, data_frame):
+    with etl.model.engine.begin() as connection:
+        connection.execute(insert(etl.model.dim_date), data_frame.to_dict(orient='records'))
+
+
+def dates_to_write(etl):
+    with etl.model.engine.connect() as connection:
+        return etl._dates_to_write(connection, etl.dim_date)
+
+
+def test_dates_to_write_on_an_empty_table(dim_date_etl):
+    assert dates_to_write(dim_date_etl) is dim_date_etl.dim_date
+
+
+def test_dates_to_write_are_the_missing_and_changed_dates(dim_date_etl):
+    dim_date = dim_date_etl.dim_date
+    # An earlier load: without the last five days, and from before 2013-01-02 was a holiday
+    existing = dim_date.iloc[:-5].copy()
+    existing.loc[existing['date'] == datetime.date(2013, 1, 2), 'is_holiday'] = False
+    write_dim_date(dim_date_etl, existing)
+
+    changed = dates_to_write(dim_date_etl)
+    assert sorted(changed['date']) == [datetime.date(2013, 1, 2)] + list(dim_date['date'].iloc[-5:])
+
+    # Merging the written rows over the existing ones gives the full calendar
+    merged = pd.concat([existing[~existing['date'].isin(changed['date'])], changed])
+    pd.testing.assert_frame_equal(merged.sort_values('date').reset_index(drop=True), dim_date, check_dtype=False)
+
+
+def test_no_dates_to_write_when_the_table_is_current(dim_date_etl):
+    write_dim_date(dim_date_etl, dim_date_etl.dim_date)
+    assert dates_to_write(dim_date_etl).empty
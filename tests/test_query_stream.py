@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from queryStream import aggregate_chunks, reduce_chunks
+
+
+SALES = pd.DataFrame({
+    'store_nbr': [1, 1, 2, 2, 1, None],
+    'year': [2016, 2017, 2016, 2016, 2017, 2017],
+    'sale_amount': [1.0, 2.0, 4.0, np.nan, 8.0, 16.0],
+    'onpromotion': [0, 1, 1, 0, 3, 2]
+})
+
+
+def chunks(frame, size):
+    return (frame.iloc[start:start + size] for start in range(0, len(frame), size))
+
+
+def test_aggregates_match_one_groupby():
+    aggregations = {'sale_amount': 'sum', 'onpromotion': 'mean'}
+    result = aggregate_chunks(chunks(SALES, 2), ['store_nbr', 'year'], aggregations)
+    expected = SALES.groupby(['store_nbr', 'year'], dropna=False).agg(aggregations).reset_index()
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_count_min_max_skip_nulls():
+    result = aggregate_chunks(chunks(SALES, 4), 'store_nbr',
+                              {'sale_amount': 'count', 'onpromotion': 'max', 'year': 'min'})
+    by_store = result.set_index('store_nbr')
+    assert by_store.loc[2, 'sale_amount'] == 1
+    assert by_store.loc[1, 'onpromotion'] == 3
+    assert by_store.loc[1, 'year'] == 2016
+
+
+def test_null_group_keys_are_kept():
+    result = aggregate_chunks(chunks(SALES, 5), 'store_nbr', {'sale_amount': 'sum'})
+    assert result['store_nbr'].isna().sum() == 1
+    assert result.loc[result['store_nbr'].isna(), 'sale_amount'].item() == 16.0
+
+
+def test_record_batches():
+    pa = pytest.importorskip('pyarrow')
+    batches = (pa.RecordBatch.from_pandas(chunk, preserve_index=False) for chunk in chunks(SALES, 3))
+    result = aggregate_chunks(batches, 'year', {'onpromotion': 'sum'})
+    assert dict(zip(result['year'], result['onpromotion'])) == {2016: 1, 2017: 6}
+
+
+def test_no_chunks():
+    result = aggregate_chunks(iter([]), ['store_nbr'], {'sale_amount': 'sum'})
+    assert result.empty and list(result.columns) == ['store_nbr', 'sale_amount']
+
+
+def test_empty_chunks_are_skipped():
+    empty = SALES.iloc[0:0]
+    result = aggregate_chunks([empty, SALES, empty], 'year', {'sale_amount': 'sum'})
+    assert dict(zip(result['year'], result['sale_amount'])) == {2016: 5.0, 2017: 26.0}
+
+
+def test_unknown_aggregation():
+    with pytest.raises(ValueError):
+        aggregate_chunks(chunks(SALES, 2), 'year', {'sale_amount': 'median'})
+
+
+def test_reduce_chunks():
+    total = reduce_chunks(chunks(SALES, 4), lambda running, chunk: running + chunk['onpromotion'].sum(), 0)
+    assert total == 7
+    assert reduce_chunks(iter([]), lambda running, chunk: running + 1, initial=5) == 5
+    assert reduce_chunks(iter([]), lambda running, chunk: running) is None
@@ -0,0 +1,63 @@
+from queryProfiler import statement_fingerprint, percentile, explainable
+from queryCache import normalise_sql, referenced_tables
+
+
+def test_fingerprint_replaces_literals():
+    first = statement_fingerprint("SELECT * FROM aggregate_sales WHERE year = 2013 AND sale_amount > 0.5 LIMIT 12000")
+    second = statement_fingerprint("SELECT * FROM aggregate_sales WHERE year = 2017 AND sale_amount > 12.25 LIMIT 8000")
+    assert first == second == "SELECT * FROM aggregate_sales WHERE year = ? AND sale_amount > ? LIMIT ?"
+
+
+def test_fingerprint_quoting():
+    # Quoted strings, with doubled quotes inside, become one placeholder; digits inside identifiers stay
+    statement = """SELECT "SalesSum2013" FROM summary_family_sales WHERE family_name = 'BABY ''CARE'', 2'"""
+    assert statement_fingerprint(statement) == 'SELECT "SalesSum2013" FROM summary_family_sales WHERE family_name = ?'
+    assert statement_fingerprint("SELECT ''") == 'SELECT ?'
+
+
+def test_fingerprint_whitespace_and_nulls():
+    statement = """
+        SELECT store_nbr
+        FROM   dim_store
+        WHERE  city IS NULL
+    """
+    assert statement_fingerprint(statement) == 'SELECT store_nbr FROM dim_store WHERE city IS NULL'
+    assert statement_fingerprint('') == ''
+
+
+def test_normalise_sql_keeps_string_literals():
+    assert normalise_sql("SELECT  *\n FROM dim_holiday\n WHERE description = 'Dia  de\tDifuntos';") == \
+        "SELECT * FROM dim_holiday WHERE description = 'Dia  de\tDifuntos'"
+    assert normalise_sql("SELECT 'it''s  here'  AS note") == "SELECT 'it''s  here' AS note"
+    assert normalise_sql('SELECT 1') == normalise_sql(' SELECT   1 ;')
+
+
+def test_referenced_tables():
+    sql = """SELECT s.store_nbr FROM public."aggregate_sales" s
+             JOIN dim_store d ON d.store_nbr = s.store_nbr
+             WHERE s.year IN (SELECT year FROM rollup_sales_year_store)"""
+    assert referenced_tables(sql) == {'aggregate_sales', 'dim_store', 'rollup_sales_year_store'}
+    assert referenced_tables('SELECT * FROM (SELECT 1) AS one') == set()
+
+
+def test_percentile():
+    assert percentile([], 50) is None
+    assert percentile([5.0], 99) == 5.0
+    values = sorted(float(value) for value in range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50.0, 95.0, 99.0)
+
+
+def test_only_plain_reads_are_explained():
+    assert explainable('SELECT store_nbr, SUM(sale_amount) FROM aggregate_sales GROUP BY store_nbr')
+    assert explainable("WITH totals AS (SELECT 1) SELECT * FROM totals WHERE note = 'update; insert into'")
+    assert explainable('SELECT "delete" FROM dim_store')
+    # Data-modifying CTEs, as in ETL._merge_staged, and locking reads
+    assert not explainable('WITH merged AS (INSERT INTO dim_oil (date) SELECT date FROM staging '
+                           'ON CONFLICT (date) DO UPDATE SET price = EXCLUDED.price RETURNING 1) '
+                           'SELECT count(*) FROM merged')
+    assert not explainable('WITH gone AS (DELETE FROM dim_oil RETURNING *) SELECT * FROM gone')
+    assert not explainable('SELECT * FROM etl_watermark FOR UPDATE')
+    assert not explainable('SELECT * FROM etl_watermark FOR NO KEY UPDATE SKIP LOCKED')
+    assert not explainable('select * from etl_watermark for share')
+    assert not explainable('SELECT * INTO backup FROM dim_oil')
+    assert not explainable('UPDATE dim_oil SET price = 0')